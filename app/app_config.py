@@ -1,11 +1,16 @@
-from flask import Flask, redirect, url_for, session
+from flask import Flask, redirect, url_for, session, request, flash
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 
+from app.config import UPLOAD_TAMANHO_MAXIMO, UPLOAD_FOLGA_MULTIPART
+
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
 # Usar configuração mais segura
 app.secret_key = os.environ.get('SECRET_KEY', 'lkj12tu6')
 app.config['DEBUG'] = os.environ.get('DEBUG', 'False').lower() == 'true'
+# Padrão de todas as rotas; as de upload ajustam o seu (global_services.limite_upload)
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_TAMANHO_MAXIMO + UPLOAD_FOLGA_MULTIPART
 
 # Imports dos blueprints
 from app.routes.auth import auth_bp
@@ -29,6 +34,13 @@ app.register_blueprint(balanco_bp)
 
 app.register_blueprint(posicao_advisor_bp)
 
+@app.errorhandler(RequestEntityTooLarge)
+def requisicao_muito_grande(e):
+    # Corpo acima do limite da rota, em rota que lê o formulário antes do upload
+    from app.services.global_services import mensagem_arquivo_grande
+    flash(mensagem_arquivo_grande(), "error")
+    return redirect(request.url)
+
 @app.route('/')
 def index():
     if 'logged_in' in session:
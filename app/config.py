@@ -12,4 +12,37 @@ else:
 
 # Configurações adicionais para produção
 SECRET_KEY = os.environ.get('SECRET_KEY', 'lkj12tu6')  # Use variável de ambiente
-DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
\ No newline at end of file
+DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
+
+# Processar as abas do extrato BTG em processos paralelos (desligado por padrão:
+# nem todo ambiente de hospedagem permite multiprocessing nos workers web)
+BTG_PARSE_PARALELO = os.environ.get('BTG_PARSE_PARALELO', 'False').lower() == 'true'
+
+# Upload de extratos: processados direto do stream da requisição (o Werkzeug guarda o
+# arquivo em memória ou em um temporário anônimo), sem passar por uploads/.
+UPLOAD_TAMANHO_MAXIMO = 16 * 1024 * 1024  # 16MB
+
+# Importação em lote (ZIP com extratos de vários clientes)
+UPLOAD_LOTE_TAMANHO_MAXIMO = 128 * 1024 * 1024  # 128MB
+
+# O corpo da requisição é limitado na leitura (Werkzeug recusa com 413 sem receber o
+# arquivo inteiro): limite do upload da rota (global_services.limite_upload) mais esta
+# folga para os campos e cabeçalhos multipart. Rotas sem upload usam UPLOAD_TAMANHO_MAXIMO.
+UPLOAD_FOLGA_MULTIPART = 1024 * 1024  # 1MB
+
+# Conteúdo de um lote (descompactado): o ZIP é recusado antes de qualquer leitura se
+# passar destes limites (os tamanhos declarados no diretório do ZIP são somados)
+IMPORTACAO_LOTE_MAX_ARQUIVOS = 500
+IMPORTACAO_LOTE_TAMANHO_TOTAL = 1024 * 1024 * 1024  # 1GB
+
+# Processos de parsing na rota web (1 = sem processos filhos, ver BTG_PARSE_PARALELO);
+# a linha de comando usa todos os núcleos por padrão
+IMPORTACAO_LOTE_PROCESSOS = int(os.environ.get('IMPORTACAO_LOTE_PROCESSOS', 1))
+
+# Fundos do Advisor (sem CNPJ) são casados pelo nome normalizado; sem correspondência
+# exata, aceita o fundo cadastrado mais parecido (trigramas) a partir desta similaridade.
+# 1.0 desliga a busca aproximada.
+ADVISOR_LIMIAR_SIMILARIDADE = float(os.environ.get('ADVISOR_LIMIAR_SIMILARIDADE', 0.9))
+
+# Listagens de fundos e clientes: linhas por página (paginação por chave, ver catalogo_service)
+CATALOGO_POR_PAGINA = int(os.environ.get('CATALOGO_POR_PAGINA', 50))
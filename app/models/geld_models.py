@@ -1,6 +1,8 @@
 from app.config import DATABASE_URL
-from sqlalchemy import Enum, Column, Integer, Numeric, String, ForeignKey, DateTime,Float, create_engine, Index
-from sqlalchemy.orm import relationship, sessionmaker, declarative_base
+from sqlalchemy import Enum, Column, Integer, Numeric, String, Text, ForeignKey, DateTime,Float, create_engine, Index, inspect, text
+from sqlalchemy.orm import relationship, sessionmaker, declarative_base, validates
+from app.utils.nome_fundo import normalizar_nome_fundo
+from app.utils.tempo import agora
 from datetime import datetime
 import enum
 
@@ -59,6 +61,13 @@ class Cliente(Base):
 
     objetivos = relationship("Objetivo", back_populates = "cliente", cascade = "all, delete-orphan")
     posicoes_fundo = relationship("PosicaoFundo", back_populates="cliente", cascade="all, delete-orphan")
+    totais_classe = relationship("ClienteClasseTotal", back_populates="cliente", cascade="all, delete-orphan")
+    ingestoes_extrato = relationship("IngestaoExtrato", back_populates="cliente", cascade="all, delete-orphan")
+
+    # Listagem paginada por (nome, id) - ver catalogo_service
+    __table_args__ = (
+        Index('ix_clientes_nome', 'nome'),
+    )
     
 
 
@@ -77,8 +86,12 @@ class Objetivo(Base):
 
     @property
     def duracao_meses(self):
-        data_atual = datetime.now()
-        return (self.data_final.year - data_atual.year) * 12 + (self.data_final.month - data_atual.month)
+        # Mesmo instante em toda a requisição (ver app.utils.tempo)
+        return self.duracao_meses_em(agora())
+
+    def duracao_meses_em(self, data_referencia):
+        """Meses entre data_referencia e data_final (prazo do objetivo visto naquela data)"""
+        return (self.data_final.year - data_referencia.year) * 12 + (self.data_final.month - data_referencia.month)
         
 
     cliente = relationship("Cliente", back_populates = "objetivos")
@@ -115,6 +128,7 @@ class InfoFundo(Base):
 
     id = Column(Integer, primary_key = True)
     nome_fundo = Column(String, nullable = False)
+    nome_normalizado = Column(String, nullable = True, index = True)  # chave de busca por nome (Advisor)
     cnpj = Column(String, nullable = True)
     classe_anbima = Column(String)
     mov_min = Column(Numeric(15,2))
@@ -126,8 +140,24 @@ class InfoFundo(Base):
     status_fundo = Column(Enum(StatusFundoEnum), nullable = False)
     valor_cota = Column(Numeric(15,6), nullable=False)
     data_atualizacao = Column(DateTime, nullable=True)
+    data_cota_cvm = Column(DateTime, nullable=True)  # DT_COMPTC da última cota aplicada
 
     posicoes_fundo = relationship("PosicaoFundo", back_populates="info_fundo")
+    cotas_historicas = relationship("CotaHistorica", back_populates="info_fundo", cascade="all, delete-orphan")
+
+    # Listagem paginada por (nome_normalizado, id), com ou sem filtro de risco/status - ver catalogo_service.
+    # No SQLite o id (rowid) já vem no fim de todo índice: o de nome_normalizado serve à ordenação sem filtro
+    __table_args__ = (
+        Index('ix_info_fundos_risco_nome', 'risco', 'nome_normalizado'),
+        Index('ix_info_fundos_status_nome', 'status_fundo', 'nome_normalizado'),
+        Index('ix_info_fundos_cnpj', 'cnpj'),
+        Index('ix_info_fundos_classe_anbima', 'classe_anbima'),
+    )
+
+    @validates('nome_fundo')
+    def _sincronizar_nome_normalizado(self, chave, nome):
+        self.nome_normalizado = normalizar_nome_fundo(nome)
+        return nome
 
 
 class PosicaoFundo(Base):
@@ -146,6 +176,48 @@ class PosicaoFundo(Base):
 
 
 
+class CotaHistorica(Base):
+    """
+    Cota de um fundo em uma data de competência (CVM: DT_COMPTC / Data_Referencia).
+    Gravada pelo CotaUpdateService a cada atualização; permite avaliar posições
+    e objetivos em uma data passada (as_of) - ver CotaHistoricaService.
+    """
+    __tablename__ = 'cotas_historicas'
+
+    id = Column(Integer, primary_key=True)
+    fundo_id = Column(Integer, ForeignKey('info_fundos.id'), nullable=False)
+    data = Column(DateTime, nullable=False)
+    valor_cota = Column(Numeric(15,6), nullable=False)
+    fonte = Column(String(20), nullable=True)  # 'CVM_FI', 'CVM_FII' ou 'CVM' (cota aplicada antes do histórico)
+
+    info_fundo = relationship("InfoFundo", back_populates="cotas_historicas")
+
+    __table_args__ = (
+        Index('ix_cotas_historicas_fundo_data', 'fundo_id', 'data', unique=True),
+    )
+
+
+class ClienteClasseTotal(Base):
+    """
+    Total materializado (cotas * valor_cota) de um cliente em uma subclasse de risco:
+    baixo_di, baixo_rfx, moderado, alto.
+    Mantido por PosicaoService quando posições ou cotas mudam.
+    """
+    __tablename__ = 'client_class_totals'
+
+    id = Column(Integer, primary_key=True)
+    cliente_id = Column(Integer, ForeignKey('clientes.id'), nullable=False)
+    classe = Column(String(20), nullable=False)
+    valor = Column(Float, default=0, nullable=False)
+    as_of = Column(DateTime, default=datetime.now, nullable=False)
+
+    cliente = relationship("Cliente", back_populates="totais_classe")
+
+    __table_args__ = (
+        Index('ix_client_class_totals_cliente_classe', 'cliente_id', 'classe', unique=True),
+    )
+
+
 class MatrizRisco(Base):
     __tablename__ = 'matriz_risco'
     
@@ -175,6 +247,174 @@ class IndicadoresEconomicos(Base):
     data_atualizacao = Column(DateTime, default=datetime.now)
 
 
+class SerieEconomica(Base):
+    """
+    Pontos de séries temporais do BCB/SGS (ex: 433 = IPCA mensal, 13522 = IPCA 12 meses).
+    Alimentada de forma incremental por IndicadorService; leituras são sempre locais.
+    """
+    __tablename__ = 'series_economicas'
+
+    id = Column(Integer, primary_key=True)
+    codigo_serie = Column(Integer, nullable=False)
+    data = Column(DateTime, nullable=False)
+    valor = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_serie_codigo_data', 'codigo_serie', 'data', unique=True),
+    )
+
+
+class EstatisticasDashboard(Base):
+    """
+    Snapshot (linha única) com os números exibidos no dashboard.
+    Recalculado por DashboardService nas escritas e na atualização de indicadores,
+    para que a página inicial seja apenas a leitura desta linha.
+    """
+    __tablename__ = 'estatisticas_dashboard'
+
+    id = Column(Integer, primary_key=True)
+    clientes_ativos = Column(Integer, default=0, nullable=False)
+    clientes_inativos = Column(Integer, default=0, nullable=False)
+    num_fundos = Column(Integer, default=0, nullable=False)
+    capital_administrado = Column(Float, default=0, nullable=False)
+
+    ipca = Column(Float)
+    ipca_mes = Column(Float)
+    ipca_mes_anterior = Column(Float)
+    mes_referencia_ipca = Column(String(7))  # MM/AAAA do último IPCA mensal
+    data_indicadores = Column(DateTime)
+
+    data_atualizacao = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class ArquivoFonteCVM(Base):
+    """
+    Validadores HTTP (ETag / Last-Modified) dos arquivos da CVM já processados.
+    Permite pular download e parsing quando o arquivo não mudou desde a última execução.
+    cnpjs_encontrados diz quais fundos cadastrados tiraram a cota do arquivo: só esses
+    contam como já atualizados quando ele é pulado.
+    """
+    __tablename__ = 'arquivos_fonte_cvm'
+
+    id = Column(Integer, primary_key=True)
+    nome_arquivo = Column(String, nullable=False, unique=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    data_processamento = Column(DateTime, default=datetime.now)
+    cnpjs_encontrados = Column(Text, nullable=True)  # CNPJs normalizados, separados por vírgula
+
+
+class IngestaoExtrato(Base):
+    """
+    Extrato (BTG/Advisor) já importado para um cliente, identificado pelo SHA-256 do arquivo.
+    Guarda as posições extraídas (JSON) e o resultado, para que o reenvio do mesmo arquivo
+    não precise ser processado de novo - ver IngestaoService.
+    """
+    __tablename__ = 'ingestoes_extrato'
+
+    id = Column(Integer, primary_key=True)
+    cliente_id = Column(Integer, ForeignKey('clientes.id'), nullable=False)
+    banco_custodia = Column(String(50), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    nome_arquivo = Column(String)
+    posicoes = Column(Text, nullable=False)               # PosicaoExtraida serializadas
+    resultado = Column(String)
+    posicoes_registradas = Column(Integer, default=0, nullable=False)
+    data_importacao = Column(DateTime, default=datetime.now, nullable=False)
+    data_aplicacao = Column(DateTime, default=datetime.now, nullable=False)  # última vez que as posições foram gravadas
+    data_reenvio = Column(DateTime, nullable=True)                           # último reenvio atendido pelo cache
+    reutilizacoes = Column(Integer, default=0, nullable=False)
+
+    cliente = relationship("Cliente", back_populates="ingestoes_extrato")
+
+    __table_args__ = (
+        Index('ix_ingestoes_extrato_cliente_banco_sha', 'cliente_id', 'banco_custodia', 'sha256', unique=True),
+    )
+
+
+def _migrar_colunas_novas(engine):
+    """
+    Adiciona em tabelas já existentes as colunas e índices criados depois delas.
+    create_all() só cria tabelas novas; no SQLite não há migração automática.
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for tabela in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabela.name):
+                continue
+
+            existentes = {coluna['name'] for coluna in inspector.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in existentes:
+                    continue
+                tipo = coluna.type.compile(engine.dialect)
+                conn.execute(text(f'ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}'))
+                print(f"→ Coluna adicionada: {tabela.name}.{coluna.name}")
+
+            for indice in tabela.indexes:
+                indice.create(conn, checkfirst=True)
+
+
+# Busca textual (FTS5) de fundos e clientes - consultada por busca_service.
+# Tabelas FTS comuns (com cópia do texto), rowid = id da linha de origem, mantidas
+# pelos triggers; cnpj_digitos permite buscar o CNPJ sem pontuação.
+TABELAS_BUSCA = {
+    'busca_fundos': {
+        'origem': 'info_fundos',
+        'colunas': ('nome_fundo', 'classe_anbima', 'cnpj', 'cnpj_digitos'),
+        'indexadas': ('nome_fundo', 'classe_anbima', 'cnpj'),
+        'valores': "{t}.nome_fundo, {t}.classe_anbima, {t}.cnpj, "
+                   "replace(replace(replace({t}.cnpj, '.', ''), '/', ''), '-', '')",
+    },
+    'busca_clientes': {
+        'origem': 'clientes',
+        'colunas': ('nome', 'email', 'cpf'),
+        'indexadas': ('nome', 'email', 'cpf'),
+        'valores': "{t}.nome, {t}.email, {t}.cpf",
+    },
+}
+
+
+def _criar_indices_busca(engine):
+    """
+    Cria as tabelas FTS5 e os triggers de sincronização (se ainda não existem) e
+    indexa as linhas já cadastradas. Sem FTS5 no SQLite, a busca usa o prefixo do
+    nome (ver busca_service).
+    """
+    with engine.begin() as conn:
+        for tabela, busca in TABELAS_BUSCA.items():
+            if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :nome"), {'nome': tabela}).first():
+                continue
+
+            colunas = ', '.join(busca['colunas'])
+            origem = busca['origem']
+            try:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {tabela} USING fts5({colunas}, "
+                    f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                ))
+            except Exception as e:
+                print(f"[AVISO] Busca textual indisponível (FTS5): {e}")
+                return
+
+            inserir = f"INSERT INTO {tabela} (rowid, {colunas}) SELECT new.id, {busca['valores'].format(t='new')};"
+            remover = f"DELETE FROM {tabela} WHERE rowid = old.id;"
+            conn.execute(text(f"CREATE TRIGGER {tabela}_ai AFTER INSERT ON {origem} BEGIN {inserir} END"))
+            conn.execute(text(f"CREATE TRIGGER {tabela}_ad AFTER DELETE ON {origem} BEGIN {remover} END"))
+            # Só quando muda um campo indexado: a atualização diária de cotas não reindexa os fundos
+            conn.execute(text(
+                f"CREATE TRIGGER {tabela}_au AFTER UPDATE OF {', '.join(busca['indexadas'])} ON {origem} "
+                f"BEGIN {remover} {inserir} END"
+            ))
+
+            conn.execute(text(
+                f"INSERT INTO {tabela} (rowid, {colunas}) "
+                f"SELECT {origem}.id, {busca['valores'].format(t=origem)} FROM {origem}"
+            ))
+            print(f"→ Índice de busca criado: {tabela}")
+
+
 def _popular_matriz_inicial():
     """
     Popula dados iniciais da matriz de risco - chamada automaticamente pelo init_db()
@@ -236,11 +476,103 @@ def _popular_matriz_inicial():
     finally:
         session.close()
 
+def _popular_totais_classe():
+    """
+    Materializa client_class_totals para clientes com posição que ainda não
+    têm linhas na tabela (bancos anteriores à tabela) - chamada pelo init_db()
+    """
+    from app.services.posicao_service import PosicaoService
+
+    session = create_session()
+    try:
+        materializados = {cid for (cid,) in session.query(ClienteClasseTotal.cliente_id).distinct()}
+        pendentes = {
+            cid for (cid,) in session.query(PosicaoFundo.cliente_id).distinct()
+        } - materializados
+        if not pendentes:
+            return
+
+        PosicaoService.atualizar_totais_clientes(pendentes, session)
+        session.commit()
+        print(f"✅ Totais por classe materializados para {len(pendentes)} clientes")
+
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Erro ao materializar totais por classe: {e}")
+        raise e
+    finally:
+        session.close()
+
+
+def _popular_cotas_historicas():
+    """
+    Primeiro ponto do histórico de cotas: a cota CVM já aplicada em cada fundo
+    (valor_cota na data_cota_cvm) - chamada pelo init_db(), só com a tabela vazia
+    """
+    session = create_session()
+    try:
+        if session.query(CotaHistorica.id).first():
+            return
+
+        fundos = session.query(InfoFundo.id, InfoFundo.data_cota_cvm, InfoFundo.valor_cota).filter(
+            InfoFundo.data_cota_cvm.isnot(None)
+        ).all()
+        if not fundos:
+            return
+
+        session.bulk_insert_mappings(CotaHistorica, [
+            {'fundo_id': fundo_id, 'data': data, 'valor_cota': valor, 'fonte': 'CVM'}
+            for fundo_id, data, valor in fundos
+        ])
+        session.commit()
+        print(f"✅ Histórico de cotas iniciado com {len(fundos)} fundos")
+
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Erro ao iniciar histórico de cotas: {e}")
+        raise e
+    finally:
+        session.close()
+
+
+def _popular_nomes_normalizados():
+    """
+    Preenche info_fundos.nome_normalizado dos fundos cadastrados antes da coluna
+    (fundos novos e renomeados são sincronizados pelo modelo) - chamada pelo init_db()
+    """
+    session = create_session()
+    try:
+        pendentes = session.query(InfoFundo.id, InfoFundo.nome_fundo).filter(
+            InfoFundo.nome_normalizado.is_(None)
+        ).all()
+        if not pendentes:
+            return
+
+        session.bulk_update_mappings(InfoFundo, [
+            {'id': fundo_id, 'nome_normalizado': normalizar_nome_fundo(nome)}
+            for fundo_id, nome in pendentes
+        ])
+        session.commit()
+        print(f"✅ Nomes normalizados preenchidos para {len(pendentes)} fundos")
+
+    except Exception as e:
+        session.rollback()
+        print(f"❌ Erro ao preencher nomes normalizados: {e}")
+        raise e
+    finally:
+        session.close()
+
+
 def init_db():
     engine = create_engine(DATABASE_URL)
     Base.metadata.create_all(engine)
+    _migrar_colunas_novas(engine)
+    _criar_indices_busca(engine)
         
     _popular_matriz_inicial()
+    _popular_totais_classe()
+    _popular_nomes_normalizados()
+    _popular_cotas_historicas()
     
     return engine
   
@@ -61,11 +61,7 @@ def iniciar(cliente_id):
         vp_ideal_por_objetivo = {}
         
         # Pegar IPCA para calcular VP Ideal
-        from app.models.geld_models import IndicadoresEconomicos
-        ipca = db.query(IndicadoresEconomicos).order_by(
-            IndicadoresEconomicos.data_atualizacao.desc()
-        ).first()
-        ipca_anual = ipca.ipca if ipca else 4.5
+        ipca_anual = BalanceamentoService.ipca_anual(db)
         
         for objetivo in objetivos:
             matriz = BalanceamentoService.buscar_matriz_alvo(objetivo, db)
@@ -1,10 +1,13 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session
+from flask import Blueprint, render_template, request, flash, redirect, url_for, session, jsonify
 from app.services.global_services import GlobalServices,login_required
 from app.services.balance_service import BalanceamentoService
 from app.services.posicao_service import PosicaoService
+from app.services.dashboard_service import DashboardService
+from app.services.busca_service import BuscaService
+from app.services.catalogo_service import CatalogoService
 from app.models.geld_models import (
     create_session, RiscoEnum, SubtipoRiscoEnum, BancoEnum, Cliente, StatusEnum, 
-    PosicaoFundo, InfoFundo, Objetivo, DistribuicaoObjetivo, IndicadoresEconomicos
+    PosicaoFundo, InfoFundo, Objetivo, DistribuicaoObjetivo
 )
 from datetime import datetime
 from functools import wraps
@@ -12,6 +15,9 @@ from sqlalchemy import func
 
 cliente_bp = Blueprint('cliente', __name__)
 
+# Filtros da listagem (query string), repassados a CatalogoService.listar_clientes
+FILTROS_CLIENTES = ('nome', 'cpf', 'status', 'banco')
+
 
 
 #REGISTRAR CLIENTE
@@ -45,6 +51,7 @@ def register_client():
             status=StatusEnum.ativo
         )
         
+        DashboardService.atualizar_snapshot(db)
         flash(f'Cliente {novo_cliente.nome} cadastrado com sucesso!',"success")
 
         return redirect(url_for('cliente.listar_clientes'))
@@ -67,15 +74,32 @@ def register_client():
 def listar_clientes():
     try:
         db = create_session()
-        global_service = GlobalServices(db)
-        clientes = global_service.listar_classe(Cliente)
-        return render_template('cliente/listar_clientes.html', clientes=clientes)
+        filtros = {campo: request.args[campo].strip() for campo in FILTROS_CLIENTES if request.args.get(campo, '').strip()}
+        pagina = CatalogoService.listar_clientes(
+            db, apos=request.args.get('apos'), antes=request.args.get('antes'), **filtros
+        )
+        return render_template('cliente/listar_clientes.html', clientes=pagina['itens'], pagina=pagina, filtros=filtros)
     except Exception as e:
         flash(f'Erro ao listar clientes: {str(e)}',"error")
         return redirect(url_for('dashboard.cliente_dashboard'))
     finally:
         db.close()
 
+#BUSCAR (typeahead)
+@cliente_bp.route('/clientes/buscar')
+@login_required
+def buscar_clientes():
+    """JSON com os clientes que casam com ?q= (busca textual por nome, email e CPF)"""
+    db = create_session()
+    try:
+        resultados = BuscaService.buscar_clientes(db, request.args.get('q', ''), request.args.get('limite'))
+        return jsonify({'resultados': resultados})
+    except Exception as e:
+        print(f"[ERRO] Erro na busca de clientes: {str(e)}")
+        return jsonify({'resultados': [], 'erro': str(e)}), 500
+    finally:
+        db.close()
+
 #DELETAR 
 @cliente_bp.route('/delete/<int:cliente_id>', methods=['POST'])
 @login_required
@@ -85,6 +109,7 @@ def delete_client(cliente_id):
         global_service = GlobalServices(db)
         
         if global_service.delete(Cliente, cliente_id):
+            DashboardService.atualizar_snapshot(db)
             flash('Cliente deletado com sucesso!', "success")
         else:
             flash('Cliente não encontrado.', "error")
@@ -139,6 +164,7 @@ def edit_client(cliente_id):
             cliente_atualizado = global_service.editar_classe(Cliente, cliente_id, **dados_atualizados)
             
             if cliente_atualizado:
+                DashboardService.atualizar_snapshot(db)
                 flash('Cliente atualizado com sucesso!', "success")
                 return redirect(url_for('cliente.info_cliente', cliente_id=cliente_id))
             else:
@@ -232,10 +258,7 @@ def area_cliente(cliente_id):
                     }
             
             # Buscar matrizes de risco
-            ipca = db.query(IndicadoresEconomicos).order_by(
-                IndicadoresEconomicos.data_atualizacao.desc()
-            ).first()
-            ipca_anual = ipca.ipca if ipca else 4.5
+            ipca_anual = BalanceamentoService.ipca_anual(db)
             
             for objetivo in objetivos:
                 matriz = BalanceamentoService.buscar_matriz_alvo(objetivo, db)
@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from app.services.global_services import login_required
-from app.services.extract_services import ExtractServices
-from app.models.geld_models import create_session, Cliente, StatusEnum, IndicadoresEconomicos, Objetivo, PosicaoFundo, InfoFundo
-from sqlalchemy import func, extract
+from app.services.indicador_service import IndicadorService
+from app.services.dashboard_service import DashboardService
+from app.models.geld_models import create_session
 from datetime import datetime, timedelta
 
 
@@ -16,56 +16,35 @@ def cliente_dashboard():
     
     db = create_session()
     num_clientes = 0
+    clientes_inativos = 0
     ipca = None
     ipca_mes = None
     data_atualizacao = None
-    mes_anterior = None
     ipca_mes_anterior = None
     num_fundos = 0
     capital_administrado = 0  
 
+    # Mês anterior como referência até o IPCA mensal ser sincronizado
+    mes_anterior = (datetime.now().replace(day=1) - timedelta(days=1)).strftime('%m/%Y')
+
     try:
-        num_clientes = db.query(func.count(Cliente.id)).filter(Cliente.status == StatusEnum.ativo).scalar() or 0
-        num_fundos = db.query(func.count(InfoFundo.id)).scalar() or 0
-        clientes_inativos = db.query(func.count(Cliente.id)).filter(Cliente.status == StatusEnum.inativo).scalar() or 0
-        
-        #Obter capital administrado
-        capital_administrado = db.query(func.sum(PosicaoFundo.cotas * InfoFundo.valor_cota)
-        ).join(InfoFundo, PosicaoFundo.fundo_id == InfoFundo.id).scalar() or 0.0
-        
+        # Snapshot pré-calculado: uma única leitura, sem agregações nem chamadas externas
+        snapshot = DashboardService.obter_snapshot(db)
 
-        # Obter a data do mês anterior
-        today = datetime.now()
-        mes_anterior_obj = today.replace(day=1) - timedelta(days=1)
-        mes_anterior = mes_anterior_obj.strftime('%B/%Y')  # Nome do mês/ano
-        
-        # Buscar indicadores econômicos
-        indicadores = db.query(IndicadoresEconomicos).first()
-        if indicadores:
-            ipca = indicadores.ipca
-            ipca_mes = indicadores.ipca_mes
-            
-            if indicadores.data_atualizacao:                
-                try:
-                    data_atualizacao = indicadores.data_atualizacao.strftime('%d/%m/%Y')
-                except:
-                    data_atualizacao = str(indicadores.data_atualizacao)
-        
-        # Obter IPCA do mês anterior diretamente da API do Banco Central
-        data_fim = datetime.now().strftime('%d/%m/%Y')
-        data_inicio = (datetime.now() - timedelta(days=60)).strftime('%d/%m/%Y')
-        codigo_ipca_mensal = 433  # Código do IPCA do mês anterior
-        
-        extract_service = ExtractServices(db)
-        df_ipca_mensal = extract_service.extracao_bcb(codigo_ipca_mensal, data_inicio, data_fim)
-        
-        if not df_ipca_mensal.empty:
-            ipca_mes_anterior = df_ipca_mensal.iloc[-1]['valor']
+        if snapshot:
+            num_clientes = snapshot.clientes_ativos
+            clientes_inativos = snapshot.clientes_inativos
+            num_fundos = snapshot.num_fundos
+            capital_administrado = snapshot.capital_administrado
+            ipca = snapshot.ipca
+            ipca_mes = snapshot.ipca_mes
+            ipca_mes_anterior = snapshot.ipca_mes_anterior
 
-                
-            if 'data' in df_ipca_mensal.columns:
-                mes_referencia = df_ipca_mensal.iloc[-1]['data'].strftime('%m/%Y')
-                mes_anterior = mes_referencia
+            if snapshot.mes_referencia_ipca:
+                mes_anterior = snapshot.mes_referencia_ipca
+
+            if snapshot.data_indicadores:
+                data_atualizacao = snapshot.data_indicadores.strftime('%d/%m/%Y')
         
     except Exception as e:
         flash(f'Erro ao carregar dashboard: {str(e)}', "error")
@@ -90,37 +69,18 @@ def cliente_dashboard():
 def atualizar_indicadores():
     try:
         db = create_session()
-        extract_service = ExtractServices(db)
-        
-        # Buscar o IPCA 12 meses
-        data_fim = datetime.now().strftime('%d/%m/%Y')
-        data_inicio = (datetime.now() - timedelta(days=60)).strftime('%d/%m/%Y')
-        codigo_ipca = 13522  # Código do IPCA 12 meses
         
-        df_ipca = extract_service.extracao_bcb(codigo_ipca, data_inicio, data_fim)
+        # Sincroniza as séries do BCB (apenas pontos novos) e recalcula o IPCA mensal
+        resultado = IndicadorService(db).atualizar_indicadores()
         
-        if not df_ipca.empty:
-            ultimo_ipca = df_ipca.iloc[-1]['valor']
-            
-            # Buscar registro existente ou cria um novo
-            indicadores = db.query(IndicadoresEconomicos).first()
-            if not indicadores:
-                indicadores = IndicadoresEconomicos()
-                db.add(indicadores)
-            
-            # Atualiza os valores
-            indicadores.ipca = ultimo_ipca
-            
-            # Calcula o IPCA mensal a partir do anual
-            ipca_mes_calculado = ((1 + ultimo_ipca/100)**(1/12) - 1) * 100 
-            
-            # ATUALIZA
-            indicadores.ipca_mes = ipca_mes_calculado
-            indicadores.data_atualizacao = datetime.now()
-            
-            # Salva as alterações
+        if resultado['ipca'] is not None:
             db.commit()
-            flash('Indicadores econômicos atualizados com sucesso!', "success")
+            DashboardService.atualizar_snapshot(db)
+            novos = sum(resultado['novos_pontos'].values())
+            flash(f'Indicadores econômicos atualizados com sucesso! ({novos} novos pontos do BCB)', "success")
+            if resultado['series_incompletas']:
+                flash('A API do BCB falhou no meio da sincronização; os pontos restantes serão '
+                      'buscados na próxima atualização.', "warning")
         else:
             flash('Não foi possível obter dados do IPCA.', "warning")
             
@@ -131,4 +91,4 @@ def atualizar_indicadores():
         if 'db' in locals() and db:
             db.close()
     
-    return redirect(url_for('dashboard.cliente_dashboard'))
\ No newline at end of file
+    return redirect(url_for('dashboard.cliente_dashboard'))
@@ -1,14 +1,24 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session
+from flask import Blueprint, render_template, request, flash, redirect, url_for, session, jsonify
 from functools import wraps
 from app.models.geld_models import create_session, InfoFundo, RiscoEnum, StatusFundoEnum, SubtipoRiscoEnum, PosicaoFundo
 from app.services.global_services import GlobalServices, login_required
 from datetime import datetime
 from app.services.extract_services import ExtractServices
+from app.services.dashboard_service import DashboardService
+from app.services.posicao_service import PosicaoService
+from app.services.busca_service import BuscaService
+from app.services.catalogo_service import CatalogoService
+from app.services.exclusao_lote_service import ExclusaoLoteService, EXCLUIDO, EM_USO
 from datetime import datetime
 import re
 
 fundos_bp = Blueprint('fundos', __name__)
 
+# Filtros da listagem (query string), repassados a CatalogoService.listar_fundos
+FILTROS_FUNDOS = ('nome', 'cnpj', 'classe_risco', 'status', 'classe_anbima')
+
+MAX_FUNDOS_LISTADOS = 10   # fundos em uso citados um a um na exclusão múltipla
+
 
 #LISTAR
 @fundos_bp.route('/listar_fundos')
@@ -16,11 +26,13 @@ fundos_bp = Blueprint('fundos', __name__)
 def listar_fundos():
     try:
         db = create_session()
-        global_service = GlobalServices(db)
-        fundos = global_service.listar_classe(InfoFundo)
-
+        filtros = {campo: request.args[campo].strip() for campo in FILTROS_FUNDOS if request.args.get(campo, '').strip()}
+        pagina = CatalogoService.listar_fundos(
+            db, apos=request.args.get('apos'), antes=request.args.get('antes'), **filtros
+        )
 
-        return render_template('fundos/listar_fundos.html', fundos=fundos)
+        return render_template('fundos/listar_fundos.html', fundos=pagina['itens'], pagina=pagina,
+                               filtros=filtros, classes_anbima=CatalogoService.classes_anbima(db))
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -30,6 +42,21 @@ def listar_fundos():
         if 'db' in locals() and db:
             db.close()
 
+#BUSCAR (typeahead)
+@fundos_bp.route('/fundos/buscar')
+@login_required
+def buscar_fundos():
+    """JSON com os fundos que casam com ?q= (busca textual por nome, classe ANBIMA e CNPJ)"""
+    db = create_session()
+    try:
+        resultados = BuscaService.buscar_fundos(db, request.args.get('q', ''), request.args.get('limite'))
+        return jsonify({'resultados': resultados})
+    except Exception as e:
+        print(f"[ERRO] Erro na busca de fundos: {str(e)}")
+        return jsonify({'resultados': [], 'erro': str(e)}), 500
+    finally:
+        db.close()
+
 #CADASTRAR FUNDO NA MÃO 
 @fundos_bp.route('/add_fundo', methods =['GET', 'POST'])
 @login_required
@@ -65,6 +92,7 @@ def add_fundo():
             valor_cota = 1,
             data_atualizacao = data_atualizacao
         )
+        DashboardService.atualizar_snapshot(db)
         flash(f'Fundo {novo_fundo.nome_fundo} cadastrado com sucesso!')
         return redirect(url_for('fundos.listar_fundos'))
 
@@ -85,6 +113,7 @@ def delete_fundo(fundo_id):
         db = create_session()
         global_service = GlobalServices(db)
         if global_service.delete(InfoFundo, fundo_id):
+            DashboardService.atualizar_snapshot(db)
             flash(f'Fundo deletado com sucesso!',"success")
         else:
             flash('Fundo não encontrado!')
@@ -113,24 +142,19 @@ def delete_multiple_fundos():
         # Converter para inteiros
         fundo_ids = [int(fid) for fid in fundo_ids]
         
-        # Deletar fundos
-        deleted_count = 0
-        for fundo_id in fundo_ids:
-            fundo = db.query(InfoFundo).filter_by(id=fundo_id).first()
-            if fundo:
-                # Verificar se há posições associadas
-                posicoes_count = db.query(PosicaoFundo).filter_by(fundo_id=fundo_id).count()
-                
-                if posicoes_count > 0:
-                    flash(f'Fundo "{fundo.nome_fundo}" possui {posicoes_count} posição(ões) associada(s) e não pode ser deletado.', 'error')
-                    continue
-                
-                db.delete(fundo)
-                deleted_count += 1
-        
+        # Deletar fundos sem posições (uma contagem agrupada + um DELETE por lote)
+        relatorio = ExclusaoLoteService.excluir_fundos(db, fundo_ids)
         db.commit()
         
+        em_uso = [r for r in relatorio.values() if r['status'] == EM_USO]
+        for resultado in em_uso[:MAX_FUNDOS_LISTADOS]:
+            flash(f'Fundo "{resultado["nome"]}" possui {resultado["posicoes"]} posição(ões) associada(s) e não pode ser deletado.', 'error')
+        if len(em_uso) > MAX_FUNDOS_LISTADOS:
+            flash(f'Outros {len(em_uso) - MAX_FUNDOS_LISTADOS} fundo(s) com posições associadas não foram deletados.', 'error')
+        
+        deleted_count = ExclusaoLoteService.contar(relatorio, EXCLUIDO)
         if deleted_count > 0:
+            DashboardService.atualizar_snapshot(db)
             flash(f'{deleted_count} fundo(s) deletado(s) com sucesso!', 'success')
         else:
             flash('Nenhum fundo pôde ser deletado.', 'warning')
@@ -198,6 +222,10 @@ def edit_fundo(fundo_id):
             fundo_atualizado = global_service.editar_classe(InfoFundo, fundo_id, **dados_atualizados)
 
             if fundo_atualizado:
+                # Cota ou risco podem ter mudado: recalcula os clientes com posição no fundo
+                PosicaoService.atualizar_totais_por_fundos([fundo_id], db)
+                db.commit()
+                DashboardService.atualizar_snapshot(db)
                 flash('Fundo atualizado com sucesso!')
             else:
                 flash('Fundo não encontrado.')
@@ -224,17 +252,29 @@ def atualizar_cotas_fundos():
     try:
         db = create_session()
         service = CotaUpdateService(db)
-        resultado = service.atualizar_todas_cotas()
+        incremental = request.form.get('modo') != 'completo'
+        resultado = service.atualizar_todas_cotas(incremental=incremental)
 
         total_atualizados = resultado['fi_atualizados'] + resultado['fii_atualizados']
 
+        # Totais por classe só dos clientes com posição nos fundos alterados
+        PosicaoService.atualizar_totais_por_fundos(resultado['fundos_alterados'], db)
+
+        # Commit sempre: também persiste os validadores dos arquivos CVM processados
+        db.commit()
+
         if total_atualizados > 0:
-            db.commit()
+            DashboardService.atualizar_snapshot(db)
             mensagem = (f"✅ {total_atualizados} de {resultado['total']} fundos atualizados "
                         f"(FI: {resultado['fi_atualizados']} | FII: {resultado['fii_atualizados']})")
+            if resultado['ja_atualizados']:
+                mensagem += f" — {resultado['ja_atualizados']} já estavam atualizados"
             if resultado['nao_encontrados']:
                 mensagem += f" — {len(resultado['nao_encontrados'])} não encontrados na CVM"
             flash(mensagem, 'success')
+        elif resultado['ja_atualizados'] > 0:
+            flash(f"Cotas já estão atualizadas: nenhuma data nova na CVM para "
+                  f"{resultado['ja_atualizados']} fundos.", 'info')
         else:
             flash('Nenhum fundo foi encontrado nos dados da CVM. Tente novamente mais tarde.', 'warning')
 
@@ -313,6 +353,8 @@ def add_fundo_cnpj():
                 data_atualizacao=datetime.now()
             )
 
+            DashboardService.atualizar_snapshot(db)
+
             # Flash de sucesso com detalhes
             if mes_encontrado == "atual":
                 flash(f'✅ Fundo "{novo_fundo.nome_fundo}" cadastrado com sucesso! (dados atuais)', "success")
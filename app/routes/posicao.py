@@ -3,22 +3,23 @@ Rotas de posições em fundos de investimento (Blueprint: posicao_bp)
 Gerencia as cotas que um cliente possui em fundos: listagem com saldos por classe
 de risco, cadastro/edição/exclusão manual e importação via planilha BTG.
 
-Depende de PosicaoService para cálculos de saldo, ExtractBTGService para parsing
-da planilha e FundoRegistrationService para cadastro automático de fundos via CVM.
+Depende de PosicaoService para cálculos de saldo e de PipelineIngestao para a
+importação da planilha (leitura, cadastro automático de fundos e gravação).
 """
 
 from flask import Blueprint, render_template, request, flash, redirect, url_for
-from werkzeug.utils import secure_filename
-from app.services.global_services import login_required, GlobalServices
+from app.services.global_services import login_required, limite_upload, GlobalServices
 from app.models.geld_models import create_session, Cliente, InfoFundo, PosicaoFundo, RiscoEnum, SubtipoRiscoEnum
 from app.services.posicao_service import PosicaoService   # NOVO
+from app.services.dashboard_service import DashboardService
+from app.services.exclusao_lote_service import ExclusaoLoteService, EXCLUIDO
 from sqlalchemy import func
 from datetime import datetime
-import os
-import time
 import traceback
-from app.services.extract_btg_service import ExtractBTGService
-from app.services.fundo_registration_service import FundoRegistrationService
+from app.services.ingestao_service import IngestaoService
+from app.services.pipeline_ingestao_service import PipelineIngestao
+from app.services.importacao_lote_service import ImportacaoLoteService
+from app.config import BTG_PARSE_PARALELO, UPLOAD_TAMANHO_MAXIMO, UPLOAD_LOTE_TAMANHO_MAXIMO, IMPORTACAO_LOTE_PROCESSOS
 
 
 posicao_bp = Blueprint('posicao', __name__)
@@ -83,8 +84,8 @@ def add_posicao(cliente_id):
                 print('Cliente não encontrado.')
                 return redirect(url_for('cliente.area_cliente', cliente_id=cliente_id))
 
-            fundos = global_service.listar_classe(InfoFundo)
-            return render_template('posicoes/add_posicao.html', cliente=cliente, fundos=fundos)
+            # Fundos escolhidos pela busca (fundos.buscar_fundos), sem carregar o catálogo inteiro
+            return render_template('posicoes/add_posicao.html', cliente=cliente)
 
         except Exception as e:
             print(f'Erro ao carregar formulário: {str(e)}')
@@ -109,6 +110,9 @@ def add_posicao(cliente_id):
                 data_atualizacao=data_atualizacao
             )
 
+            PosicaoService.atualizar_totais_clientes([cliente_id], db)
+            db.commit()
+            DashboardService.atualizar_snapshot(db)
             flash('Posição cadastrada com sucesso!')
             return redirect(url_for('posicao.listar_posicao', cliente_id=cliente_id))
 
@@ -160,7 +164,9 @@ def edit_posicao(posicao_id):
 
             posicao.cotas = cotas
             posicao.data_atualizacao = data_atualizacao
+            PosicaoService.atualizar_totais_clientes([cliente_id], db)
             db.commit()
+            DashboardService.atualizar_snapshot(db)
 
             print(f'Posição atualizada com sucesso!')
             flash("Posição atualizada com sucesso!", "success")
@@ -191,6 +197,9 @@ def delete_posicao(posicao_id):
         cliente_id = posicao.cliente_id
 
         if global_service.delete(PosicaoFundo, posicao_id):
+            PosicaoService.atualizar_totais_clientes([cliente_id], db)
+            db.commit()
+            DashboardService.atualizar_snapshot(db)
             flash('Posição deletada com sucesso!')
         else:
             flash('Erro ao deletar posição.')
@@ -209,7 +218,6 @@ def delete_posicao(posicao_id):
 def delete_multiple_posicoes(cliente_id):
     try:
         db = create_session()
-        global_service = GlobalServices(db)
 
         posicao_ids = request.form.getlist('posicao_ids')
 
@@ -219,26 +227,17 @@ def delete_multiple_posicoes(cliente_id):
 
         posicao_ids = [int(pid) for pid in posicao_ids]
 
-        deleted_count = 0
-        failed_count = 0
-
-        for posicao_id in posicao_ids:
-            try:
-                posicao = global_service.get_by_id(PosicaoFundo, posicao_id)
-
-                if posicao and posicao.cliente_id == cliente_id:
-                    if global_service.delete(PosicaoFundo, posicao_id):
-                        deleted_count += 1
-                    else:
-                        failed_count += 1
-                else:
-                    failed_count += 1
+        # Um DELETE por lote, restrito às posições do cliente
+        relatorio = ExclusaoLoteService.excluir_posicoes(db, cliente_id, posicao_ids)
+        deleted_count = ExclusaoLoteService.contar(relatorio, EXCLUIDO)
+        failed_count = len(relatorio) - deleted_count
 
-            except Exception as e:
-                print(f"[ERRO] Erro ao deletar posição {posicao_id}: {str(e)}")
-                failed_count += 1
+        if deleted_count > 0:
+            PosicaoService.atualizar_totais_clientes([cliente_id], db)
+        db.commit()
 
         if deleted_count > 0:
+            DashboardService.atualizar_snapshot(db)
             flash(f'{deleted_count} posição(ões) deletada(s) com sucesso!', 'success')
 
         if failed_count > 0:
@@ -247,6 +246,7 @@ def delete_multiple_posicoes(cliente_id):
         return redirect(url_for('posicao.listar_posicao', cliente_id=cliente_id))
 
     except Exception as e:
+        db.rollback()
         flash(f'Erro ao deletar posições: {str(e)}', 'error')
         return redirect(url_for('posicao.listar_posicao', cliente_id=cliente_id))
     finally:
@@ -259,12 +259,14 @@ def delete_multiple_posicoes(cliente_id):
 
 @posicao_bp.route('/posicao/<int:cliente_id>/upload_cotas', methods=['GET', 'POST'])
 @login_required
+@limite_upload(UPLOAD_TAMANHO_MAXIMO)
 def upload_cotas(cliente_id):
     if request.method == 'GET':
         try:
             db = create_session()
             cliente = db.query(Cliente).filter_by(id=cliente_id).first()
-            return render_template('posicoes/upload_cotas.html', cliente=cliente)
+            ingestoes = IngestaoService.listar_recentes(db, cliente_id, 'BTG')
+            return render_template('posicoes/upload_cotas.html', cliente=cliente, ingestoes=ingestoes)
         except Exception as e:
             flash(f'Erro ao carregar página de upload: {str(e)}')
             return redirect(url_for('cliente.area_cliente', cliente_id=cliente_id))
@@ -277,131 +279,26 @@ def upload_cotas(cliente_id):
             cliente = db.query(Cliente).filter_by(id=cliente_id).first()
             global_services = GlobalServices(db)
 
-            UPLOAD_FOLDER = 'uploads'
-            ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
-            MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
-
-            if not os.path.exists(UPLOAD_FOLDER):
-                os.makedirs(UPLOAD_FOLDER)
-
-            if 'arquivo' not in request.files:
-                flash("Nenhum arquivo foi selecionado", "error")
-                return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
-
-            file = request.files['arquivo']
+            sucesso, arquivo, mensagem = global_services.processar_upload_arquivo()
 
-            if file.filename == '':
-                flash("Nenhum arquivo foi selecionado", "error")
+            if not sucesso:
+                flash(mensagem, "error")
                 return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
 
-            if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS):
-                flash(f"Tipo de arquivo não permitido. Use: {', '.join(ALLOWED_EXTENSIONS)}", "error")
-                return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
-
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-
-            if file_size > MAX_FILE_SIZE:
-                flash(f"Arquivo muito grande. Máximo: {MAX_FILE_SIZE // (1024*1024)}MB", "error")
-                return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
-
-            filename = secure_filename(file.filename)
-            timestamp = str(int(time.time() * 1000))
-            filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(file_path)
-
-            print(f"[INFO] Arquivo salvo: {file_path}")
+            print(f"[INFO] {mensagem}")
 
+            # Ler → extrair → normalizar → resolver fundos → diferença → gravar
             try:
-                print("[INFO] Iniciando processamento completo do arquivo BTG...")
-                btg_service = ExtractBTGService(db, global_services)
-                posicoes, log = btg_service.processar_arquivo_btg_completo(file_path, cliente_id)
-
-                total = log['fundos'] + log['previdencia_individual'] + log['previdencia_externa'] + log['renda_fixa'] + log['renda_variavel']
-                flash(f"Processadas {total} posições: {log['fundos']} fundos, {log['previdencia_individual']} prev.ind, {log['previdencia_externa']} prev.ext, {log['renda_fixa']} RF, {log['renda_variavel']} RV", "info")
+                pipeline = PipelineIngestao(db, 'BTG', paralelo=BTG_PARSE_PARALELO)
+                resultado = pipeline.executar(cliente_id, arquivo, request.files['arquivo'].filename)
+            finally:
+                arquivo.close()
 
-                banco_custodia = 'BTG'
+            for texto, categoria in resultado['mensagens']:
+                flash(texto, categoria)
 
-            except Exception as e:
-                print(f"[ERRO] Erro no processamento: {str(e)}")
-                flash(f"Erro no processamento: {str(e)}", "error")
+            if resultado['status'] != 'importado':
                 return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
-
-            if not posicoes:
-                flash("Nenhuma posição válida foi extraída do arquivo.")
-                return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
-
-            print("[INFO] Cadastrando novos fundos automaticamente...")
-            registration_service = FundoRegistrationService(db)
-            existing_funds = registration_service.cadastrar_fundos_automaticamente(posicoes)
-
-            print(f"[INFO] Deletando posições anteriores do {banco_custodia} para cliente {cliente_id}")
-            posicoes_deletadas = db.query(PosicaoFundo).filter(
-                PosicaoFundo.cliente_id == cliente_id,
-                PosicaoFundo.banco_custodia == banco_custodia
-            ).delete()
-            db.commit()
-            print(f"[INFO] {posicoes_deletadas} posições antigas do {banco_custodia} deletadas")
-
-            registros_salvos = 0
-            registros_atualizados = 0
-            registros_falhas = 0
-
-            for pos in posicoes:
-                session = create_session()
-                try:
-                    norm_cnpj = pos['cnpj'].replace('.', '').replace('/', '').replace('-', '')
-
-                    if norm_cnpj in existing_funds:
-                        fundo_id = existing_funds[norm_cnpj]
-
-                        existing_position = session.query(PosicaoFundo).filter_by(
-                            fundo_id=fundo_id,
-                            cliente_id=cliente_id
-                        ).first()
-
-                        if existing_position:
-                            existing_position.cotas = pos['num_cotas']
-                            existing_position.data_atualizacao = pos['data']
-                            existing_position.banco_custodia = banco_custodia
-                            session.commit()
-                            registros_atualizados += 1
-                        else:
-                            services = GlobalServices(session)
-                            new_position = services.create_classe(
-                                PosicaoFundo,
-                                fundo_id=fundo_id,
-                                cliente_id=cliente_id,
-                                cotas=pos['num_cotas'],
-                                data_atualizacao=pos['data'],
-                                banco_custodia=banco_custodia
-                            )
-                            registros_salvos += 1
-                    else:
-                        print(f"[AVISO] CNPJ {pos['cnpj']} não encontrado no banco de dados.")
-                        registros_falhas += 1
-                except Exception as e:
-                    print(f"[ERRO] Erro ao registrar posição: {str(e)}")
-                    registros_falhas += 1
-                    session.rollback()
-                finally:
-                    session.close()
-
-            try:
-                os.remove(file_path)
-            except:
-                pass
-
-            if registros_salvos > 0 or registros_atualizados > 0:
-                msg = f"{registros_salvos} novas posições e {registros_atualizados} atualizações registradas com sucesso!"
-                if registros_falhas > 0:
-                    msg += f" ({registros_falhas} operações falharam)"
-                flash(msg)
-            else:
-                flash("Nenhuma posição foi registrada. Verifique o arquivo ou os logs.")
-
             return redirect(url_for('posicao.listar_posicao', cliente_id=cliente_id))
 
         except Exception as e:
@@ -410,4 +307,41 @@ def upload_cotas(cliente_id):
             flash(f"Erro ao processar arquivo: {str(e)}")
             return redirect(url_for('posicao.upload_cotas', cliente_id=cliente_id))
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
+
+
+# =============================================================================
+# IMPORTAÇÃO EM LOTE (ZIP com extratos de vários clientes)
+# =============================================================================
+
+@posicao_bp.route('/posicao/importar_lote', methods=['GET', 'POST'])
+@login_required
+@limite_upload(UPLOAD_LOTE_TAMANHO_MAXIMO)
+def importar_lote():
+    if request.method == 'GET':
+        return render_template('posicoes/importar_lote.html', resultado=None)
+
+    db = create_session()
+    try:
+        global_services = GlobalServices(db)
+        sucesso, arquivo, mensagem = global_services.processar_upload_arquivo(extensoes=('zip',))
+
+        if not sucesso:
+            flash(mensagem, "error")
+            return redirect(url_for('posicao.importar_lote'))
+
+        print(f"[INFO] {mensagem}")
+        try:
+            resultado = ImportacaoLoteService.importar(arquivo, max_processos=IMPORTACAO_LOTE_PROCESSOS)
+        finally:
+            arquivo.close()
+
+        return render_template('posicoes/importar_lote.html', resultado=resultado)
+
+    except Exception as e:
+        traceback.print_exc()
+        print(f"[ERRO GERAL] Erro na importação em lote: {str(e)}")
+        flash(f"Erro na importação em lote: {str(e)}", "error")
+        return redirect(url_for('posicao.importar_lote'))
+    finally:
+        db.close()
@@ -5,14 +5,21 @@ Responsabilidade: algoritmos de balanceamento, matriz de risco pessoal, VP ideal
 distribuição de aportes e gestão de fatias entre objetivos.
 
 Depende de PosicaoService para cálculos de saldo por classe de risco.
+
+Todos os cálculos aceitam as_of (data de avaliação): prazos, matriz, VP ideal,
+IPCA (série 12 meses até a data) e totais (cotas históricas) passam a ser os
+daquela data. Sem as_of vale o instante da requisição (app.utils.tempo.agora).
 """
 
 from app.models.geld_models import (
     Objetivo, MatrizRisco, DistribuicaoObjetivo,
-    IndicadoresEconomicos, TipoObjetivoEnum,
+    TipoObjetivoEnum,
     PosicaoFundo, InfoFundo, RiscoEnum, SubtipoRiscoEnum
 )
 from app.services.posicao_service import PosicaoService
+from app.services.indicador_service import IndicadorService
+from app.services.cache_requisicao import memorizar_por_requisicao
+from app.utils.tempo import agora
 from datetime import datetime
 from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
@@ -22,16 +29,19 @@ class BalanceamentoService:
     """Serviço para balanceamento de carteiras com percentuais"""
 
     TAXA_REAL_ANUAL = 3.5  # IPCA + 3.5% ao ano
+    IPCA_PADRAO = 4.5      # sem indicadores gravados
 
     # ========== MÉTODOS DE CÁLCULO DE POSIÇÕES ==========
 
     @staticmethod
-    def calcular_totais_por_classe(cliente_id: int, session: Session) -> Dict[str, float]:
+    def calcular_totais_por_classe(
+        cliente_id: int, session: Session, as_of: Optional[datetime] = None
+    ) -> Dict[str, float]:
         """
         DELEGADO para PosicaoService — mantido aqui por compatibilidade.
         Prefira chamar PosicaoService.calcular_totais_por_classe() diretamente.
         """
-        return PosicaoService.calcular_totais_por_classe(cliente_id, session)
+        return PosicaoService.calcular_totais_por_classe(cliente_id, session, as_of)
 
     @staticmethod
     def calcular_valores_atuais_objetivos(
@@ -68,14 +78,20 @@ class BalanceamentoService:
     # ========== MÉTODOS DE MATRIZ DE RISCO ==========
 
     @staticmethod
-    def buscar_matriz_alvo(objetivo: Objetivo, session: Session) -> MatrizRisco:
-        """Busca matriz de risco baseada no prazo do objetivo."""
-        duracao = objetivo.duracao_meses
+    def buscar_matriz_alvo(objetivo: Objetivo, session: Session, as_of: Optional[datetime] = None) -> MatrizRisco:
+        """Busca matriz de risco baseada no prazo do objetivo (contado a partir de as_of, se informado)."""
+        duracao = objetivo.duracao_meses_em(as_of) if as_of else objetivo.duracao_meses
         tipo = objetivo.tipo_objetivo
 
         prazos = [12, 24, 36, 48, 60, 72, 84, 96, 108, 120, 132]
         prazo_arredondado = min(prazos, key=lambda x: abs(x - duracao))
 
+        return BalanceamentoService._buscar_matriz(tipo, prazo_arredondado, session)
+
+    @staticmethod
+    @memorizar_por_requisicao
+    def _buscar_matriz(tipo: TipoObjetivoEnum, prazo_arredondado: int, session: Session) -> MatrizRisco:
+        """Uma consulta por (tipo, prazo) na requisição: objetivos de prazo parecido usam a mesma matriz."""
         matriz = session.query(MatrizRisco).filter(
             MatrizRisco.tipo_objetivo == tipo,
             MatrizRisco.duracao_meses == prazo_arredondado
@@ -102,7 +118,21 @@ class BalanceamentoService:
     # ========== VALOR PRESENTE IDEAL ==========
 
     @staticmethod
-    def calcular_vp_ideal(objetivo: Objetivo, ipca_anual: float = None) -> float:
+    def ipca_anual(session: Session, as_of: Optional[datetime] = None) -> float:
+        """
+        IPCA anual dos indicadores mais recentes (IPCA_PADRAO se não houver).
+        Com as_of, o IPCA 12 meses da série local até essa data; sem ponto até lá, o atual.
+        """
+        if as_of is not None:
+            ponto = IndicadorService.ponto_em(session, IndicadorService.SERIE_IPCA_12M, as_of)
+            if ponto:
+                return float(ponto[1])
+
+        indicadores = IndicadorService.indicadores_atuais(session)
+        return float(indicadores.ipca) if indicadores and indicadores.ipca is not None else BalanceamentoService.IPCA_PADRAO
+
+    @staticmethod
+    def calcular_vp_ideal(objetivo: Objetivo, ipca_anual: float = None, as_of: Optional[datetime] = None) -> float:
         """
         Calcula Valor Presente Ideal.
         VP Ideal = valor necessário hoje para atingir objetivo sem aportes adicionais,
@@ -112,7 +142,7 @@ class BalanceamentoService:
         simplificando para: VP = valor_final / (1 + taxa_real_anual)^(n/12)
         """
         taxa_real_mensal = (1 + BalanceamentoService.TAXA_REAL_ANUAL / 100) ** (1/12) - 1
-        duracao          = objetivo.duracao_meses
+        duracao          = objetivo.duracao_meses_em(as_of) if as_of else objetivo.duracao_meses
         return float(objetivo.valor_final) / ((1 + taxa_real_mensal) ** duracao)
 
     # ========== GESTÃO DE FATIAS ==========
@@ -190,7 +220,8 @@ class BalanceamentoService:
     def processar_balanceamento(
         cliente_id: int,
         aportes_por_objetivo: List[Dict],
-        session: Session
+        session: Session,
+        as_of: Optional[datetime] = None
     ) -> Dict:
         """
         Processa balanceamento completo da carteira.
@@ -199,19 +230,17 @@ class BalanceamentoService:
             cliente_id: ID do cliente
             aportes_por_objetivo: [{'objetivo_id': int, 'valor_aporte': float}]
             session: SQLAlchemy session
+            as_of: Data de avaliação (None = agora); posições atuais a cotas dessa data
 
         Quando há APORTE:     novos_percentuais = novos_valores  / totais_pos_aporte
         Quando NÃO há aporte: novos_percentuais = estado_alvo    / totais_pos_redistribuicao
         Quando aporte é negativo: verifica o limite e faz a retirada dentro do objetivo
         """
         # 1. Buscar IPCA
-        ipca = session.query(IndicadoresEconomicos).order_by(
-            IndicadoresEconomicos.data_atualizacao.desc()
-        ).first()
-        ipca_anual = float(ipca.ipca) if ipca else 4.5
+        ipca_anual = BalanceamentoService.ipca_anual(session, as_of)
 
         # 2. Totais atuais por classe
-        totais_atuais = PosicaoService.calcular_totais_por_classe(cliente_id, session)
+        totais_atuais = PosicaoService.calcular_totais_por_classe(cliente_id, session, as_of)
 
         # 3. Valores atuais por objetivo (usando fatias salvas)
         valores_por_objetivo = BalanceamentoService.calcular_valores_atuais_objetivos(
@@ -231,7 +260,7 @@ class BalanceamentoService:
                     f"Saque de R$ {abs(valor_aporte):,.0f} excede o saldo do objetivo "
                     f"'{objetivo.nome_objetivo}' (R$ {valor_atual_obj:,.0f})"
                  )
-            matriz       = BalanceamentoService.buscar_matriz_alvo(objetivo, session)
+            matriz       = BalanceamentoService.buscar_matriz_alvo(objetivo, session, as_of)
 
             if valor_aporte != 0:
                 distribuicao_aporte = BalanceamentoService.distribuir_aporte_por_matriz(valor_aporte, matriz)
@@ -267,12 +296,13 @@ class BalanceamentoService:
                 'alto':      estado_alvo['alto']      - novos_valores['alto']
             }
 
-            vp_ideal = BalanceamentoService.calcular_vp_ideal(objetivo, ipca_anual)
+            vp_ideal = BalanceamentoService.calcular_vp_ideal(objetivo, ipca_anual, as_of)
+            prazo_meses = objetivo.duracao_meses_em(as_of) if as_of else objetivo.duracao_meses
 
             resultados_objetivos.append({
                 'objetivo_id':     objetivo.id,
                 'objetivo_nome':   objetivo.nome_objetivo,
-                'prazo_meses':     objetivo.duracao_meses,
+                'prazo_meses':     prazo_meses,
                 'valor_desejado':  float(objetivo.valor_final),
                 'vp_ideal':        vp_ideal,
                 'gap_vp':          vp_ideal - novos_valores['total'],
@@ -358,7 +388,8 @@ class BalanceamentoService:
 
         return {
             'cliente_id':              cliente_id,
-            'data_calculo':            datetime.now().isoformat(),
+            'data_calculo':            (as_of or agora()).isoformat(),
+            'as_of':                   as_of.isoformat() if as_of else None,
             'ipca_usado':              ipca_anual,
             'total_aporte':            total_aporte,
             'totais_atuais':           totais_atuais,
@@ -376,10 +407,11 @@ class BalanceamentoService:
     def executar_cascata_e_rebalancear(
         cliente_id: int,
         aportes_por_objetivo: List[Dict],
-        session: Session
+        session: Session,
+        as_of: Optional[datetime] = None
     ) -> Dict:
         """
-        Executa balanceamento com cascata de excedentes.
+        Executa balanceamento com cascata de excedentes (avaliado em as_of, se informado).
 
         Quando um objetivo teria montante pós-aporte > VP Ideal, o excedente é
         redirecionado como aporte para objetivos com déficit, priorizando menor prazo.
@@ -412,7 +444,7 @@ class BalanceamentoService:
             ]
 
             resultado = BalanceamentoService.processar_balanceamento(
-                cliente_id, aportes_lista, session
+                cliente_id, aportes_lista, session, as_of
             )
 
             doadores = [
@@ -478,7 +510,7 @@ class BalanceamentoService:
             for obj_id, valor in aportes_dict.items()
         ]
         resultado = BalanceamentoService.processar_balanceamento(
-            cliente_id, aportes_finais, session
+            cliente_id, aportes_finais, session, as_of
         )
 
         resultado['historico_cascata'] = historico_cascata
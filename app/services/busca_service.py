@@ -0,0 +1,111 @@
+"""
+Serviço de busca - typeahead de fundos e clientes
+
+Consulta os índices FTS5 busca_fundos e busca_clientes (criados pelo init_db e
+mantidos por triggers, ver geld_models.TABELAS_BUSCA). Cada palavra digitada
+vira um prefixo ("xp mac" -> "xp"* "mac"*), sem diferença de acentos e caixa,
+e os resultados vêm em ordem de relevância (bm25). O ORDER BY rank com LIMIT
+fica dentro da consulta FTS5, que o otimiza (só guarda os `limite` melhores), e
+a junção com a tabela de origem é feita depois, só para essas linhas.
+
+Sem FTS5 no SQLite, cai para o prefixo do nome da listagem paginada (CatalogoService).
+
+Usado por:
+- fundos.py (rota) - /fundos/buscar (seletor de fundo em add_posicao)
+- cliente.py (rota) - /clientes/buscar
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.services.catalogo_service import CatalogoService
+
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+MAX_PALAVRAS = 8
+
+
+def montar_consulta(termo: Optional[str]) -> Optional[str]:
+    """Expressão MATCH com um prefixo por palavra; None se não há o que buscar"""
+    palavras = re.findall(r'\w+', termo or '')[:MAX_PALAVRAS]
+    if not palavras:
+        return None
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def _limitar(limite) -> int:
+    try:
+        return max(1, min(int(limite), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO
+
+
+class BuscaService:
+
+    @staticmethod
+    def buscar_fundos(session: Session, termo: str, limite: int = LIMITE_PADRAO) -> List[Dict]:
+        """
+        Fundos cujo nome, classe ANBIMA ou CNPJ começam com as palavras digitadas.
+
+        Returns:
+            [{'id', 'nome_fundo', 'cnpj', 'classe_anbima', 'risco', 'subtipo_risco'}], mais relevantes primeiro
+        """
+        consulta = montar_consulta(termo)
+        if not consulta:
+            return []
+        limite = _limitar(limite)
+
+        try:
+            linhas = session.execute(text(
+                "SELECT f.id, f.nome_fundo, f.cnpj, f.classe_anbima, f.risco, f.subtipo_risco "
+                "FROM (SELECT rowid AS id, rank FROM busca_fundos WHERE busca_fundos MATCH :consulta "
+                "      ORDER BY rank LIMIT :limite) c "
+                "JOIN info_fundos f ON f.id = c.id ORDER BY c.rank"
+            ), {'consulta': consulta, 'limite': limite}).mappings().all()
+            return [dict(linha) for linha in linhas]
+        except OperationalError as e:
+            print(f"[AVISO] Busca textual de fundos indisponível, usando prefixo do nome: {e}")
+            session.rollback()
+
+        fundos = CatalogoService.listar_fundos(session, nome=termo, por_pagina=limite)['itens']
+        return [{
+            'id': fundo.id,
+            'nome_fundo': fundo.nome_fundo,
+            'cnpj': fundo.cnpj,
+            'classe_anbima': fundo.classe_anbima,
+            'risco': fundo.risco.name if fundo.risco else None,
+            'subtipo_risco': fundo.subtipo_risco.name if fundo.subtipo_risco else None,
+        } for fundo in fundos]
+
+    @staticmethod
+    def buscar_clientes(session: Session, termo: str, limite: int = LIMITE_PADRAO) -> List[Dict]:
+        """
+        Clientes cujo nome, email ou CPF começam com as palavras digitadas.
+
+        Returns:
+            [{'id', 'nome', 'email', 'cpf'}], mais relevantes primeiro
+        """
+        consulta = montar_consulta(termo)
+        if not consulta:
+            return []
+        limite = _limitar(limite)
+
+        try:
+            linhas = session.execute(text(
+                "SELECT c.id, c.nome, c.email, c.cpf "
+                "FROM (SELECT rowid AS id, rank FROM busca_clientes WHERE busca_clientes MATCH :consulta "
+                "      ORDER BY rank LIMIT :limite) b "
+                "JOIN clientes c ON c.id = b.id ORDER BY b.rank"
+            ), {'consulta': consulta, 'limite': limite}).mappings().all()
+            return [dict(linha) for linha in linhas]
+        except OperationalError as e:
+            print(f"[AVISO] Busca textual de clientes indisponível, usando prefixo do nome: {e}")
+            session.rollback()
+
+        clientes = CatalogoService.listar_clientes(session, nome=termo, por_pagina=limite)['itens']
+        return [{'id': c.id, 'nome': c.nome, 'email': c.email, 'cpf': c.cpf} for c in clientes]
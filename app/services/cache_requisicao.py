@@ -0,0 +1,57 @@
+"""
+Cache por requisição (flask.g) - instante de referência e resultados repetidos
+
+Uma tela como a área do cliente pede os mesmos totais por classe, a mesma
+matriz de risco e o mesmo IPCA várias vezes (direto e via BalanceamentoService),
+e cada objetivo.duracao_meses olhava o relógio de novo. Dentro de uma requisição:
+- app.utils.tempo.agora() devolve sempre o mesmo instante: prazos, VP ideal e
+  datas de cálculo da página saem todos do mesmo momento;
+- funções com @memorizar_por_requisicao rodam uma vez por argumentos; as
+  chamadas seguintes devolvem o resultado guardado em g.
+
+Fora de uma requisição (linha de comando, importação em lote) nada é guardado
+e as funções rodam sempre.
+
+Quem grava algo que um resultado guardado usa chama limpar() (ex.:
+PosicaoService.atualizar_totais_clientes).
+"""
+
+import copy
+import inspect
+from functools import wraps
+
+from flask import g, has_request_context
+
+
+def limpar() -> None:
+    """Descarta os resultados guardados na requisição (o instante de referência fica)"""
+    if has_request_context():
+        g.pop('memo_requisicao', None)
+
+
+def memorizar_por_requisicao(funcao):
+    """
+    Guarda o resultado por (função, argumentos) durante a requisição.
+    Os argumentos precisam ser hasheáveis; a sessão entra na chave, então
+    sessões diferentes não compartilham resultados. Dicionários e listas
+    voltam como cópia, para quem chama poder alterá-los. Os argumentos são
+    normalizados pela assinatura: f(1, s) e f(1, s, as_of=None) são a mesma chamada.
+    """
+    assinatura = inspect.signature(funcao)
+
+    @wraps(funcao)
+    def memorizada(*args, **kwargs):
+        if not has_request_context():
+            return funcao(*args, **kwargs)
+
+        memo = g.setdefault('memo_requisicao', {})
+        argumentos = assinatura.bind(*args, **kwargs)
+        argumentos.apply_defaults()
+        chave = (funcao.__qualname__, tuple(argumentos.arguments.items()))
+        if chave not in memo:
+            memo[chave] = funcao(*args, **kwargs)
+
+        valor = memo[chave]
+        return copy.copy(valor) if isinstance(valor, (dict, list)) else valor
+
+    return memorizada
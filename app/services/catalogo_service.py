@@ -0,0 +1,210 @@
+"""
+Serviço de catálogo - listagens paginadas de fundos e clientes
+
+O catálogo de fundos cresce sem parar (fundos DUMMY/99./98./97. cadastrados
+pelas importações), então as telas de listagem não carregam mais a tabela
+inteira. Os filtros viram WHERE no banco e a paginação é por chave (keyset):
+cada página continua depois da última linha da anterior, pela ordem
+(nome, id), sem OFFSET. Com os índices compostos de InfoFundo e Cliente o custo
+de uma página não depende do tamanho do catálogo.
+
+Os cursores (apos/antes) são a chave da linha de borda codificada em base64,
+para ir e voltar pela URL.
+
+Usado por:
+- fundos.py (rota) - listar_fundos
+- cliente.py (rota) - listar_clientes
+"""
+
+import base64
+import json
+import re
+from typing import Callable, List, Optional, Sequence, TypedDict
+
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.orm import Query, Session
+
+from app.config import CATALOGO_POR_PAGINA
+from app.models.geld_models import (
+    Cliente, InfoFundo, BancoEnum, RiscoEnum, StatusEnum, StatusFundoEnum, SubtipoRiscoEnum
+)
+from app.utils.nome_fundo import normalizar_nome_fundo
+
+
+# Filtro de risco da listagem de fundos (mesmos valores do select da tela)
+CLASSES_RISCO = ('baixo-di', 'baixo-rfx', 'moderado', 'alto')
+
+# Posições da pontuação no CNPJ formatado XX.XXX.XXX/XXXX-XX (índice do dígito -> separador antes dele)
+_PONTUACAO_CNPJ = {2: '.', 5: '.', 8: '/', 12: '-'}
+
+
+class Pagina(TypedDict):
+    itens: list
+    proximo: Optional[str]   # cursor da próxima página (None = última)
+    anterior: Optional[str]  # cursor da página anterior (None = primeira)
+
+
+def codificar_cursor(valores: Sequence) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(valores)).encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor: Optional[str]) -> Optional[list]:
+    """Cursor inválido (URL editada à mão) volta para a primeira página"""
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    return valores if isinstance(valores, list) else None
+
+
+def _intervalo_prefixo(coluna, prefixo: str):
+    """coluna começa com prefixo, como intervalo (>= prefixo e < próximo prefixo): usa o índice"""
+    fim = prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+    return and_(coluna >= prefixo, coluna < fim)
+
+
+def _formatar_prefixo_cnpj(digitos: str) -> str:
+    """'1234567' -> '12.345.67': prefixo dos dígitos na forma em que o CNPJ formatado é gravado"""
+    return ''.join(_PONTUACAO_CNPJ.get(i, '') + digito for i, digito in enumerate(digitos[:14]))
+
+
+def _paginar(query: Query, colunas: list, chave: Callable, por_pagina: int,
+             apos: Optional[str], antes: Optional[str]) -> Pagina:
+    """
+    Página de até por_pagina linhas na ordem de colunas, continuando depois de
+    `apos` ou terminando antes de `antes`.
+
+    Args:
+        chave: valores das colunas de ordenação para uma linha (para montar os cursores)
+    """
+    ordem = tuple_(*colunas)
+    valores_antes = decodificar_cursor(antes)
+    valores_apos = None if valores_antes else decodificar_cursor(apos)
+
+    if valores_antes:
+        linhas = query.filter(ordem < tuple_(*valores_antes)).order_by(
+            *[coluna.desc() for coluna in colunas]
+        ).limit(por_pagina + 1).all()
+
+        if linhas:
+            ha_anteriores = len(linhas) > por_pagina
+            linhas = list(reversed(linhas[:por_pagina]))
+            return {
+                'itens': linhas,
+                'proximo': codificar_cursor(chave(linhas[-1])),
+                'anterior': codificar_cursor(chave(linhas[0])) if ha_anteriores else None,
+            }
+        # Nada antes do cursor (linhas excluídas nesse meio tempo): primeira página
+
+    if valores_apos:
+        query = query.filter(ordem > tuple_(*valores_apos))
+
+    linhas = query.order_by(*colunas).limit(por_pagina + 1).all()
+    ha_proximas = len(linhas) > por_pagina
+    linhas = linhas[:por_pagina]
+
+    return {
+        'itens': linhas,
+        'proximo': codificar_cursor(chave(linhas[-1])) if ha_proximas else None,
+        'anterior': codificar_cursor(chave(linhas[0])) if valores_apos and linhas else None,
+    }
+
+
+class CatalogoService:
+
+    @staticmethod
+    def listar_fundos(session: Session, nome: str = None, cnpj: str = None, classe_risco: str = None,
+                      status: str = None, classe_anbima: str = None, apos: str = None, antes: str = None,
+                      por_pagina: int = CATALOGO_POR_PAGINA) -> Pagina:
+        """
+        Página de fundos em ordem de nome, com filtros aplicados no banco.
+
+        Args:
+            session: Sessão do banco
+            nome: Início do nome (sem diferença de acentos, caixa e conectivos)
+            cnpj: Início do CNPJ, com ou sem pontuação
+            classe_risco: Um de CLASSES_RISCO
+            status: Valor de StatusFundoEnum
+            classe_anbima: Início da classe ANBIMA
+            apos, antes: Cursores de Pagina
+
+        Returns:
+            Pagina com os InfoFundo
+        """
+        query = session.query(InfoFundo)
+
+        nome = normalizar_nome_fundo(nome)
+        if nome:
+            query = query.filter(_intervalo_prefixo(InfoFundo.nome_normalizado, nome))
+
+        cnpj = (cnpj or '').strip()
+        if cnpj:
+            digitos = re.sub(r'\D', '', cnpj)
+            prefixos = {cnpj, digitos, _formatar_prefixo_cnpj(digitos)} - {''}
+            query = query.filter(or_(*[_intervalo_prefixo(InfoFundo.cnpj, prefixo) for prefixo in prefixos]))
+
+        if classe_risco == 'baixo-di':
+            query = query.filter(InfoFundo.risco == RiscoEnum.baixo, InfoFundo.subtipo_risco == SubtipoRiscoEnum.di)
+        elif classe_risco == 'baixo-rfx':
+            # Sem subtipo conta como RFx, como na tela e em PosicaoService
+            query = query.filter(
+                InfoFundo.risco == RiscoEnum.baixo,
+                or_(InfoFundo.subtipo_risco.is_(None), InfoFundo.subtipo_risco != SubtipoRiscoEnum.di)
+            )
+        elif classe_risco in ('moderado', 'alto'):
+            query = query.filter(InfoFundo.risco == RiscoEnum[classe_risco])
+
+        if status in StatusFundoEnum.__members__:
+            query = query.filter(InfoFundo.status_fundo == StatusFundoEnum[status])
+
+        classe_anbima = (classe_anbima or '').strip()
+        if classe_anbima:
+            query = query.filter(_intervalo_prefixo(InfoFundo.classe_anbima, classe_anbima))
+
+        return _paginar(query, [InfoFundo.nome_normalizado, InfoFundo.id],
+                        lambda fundo: (fundo.nome_normalizado, fundo.id), por_pagina, apos, antes)
+
+    @staticmethod
+    def classes_anbima(session: Session, palavras: int = 2) -> List[str]:
+        """Classes ANBIMA cadastradas, resumidas às primeiras palavras (opções do filtro)"""
+        classes = session.query(InfoFundo.classe_anbima).filter(InfoFundo.classe_anbima.isnot(None)).distinct()
+        return sorted({' '.join(classe.split()[:palavras]) for (classe,) in classes if classe.strip()})
+
+    @staticmethod
+    def listar_clientes(session: Session, nome: str = None, cpf: str = None, status: str = None,
+                        banco: str = None, apos: str = None, antes: str = None,
+                        por_pagina: int = CATALOGO_POR_PAGINA) -> Pagina:
+        """
+        Página de clientes em ordem de nome, com filtros aplicados no banco.
+
+        Args:
+            session: Sessão do banco
+            nome: Início do nome (sem diferença de caixa)
+            cpf: Início do CPF (só dígitos são considerados)
+            status: Valor de StatusEnum
+            banco: Valor de BancoEnum
+            apos, antes: Cursores de Pagina
+
+        Returns:
+            Pagina com os Cliente
+        """
+        query = session.query(Cliente)
+
+        nome = (nome or '').strip()
+        if nome:
+            query = query.filter(Cliente.nome.istartswith(nome, autoescape=True))
+
+        cpf = re.sub(r'\D', '', cpf or '')
+        if cpf:
+            query = query.filter(_intervalo_prefixo(Cliente.cpf, cpf))
+
+        if status in StatusEnum.__members__:
+            query = query.filter(Cliente.status == StatusEnum[status])
+
+        if banco in BancoEnum.__members__:
+            query = query.filter(Cliente.banco == BancoEnum[banco])
+
+        return _paginar(query, [Cliente.nome, Cliente.id],
+                        lambda cliente: (cliente.nome, cliente.id), por_pagina, apos, antes)
@@ -0,0 +1,33 @@
+"""
+Utilitários de CNPJ - funções puras, sem sessão de banco
+
+Usados pelos extratores de extratos (parsing), pelo GlobalServices e pelos
+serviços que casam fundos por CNPJ.
+"""
+
+import re
+
+
+def validar_cnpj(cnpj):
+    """ARGS: cnpj (qlq formato) retorna: tupla(is_valid, cnpj_normalizado, MSG)"""
+
+    cnpj_normalizado = re.sub(r'\D', '', cnpj)
+
+    if len(cnpj_normalizado) != 14:
+        return False, cnpj_normalizado, "CNPJ deve ter 14 dígitos"
+
+    return True, cnpj_normalizado, "CNPJ válido"
+
+
+def formatar_cnpj(cnpj_normalizado):
+    """Formata o CNPJ para o padrão XX.XXX.XXX/XXXX-XX"""
+
+    if len(cnpj_normalizado) != 14:
+        return cnpj_normalizado
+    return f"{cnpj_normalizado[:2]}.{cnpj_normalizado[2:5]}.{cnpj_normalizado[5:8]}/{cnpj_normalizado[8:12]}-{cnpj_normalizado[12:]}"
+
+
+def normalizar_cnpj(cnpj):
+    """Remove a pontuação (. / -) do CNPJ - chave usada para casar fundos e posições"""
+
+    return cnpj.replace('.', '').replace('/', '').replace('-', '')
@@ -0,0 +1,94 @@
+"""
+Serviço de cotas históricas - valor da cota de cada fundo em uma data
+
+CotaUpdateService grava em cotas_historicas todos os pontos que lê da CVM
+(informe diário FI e mensal FII) para os fundos cadastrados. Com o histórico,
+posições e objetivos podem ser avaliados em uma data passada (as_of) em vez de
+só pela última valor_cota.
+
+A cota de um fundo em as_of é a do ponto mais recente com data <= as_of. Fundo
+sem nenhum ponto até essa data (sem CNPJ, dummy, cadastrado depois) usa a
+valor_cota atual: o as_of muda o preço, não a existência da posição.
+
+Usado por:
+- cota_update_service.py - grava os pontos lidos da CVM
+- posicao_service.py - totais por classe em uma data
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from app.models.geld_models import CotaHistorica, InfoFundo
+
+
+LOTE_CONSULTA = 500  # fundos por consulta IN (limite de variáveis do SQLite)
+
+
+class CotaHistoricaService:
+
+    @staticmethod
+    def subconsulta_cotas_em(session: Session, as_of: datetime):
+        """
+        Subconsulta (fundo_id, valor_cota) com a cota mais recente até as_of de cada
+        fundo que tem histórico. Para usar em OUTER JOIN com coalesce(valor_cota, InfoFundo.valor_cota).
+        """
+        ultimas = session.query(
+            CotaHistorica.fundo_id, func.max(CotaHistorica.data).label('data')
+        ).filter(CotaHistorica.data <= as_of).group_by(CotaHistorica.fundo_id).subquery()
+
+        return session.query(CotaHistorica.fundo_id, CotaHistorica.valor_cota).join(
+            ultimas, and_(CotaHistorica.fundo_id == ultimas.c.fundo_id, CotaHistorica.data == ultimas.c.data)
+        ).subquery()
+
+    @staticmethod
+    def cotas_em(session: Session, fundo_ids: Iterable[int], as_of: datetime) -> Dict[int, float]:
+        """
+        Returns:
+            {fundo_id: valor da cota em as_of} (valor_cota atual para fundos sem histórico até lá)
+        """
+        fundo_ids = list(set(fundo_ids))
+        cotas = CotaHistoricaService.subconsulta_cotas_em(session, as_of)
+
+        resultado = {}
+        for inicio in range(0, len(fundo_ids), LOTE_CONSULTA):
+            linhas = session.query(
+                InfoFundo.id, func.coalesce(cotas.c.valor_cota, InfoFundo.valor_cota)
+            ).outerjoin(cotas, cotas.c.fundo_id == InfoFundo.id).filter(
+                InfoFundo.id.in_(fundo_ids[inicio:inicio + LOTE_CONSULTA])
+            )
+            resultado.update({fundo_id: float(valor) for fundo_id, valor in linhas})
+        return resultado
+
+    @staticmethod
+    def registrar(session: Session, pontos: Iterable[Tuple[int, datetime, float]], fonte: str) -> int:
+        """
+        Grava os pontos (fundo_id, data, valor) que ainda não estão no histórico.
+        Sem commit.
+
+        Returns:
+            int - quantidade de pontos novos
+        """
+        novos = {(fundo_id, data): valor for fundo_id, data, valor in pontos}
+        if not novos:
+            return 0
+
+        fundo_ids = sorted({fundo_id for fundo_id, _ in novos})
+        inicio_periodo = min(data for _, data in novos)
+        fim_periodo = max(data for _, data in novos)
+
+        for inicio in range(0, len(fundo_ids), LOTE_CONSULTA):
+            existentes = session.query(CotaHistorica.fundo_id, CotaHistorica.data).filter(
+                CotaHistorica.fundo_id.in_(fundo_ids[inicio:inicio + LOTE_CONSULTA]),
+                CotaHistorica.data.between(inicio_periodo, fim_periodo)
+            )
+            for chave in existentes:
+                novos.pop(tuple(chave), None)
+
+        session.bulk_insert_mappings(CotaHistorica, [
+            {'fundo_id': fundo_id, 'data': data, 'valor_cota': valor, 'fonte': fonte}
+            for (fundo_id, data), valor in novos.items()
+        ])
+        return len(novos)
@@ -7,13 +7,27 @@ buscando dados da CVM (inf_diario_fi).
 Fluxo:
 1. Baixa inf_diario_fi do mês atual e do mês anterior
 2. Para cada fundo com CNPJ, busca no mês atual primeiro, fallback mês anterior
-3. Retorna resumo da operação
+3. Grava todos os pontos lidos dos fundos cadastrados em cotas_historicas
+   (avaliação em data passada, ver CotaHistoricaService)
+4. Retorna resumo da operação
+
+Modo incremental (padrão):
+- Guarda a data de competência CVM (DT_COMPTC) aplicada em cada fundo
+  e só altera fundos cuja data na fonte avançou.
+- Guarda ETag/Last-Modified de cada arquivo da CVM; se o arquivo não mudou
+  desde a última execução e nenhum fundo está pendente, o download e o
+  parsing são pulados.
+- Um arquivo pulado só cobre os fundos que foram encontrados nele no último
+  processamento (ArquivoFonteCVM.cnpjs_encontrados); os demais seguem para
+  o FII e, se não aparecerem, para nao_encontrados.
 """
 
 from datetime import datetime, timedelta
 import pandas as pd
-from app.models.geld_models import InfoFundo
+from app.models.geld_models import InfoFundo, ArquivoFonteCVM
 from app.services.extract_services import ExtractServices
+from app.services.cnpj_utils import normalizar_cnpj
+from app.services.cota_historica_service import CotaHistoricaService
 
 
 class CotaUpdateService:
@@ -26,64 +40,108 @@ class CotaUpdateService:
     # MÉTODO PRINCIPAL
     # =========================================================================
 
-    def atualizar_todas_cotas(self):
+    def atualizar_todas_cotas(self, incremental=True):
         """
         Atualiza valor_cota de todos os InfoFundo do banco.
         NÃO faz commit — responsabilidade da rota.
 
+        Args:
+            incremental: se True, só toca fundos cuja data CVM avançou e
+                         pula arquivos da CVM que não mudaram
+
         Returns:
             dict: {
                 'fi_atualizados': int,
+                'fii_atualizados': int,
+                'ja_atualizados': int,
                 'sem_cnpj': int,
                 'nao_encontrados': list[str],
+                'arquivos_inalterados': list[str],
+                'fundos_alterados': list[int],  # ids com valor_cota alterado
+                'cotas_historicas': int,        # pontos novos no histórico
                 'total': int
             }
         """
         resultado = {
             'fi_atualizados': 0,
             'fii_atualizados': 0,
+            'ja_atualizados': 0,
             'sem_cnpj': 0,
             'nao_encontrados': [],
+            'arquivos_inalterados': [],
+            'fundos_alterados': [],
+            'cotas_historicas': 0,
             'total': 0
         }
 
         # Todos os fundos do banco
         fundos = self.db.query(InfoFundo).all()
         resultado['total'] = len(fundos)
-        print(f"[COTAS] Iniciando atualização de {len(fundos)} fundos")
+        print(f"[COTAS] Iniciando atualização de {len(fundos)} fundos "
+              f"({'incremental' if incremental else 'completa'})")
 
         # Separar fundos com e sem CNPJ
         fundos_com_cnpj = []
         for fundo in fundos:
             if not fundo.cnpj or fundo.cnpj.strip() == '':
-                print(f"[COTAS] ⚠️  {fundo.nome_fundo[:40]}: sem CNPJ (pulado)")
                 resultado['sem_cnpj'] += 1
             else:
                 fundos_com_cnpj.append(fundo)
 
+        if resultado['sem_cnpj']:
+            print(f"[COTAS] {resultado['sem_cnpj']} fundos sem CNPJ (pulados)")
+
         if not fundos_com_cnpj:
             print("[COTAS] Nenhum fundo com CNPJ para atualizar")
             return resultado
 
         # Calcular meses a baixar
         mes_atual, mes_anterior = self._calcular_meses()
+        pendentes = [f for f in fundos_com_cnpj if f.data_cota_cvm is None]
+
+        fundos_por_cnpj = {}
+        for fundo in fundos_com_cnpj:
+            fundos_por_cnpj.setdefault(self._normalizar_cnpj(fundo.cnpj), []).append(fundo.id)
+        cnpjs = set(fundos_por_cnpj)
+        # CNPJs cuja cota veio de um arquivo pulado nesta execução
+        cnpjs_nao_relidos = set()
 
         print(f"\n[COTAS] Baixando dados FI...")
-        df_atual    = self.extract.baixar_inf_diario_mes(*mes_atual)
-        df_anterior = self.extract.baixar_inf_diario_mes(*mes_anterior)
+        frames_fi = []
+        for ano, mes in (mes_atual, mes_anterior):
+            url = self.extract.url_inf_diario_mes(ano, mes)
+            df = self._baixar_se_alterado(
+                url, incremental, pendentes, cnpjs, cnpjs_nao_relidos, resultado,
+                lambda ano=ano, mes=mes: self.extract.baixar_inf_diario_mes(ano, mes)
+            )
+            if not df.empty:
+                frames_fi.append(df)
+
+        df_fi = self._cotas_filtradas(frames_fi, cnpjs, 'DT_COMPTC', 'VL_QUOTA')
+        cotas_fi = self._ultimas_cotas(df_fi, 'DT_COMPTC', 'VL_QUOTA')
+        resultado['cotas_historicas'] += self._registrar_historico(
+            df_fi, fundos_por_cnpj, 'DT_COMPTC', 'VL_QUOTA', 'CVM_FI'
+        )
 
         nao_encontrados_fi = []
         for fundo in fundos_com_cnpj:
-            cnpj_norm = self._normalizar_cnpj(fundo.cnpj)
-            nova_cota = self._buscar_cota(cnpj_norm, df_atual, df_anterior)
+            cnpj = self._normalizar_cnpj(fundo.cnpj)
+            cotacao = cotas_fi.get(cnpj)
 
-            if nova_cota is not None:
-                self._atualizar_fundo(fundo, nova_cota)
-                resultado['fi_atualizados'] += 1
+            if cotacao is not None:
+                if self._aplicar_cotacao(fundo, cotacao, incremental):
+                    resultado['fi_atualizados'] += 1
+                    resultado['fundos_alterados'].append(fundo.id)
+                else:
+                    resultado['ja_atualizados'] += 1
+            elif cnpj in cnpjs_nao_relidos:
+                # A cota do fundo veio de um arquivo que não mudou e não foi relido
+                resultado['ja_atualizados'] += 1
             else:
                 nao_encontrados_fi.append(fundo)
 
         print(f"[COTAS] FI: {resultado['fi_atualizados']} atualizados, "
+              f"{resultado['ja_atualizados']} já atualizados, "
               f"{len(nao_encontrados_fi)} não encontrados")
 
         # ── ETAPA 2: FIIs (informe mensal, para os não encontrados no FI) ─────
@@ -91,29 +149,47 @@ class CotaUpdateService:
             print(f"\n[COTAS] Buscando {len(nao_encontrados_fi)} fundos no informe mensal FII...")
             ano_atual = mes_atual[0]
             ano_anterior = mes_anterior[0]
-
-            df_fii = self.extract.baixar_inf_mensal_fii(ano_atual)
-            # Se virou de ano (ex: janeiro), tenta também o ano anterior
-            if df_fii.empty or ano_anterior != ano_atual:
-                df_fii_anterior = self.extract.baixar_inf_mensal_fii(ano_anterior)
-                if not df_fii_anterior.empty:
-                    df_fii = pd.concat([df_fii, df_fii_anterior]).drop_duplicates()
+            pendentes_fii = [f for f in nao_encontrados_fi if f.data_cota_cvm is None]
+
+            anos = [ano_atual] if ano_anterior == ano_atual else [ano_atual, ano_anterior]
+            frames_fii = []
+            for ano in anos:
+                url = self.extract.url_inf_mensal_fii(ano)
+                df = self._baixar_se_alterado(
+                    url, incremental, pendentes_fii, cnpjs, cnpjs_nao_relidos, resultado,
+                    lambda ano=ano: self.extract.baixar_inf_mensal_fii(ano)
+                )
+                if not df.empty:
+                    frames_fii.append(df)
+
+            df_fii = self._cotas_filtradas(frames_fii, cnpjs, 'Data_Referencia', 'Valor_Patrimonial_Cotas')
+            cotas_fii = self._ultimas_cotas(df_fii, 'Data_Referencia', 'Valor_Patrimonial_Cotas')
+            resultado['cotas_historicas'] += self._registrar_historico(
+                df_fii, fundos_por_cnpj, 'Data_Referencia', 'Valor_Patrimonial_Cotas', 'CVM_FII'
+            )
 
             for fundo in nao_encontrados_fi:
-                cnpj_norm = self._normalizar_cnpj(fundo.cnpj)
-                nova_cota = self._buscar_cota_fii(cnpj_norm, df_fii)
-
-                if nova_cota is not None:
-                    self._atualizar_fundo(fundo, nova_cota)
-                    resultado['fii_atualizados'] += 1
+                cnpj = self._normalizar_cnpj(fundo.cnpj)
+                cotacao = cotas_fii.get(cnpj)
+
+                if cotacao is not None:
+                    if self._aplicar_cotacao(fundo, cotacao, incremental):
+                        resultado['fii_atualizados'] += 1
+                        resultado['fundos_alterados'].append(fundo.id)
+                    else:
+                        resultado['ja_atualizados'] += 1
+                elif cnpj in cnpjs_nao_relidos:
+                    resultado['ja_atualizados'] += 1
                 else:
                     resultado['nao_encontrados'].append(fundo.nome_fundo)
                     print(f"[COTAS] ❌ {fundo.nome_fundo[:40]}: não encontrado em FI nem FII")
 
         print(f"\n[COTAS] Concluído — FI: {resultado['fi_atualizados']} | "
               f"FII: {resultado['fii_atualizados']} | "
+              f"Já atualizados: {resultado['ja_atualizados']} | "
               f"Não encontrados: {len(resultado['nao_encontrados'])} | "
-              f"Sem CNPJ: {resultado['sem_cnpj']}")
+              f"Sem CNPJ: {resultado['sem_cnpj']} | "
+              f"Pontos no histórico: {resultado['cotas_historicas']}")
 
         return resultado
 
@@ -137,65 +213,140 @@ class CotaUpdateService:
 
         return mes_atual, mes_anterior
 
-    def _buscar_cota(self, cnpj_norm, df_atual, df_anterior):
+    def _baixar_se_alterado(self, url, incremental, pendentes, cnpjs, cnpjs_nao_relidos, resultado, baixar):
         """
-        Busca o valor de cota mais recente para um CNPJ.
-        Prioriza mês atual, faz fallback para mês anterior.
+        Baixa e parseia um arquivo da CVM apenas se ele mudou desde o último processamento.
 
-        Args:
-            cnpj_norm: CNPJ sem pontuação
-            df_atual: DataFrame do mês atual (pode ser vazio)
-            df_anterior: DataFrame do mês anterior (pode ser vazio)
+        O arquivo é considerado inalterado quando ETag/Last-Modified batem com
+        os registrados em ArquivoFonteCVM e nenhum fundo sem cota CVM foi
+        cadastrado/editado depois desse processamento. Ao pular, os CNPJs
+        encontrados nele da última vez entram em cnpjs_nao_relidos.
+        Os validadores novos e os CNPJs dos fundos cadastrados presentes no
+        arquivo são registrados na sessão (commit fica com a rota).
 
         Returns:
-            float | None
+            DataFrame (vazio se o arquivo foi pulado ou o download falhou)
+        """
+        nome_arquivo = url.rsplit('/', 1)[-1]
+        validadores = self.extract.verificar_arquivo_cvm(url) if incremental else None
+        registro = self.db.query(ArquivoFonteCVM).filter_by(nome_arquivo=nome_arquivo).first()
+
+        if (validadores and registro and
+                registro.etag == validadores['etag'] and
+                registro.last_modified == validadores['last_modified'] and
+                registro.cnpjs_encontrados is not None and
+                not self._tem_fundo_novo(pendentes, registro.data_processamento)):
+            print(f"[COTAS] {nome_arquivo} inalterado desde "
+                  f"{registro.data_processamento:%d/%m/%Y %H:%M} — parsing pulado")
+            resultado['arquivos_inalterados'].append(nome_arquivo)
+            cnpjs_nao_relidos.update(c for c in registro.cnpjs_encontrados.split(',') if c)
+            return pd.DataFrame()
+
+        df = baixar()
+
+        if validadores and not df.empty:
+            if not registro:
+                registro = ArquivoFonteCVM(nome_arquivo=nome_arquivo)
+                self.db.add(registro)
+            registro.etag = validadores['etag']
+            registro.last_modified = validadores['last_modified']
+            registro.data_processamento = datetime.now()
+            registro.cnpjs_encontrados = ','.join(sorted(set(df['CNPJ_NORM']) & cnpjs))
+
+        return df
+
+    def _tem_fundo_novo(self, pendentes, data_processamento):
         """
-        for df in [df_atual, df_anterior]:
-            if df.empty:
-                continue
+        True se algum fundo sem cota CVM foi cadastrado/editado após o processamento do arquivo.
+        Fundo sem data_atualizacao não mudou desde então (dummy, CNPJ fora da CVM).
+        """
+        return any(
+            f.data_atualizacao is not None and f.data_atualizacao > data_processamento
+            for f in pendentes
+        )
 
-            registros = df[df['CNPJ_NORM'] == cnpj_norm]
+    def _cotas_filtradas(self, frames, cnpjs, coluna_data, coluna_valor):
+        """
+        Junta os DataFrames da CVM só com as linhas válidas dos CNPJs de interesse.
 
-            if not registros.empty:
-                mais_recente = registros.sort_values('DT_COMPTC', ascending=False).iloc[0]
-                return float(mais_recente['VL_QUOTA'])
+        Args:
+            frames: lista de DataFrames com CNPJ_NORM
+            cnpjs: set de CNPJs normalizados dos fundos cadastrados
+            coluna_data: 'DT_COMPTC' (FI) ou 'Data_Referencia' (FII)
+            coluna_valor: 'VL_QUOTA' (FI) ou 'Valor_Patrimonial_Cotas' (FII)
 
-        return None
+        Returns:
+            DataFrame [CNPJ_NORM, coluna_data (datetime), coluna_valor > 0] (vazio sem frames)
+        """
+        if not frames:
+            return pd.DataFrame(columns=['CNPJ_NORM', coluna_data, coluna_valor])
+
+        df = pd.concat(
+            [f.loc[f['CNPJ_NORM'].isin(cnpjs), ['CNPJ_NORM', coluna_data, coluna_valor]] for f in frames],
+            ignore_index=True
+        )
+        df[coluna_data] = pd.to_datetime(df[coluna_data], errors='coerce')
+        df = df.dropna(subset=[coluna_data, coluna_valor])
+        return df[df[coluna_valor] > 0]
+
+    def _ultimas_cotas(self, df, coluna_data, coluna_valor):
+        """
+        Reduz as cotas filtradas (_cotas_filtradas) à mais recente de cada CNPJ.
 
-    def _buscar_cota_fii(self, cnpj_norm, df_fii):
+        Returns:
+            dict {cnpj_norm: (data_competencia: datetime, valor: float)}
         """
-        Busca o valor patrimonial da cota mais recente para um FII.
+        if df.empty:
+            return {}
 
-        Args:
-            cnpj_norm: CNPJ sem pontuação
-            df_fii: DataFrame do informe mensal FII
+        ultimas = df.sort_values(coluna_data).drop_duplicates('CNPJ_NORM', keep='last')
+
+        return {
+            cnpj: (data.to_pydatetime(), float(valor))
+            for cnpj, data, valor in zip(ultimas['CNPJ_NORM'], ultimas[coluna_data], ultimas[coluna_valor])
+        }
+
+    def _registrar_historico(self, df, fundos_por_cnpj, coluna_data, coluna_valor, fonte):
+        """
+        Grava em cotas_historicas todos os pontos lidos dos fundos cadastrados (sem commit).
 
         Returns:
-            float | None
+            int: pontos novos
         """
-        if df_fii.empty:
-            return None
+        if df.empty:
+            return 0
 
-        registros = df_fii[df_fii['CNPJ_NORM'] == cnpj_norm]
+        pontos = (
+            (fundo_id, data.to_pydatetime(), float(valor))
+            for cnpj, data, valor in zip(df['CNPJ_NORM'], df[coluna_data], df[coluna_valor])
+            for fundo_id in fundos_por_cnpj.get(cnpj, ())
+        )
+        return CotaHistoricaService.registrar(self.db, pontos, fonte)
 
-        if registros.empty:
-            return None
+    def _aplicar_cotacao(self, fundo, cotacao, incremental):
+        """
+        Aplica a cotação ao fundo se a data de competência avançou (modo incremental)
+        ou sempre (modo completo). Sem commit.
 
-        mais_recente = registros.sort_values('Data_Referencia', ascending=False).iloc[0]
-        valor = mais_recente['Valor_Patrimonial_Cotas']
+        Returns:
+            bool: True se o fundo foi alterado
+        """
+        data_competencia, nova_cota = cotacao
 
-        if pd.isna(valor) or valor <= 0:
-            return None
+        if incremental and fundo.data_cota_cvm and data_competencia <= fundo.data_cota_cvm:
+            return False
 
-        return float(valor)
+        self._atualizar_fundo(fundo, nova_cota, data_competencia)
+        return True
 
-    def _atualizar_fundo(self, fundo, nova_cota):
+    def _atualizar_fundo(self, fundo, nova_cota, data_competencia=None):
         """Aplica nova cota ao objeto ORM (sem commit)."""
         valor_antigo = float(fundo.valor_cota) if fundo.valor_cota else 0.0
         fundo.valor_cota = nova_cota
         fundo.data_atualizacao = datetime.now()
+        fundo.data_cota_cvm = data_competencia
         print(f"[COTAS] ✅ {fundo.nome_fundo[:40]}: {valor_antigo:.4f} → {nova_cota:.4f}")
 
     def _normalizar_cnpj(self, cnpj):
         """Remove pontuação do CNPJ."""
-        return cnpj.replace('.', '').replace('/', '').replace('-', '')
\ No newline at end of file
+        return normalizar_cnpj(cnpj)
\ No newline at end of file
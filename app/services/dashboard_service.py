@@ -0,0 +1,75 @@
+"""
+Serviço do dashboard - snapshot pré-calculado das métricas gerais
+
+Responsabilidade: manter a linha única de EstatisticasDashboard em dia, para
+que a página inicial não faça agregações nem chamadas externas.
+
+Quem atualiza o snapshot:
+- rotas que escrevem clientes, fundos, cotas ou posições (após o commit)
+- atualização de indicadores econômicos (IPCA)
+"""
+
+from app.models.geld_models import (
+    Cliente, StatusEnum, InfoFundo, PosicaoFundo, IndicadoresEconomicos, EstatisticasDashboard
+)
+from app.services.indicador_service import IndicadorService
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from datetime import datetime
+
+
+class DashboardService:
+
+    @staticmethod
+    def obter_snapshot(session: Session) -> EstatisticasDashboard:
+        """
+        Leitura de uma linha. Só calcula se o snapshot ainda não existir.
+        """
+        snapshot = session.query(EstatisticasDashboard).first()
+        if snapshot is None:
+            snapshot = DashboardService.atualizar_snapshot(session)
+        return snapshot
+
+    @staticmethod
+    def atualizar_snapshot(session: Session) -> EstatisticasDashboard:
+        """
+        Recalcula todas as métricas do dashboard e faz commit.
+        Falhas são apenas registradas: o snapshot nunca deve derrubar a escrita que o disparou.
+        """
+        try:
+            snapshot = session.query(EstatisticasDashboard).first()
+            if snapshot is None:
+                snapshot = EstatisticasDashboard()
+                session.add(snapshot)
+
+            contagem_status = dict(
+                session.query(Cliente.status, func.count(Cliente.id)).group_by(Cliente.status).all()
+            )
+            snapshot.clientes_ativos = contagem_status.get(StatusEnum.ativo, 0)
+            snapshot.clientes_inativos = contagem_status.get(StatusEnum.inativo, 0)
+            snapshot.num_fundos = session.query(func.count(InfoFundo.id)).scalar() or 0
+            snapshot.capital_administrado = float(
+                session.query(func.sum(PosicaoFundo.cotas * InfoFundo.valor_cota))
+                .join(InfoFundo, PosicaoFundo.fundo_id == InfoFundo.id)
+                .scalar() or 0.0
+            )
+
+            indicadores = session.query(IndicadoresEconomicos).first()
+            if indicadores:
+                snapshot.ipca = indicadores.ipca
+                snapshot.ipca_mes = indicadores.ipca_mes
+                snapshot.data_indicadores = indicadores.data_atualizacao
+
+            ultimo_ipca_mensal = IndicadorService(session).ultimo_ponto(IndicadorService.SERIE_IPCA_MENSAL)
+            if ultimo_ipca_mensal:
+                data_referencia, snapshot.ipca_mes_anterior = ultimo_ipca_mensal
+                snapshot.mes_referencia_ipca = data_referencia.strftime('%m/%Y')
+
+            snapshot.data_atualizacao = datetime.now()
+            session.commit()
+            return snapshot
+
+        except Exception as e:
+            session.rollback()
+            print(f"[ERRO] Falha ao atualizar snapshot do dashboard: {str(e)}")
+            return session.query(EstatisticasDashboard).first()
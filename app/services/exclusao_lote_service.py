@@ -0,0 +1,141 @@
+"""
+Exclusão em lote de fundos e posições
+
+Em vez de buscar e apagar linha a linha, cada lote de ids vira poucas consultas:
+uma leitura dos registros selecionados (com a contagem de posições por fundo,
+agrupada por fundo_id) e um único DELETE ... WHERE id IN (...). Limpar centenas
+de fundos dummy antigos é uma operação só no banco.
+
+Tudo na sessão recebida, sem commit: a rota confirma a exclusão junto com os
+totais por classe.
+
+Devolve um relatório por id, para a rota montar as mensagens:
+- fundos:   {fundo_id: {'status': EXCLUIDO | EM_USO | NAO_ENCONTRADO, 'nome': str, 'posicoes': int}}
+- posições: {posicao_id: {'status': EXCLUIDO | OUTRO_CLIENTE | NAO_ENCONTRADO}}
+
+Usado por:
+- fundos.py (rota) - exclusão de fundos selecionados
+- posicao.py (rota) - exclusão de posições selecionadas
+"""
+
+from typing import Dict, Iterable, List, TypedDict
+
+from sqlalchemy import exists, func
+from sqlalchemy.orm import Session
+
+from app.models.geld_models import CotaHistorica, InfoFundo, PosicaoFundo
+
+
+LOTE_CONSULTA = 500  # ids por consulta IN (limite de variáveis do SQLite)
+
+# Resultado de cada id
+EXCLUIDO, EM_USO, OUTRO_CLIENTE, NAO_ENCONTRADO = 'excluido', 'em_uso', 'outro_cliente', 'nao_encontrado'
+
+
+class ResultadoExclusao(TypedDict, total=False):
+    status: str
+    nome: str       # fundos
+    posicoes: int   # fundos: posições que impedem a exclusão
+
+
+def _lotes(ids: List[int]):
+    for inicio in range(0, len(ids), LOTE_CONSULTA):
+        yield ids[inicio:inicio + LOTE_CONSULTA]
+
+
+def _ids_unicos(ids: Iterable[int]) -> List[int]:
+    return list(dict.fromkeys(int(i) for i in ids))
+
+
+class ExclusaoLoteService:
+
+    @staticmethod
+    def excluir_fundos(session: Session, fundo_ids: Iterable[int]) -> Dict[int, ResultadoExclusao]:
+        """
+        Exclui os fundos sem posições. Fundos com posição ficam e são reportados como EM_USO.
+
+        Args:
+            session: Sessão do banco (sem commit)
+            fundo_ids: Fundos selecionados
+
+        Returns:
+            {fundo_id: ResultadoExclusao}, na ordem recebida
+        """
+        fundo_ids = _ids_unicos(fundo_ids)
+        relatorio = {fundo_id: {'status': NAO_ENCONTRADO} for fundo_id in fundo_ids}
+
+        for lote in _lotes(fundo_ids):
+            contagem = session.query(
+                PosicaoFundo.fundo_id, func.count(PosicaoFundo.id).label('posicoes')
+            ).filter(
+                PosicaoFundo.fundo_id.in_(lote)
+            ).group_by(PosicaoFundo.fundo_id).subquery()
+
+            fundos = session.query(
+                InfoFundo.id, InfoFundo.nome_fundo, func.coalesce(contagem.c.posicoes, 0)
+            ).outerjoin(
+                contagem, contagem.c.fundo_id == InfoFundo.id
+            ).filter(InfoFundo.id.in_(lote)).all()
+
+            livres = []
+            for fundo_id, nome, posicoes in fundos:
+                relatorio[fundo_id] = {'status': EM_USO if posicoes else EXCLUIDO, 'nome': nome, 'posicoes': posicoes}
+                if not posicoes:
+                    livres.append(fundo_id)
+
+            if livres:
+                # NOT EXISTS repete a checagem no próprio DELETE: fundo que ganhou posição
+                # entre a contagem e a exclusão continua no banco
+                excluidos = session.query(InfoFundo).filter(
+                    InfoFundo.id.in_(livres),
+                    ~exists().where(PosicaoFundo.fundo_id == InfoFundo.id)
+                ).delete(synchronize_session=False)
+
+                if excluidos != len(livres):
+                    restantes = {fundo_id for (fundo_id,) in session.query(InfoFundo.id).filter(InfoFundo.id.in_(livres))}
+                    for fundo_id in restantes:
+                        relatorio[fundo_id]['status'] = EM_USO
+
+                # DELETE em massa não passa pelo cascade do ORM: o histórico de cotas
+                # dos fundos que saíram é removido aqui
+                session.query(CotaHistorica).filter(
+                    CotaHistorica.fundo_id.in_(livres),
+                    ~exists().where(InfoFundo.id == CotaHistorica.fundo_id)
+                ).delete(synchronize_session=False)
+
+        session.expire_all()
+        return relatorio
+
+    @staticmethod
+    def excluir_posicoes(session: Session, cliente_id: int, posicao_ids: Iterable[int]) -> Dict[int, ResultadoExclusao]:
+        """
+        Exclui as posições do cliente. Ids de outro cliente não são tocados.
+        Não recalcula os totais por classe (PosicaoService.atualizar_totais_clientes).
+
+        Args:
+            session: Sessão do banco (sem commit)
+            cliente_id: Dono das posições
+            posicao_ids: Posições selecionadas
+
+        Returns:
+            {posicao_id: ResultadoExclusao}, na ordem recebida
+        """
+        posicao_ids = _ids_unicos(posicao_ids)
+        relatorio = {posicao_id: {'status': NAO_ENCONTRADO} for posicao_id in posicao_ids}
+
+        for lote in _lotes(posicao_ids):
+            donos = session.query(PosicaoFundo.id, PosicaoFundo.cliente_id).filter(PosicaoFundo.id.in_(lote)).all()
+            for posicao_id, dono in donos:
+                relatorio[posicao_id] = {'status': EXCLUIDO if dono == cliente_id else OUTRO_CLIENTE}
+
+            session.query(PosicaoFundo).filter(
+                PosicaoFundo.id.in_(lote),
+                PosicaoFundo.cliente_id == cliente_id
+            ).delete(synchronize_session=False)
+
+        session.expire_all()
+        return relatorio
+
+    @staticmethod
+    def contar(relatorio: Dict[int, ResultadoExclusao], status: str) -> int:
+        return sum(1 for resultado in relatorio.values() if resultado['status'] == status)
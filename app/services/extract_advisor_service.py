@@ -1,29 +1,80 @@
 """
 Serviço para processar arquivos Excel do Advisor
 Extrai posições da aba "Posição"
+
+Parsing puro: não usa sessão de banco.
 """
 
 import pandas as pd
 from datetime import datetime
+from typing import Tuple
 from app.models.geld_models import RiscoEnum, SubtipoRiscoEnum
+from app.services.leitor_planilha_service import LeitorPlanilha
+from app.services.posicao_extraida import LotePosicoes
+
+
+NUM_COLUNAS = 8  # Classe .. SaldoBruto
+
+OUTRO, DATA, TEXTO = 0, 1, 2  # tipo da célula na coluna DataUlt
+
+# Classe ANBIMA do Advisor (minúsculas, sem espaços nas pontas) → nome padronizado
+MAPEAMENTO_CLASSES = {
+    'fundos de renda fixa': 'Renda Fixa',
+    'renda fixa': 'Renda Fixa',
+    'fundos de ações': 'Ações',
+    'ações': 'Ações',
+    'acoes': 'Ações',
+    'multimercado': 'Multimercado',
+    'fundos multimercado': 'Multimercado',
+    'cambial': 'Cambial',
+    'fundos cambiais': 'Cambial',
+}
+
+
+NOMES_ABA_POSICAO = ('posição', 'posicao')
+
+
+def localizar_aba_posicao(abas):
+    """
+    Aba "Posição" do extrato: pelo nome (qualquer caixa, com ou sem acento) ou,
+    se não houver, a primeira aba com "posi" no nome. None se nenhuma servir.
+    """
+    for aba in abas:
+        if aba.strip().lower() in NOMES_ABA_POSICAO:
+            return aba
+    for aba in abas:
+        if 'posi' in aba.lower():
+            return aba
+    return None
+
+
+def extrair_posicoes_advisor(origem) -> Tuple[LotePosicoes, dict]:
+    """
+    Extrai as posições de um extrato Advisor, sem acesso ao banco.
+    
+    Args:
+        origem: Caminho do arquivo, bytes ou objeto binário
+        
+    Returns:
+        tuple: (LotePosicoes, log_processamento)
+    """
+    return AdvisorExtractService().processar_arquivo_advisor(origem)
 
 
 class AdvisorExtractService:
-    def __init__(self, db):
-        self.db = db
     
-    def processar_arquivo_advisor(self, file_path, cliente_id):
+    def processar_arquivo_advisor(self, origem, cliente_id=None) -> Tuple[LotePosicoes, dict]:
         """
         Processa arquivo Excel do Advisor
         
         Args:
-            file_path: Caminho do arquivo Excel
-            cliente_id: ID do cliente
+            origem: Caminho do arquivo Excel, bytes ou objeto binário
+            cliente_id: ID do cliente (apenas para os logs)
             
         Returns:
-            tuple: (lista_posicoes, log_processamento)
+            tuple: (LotePosicoes, log_processamento)
         """
-        posicoes = []
+        posicoes = LotePosicoes()
         log = {
             'total': 0,
             'por_classe': {},
@@ -34,13 +85,13 @@ class AdvisorExtractService:
             print(f"[INFO] Processando arquivo Advisor para cliente {cliente_id}")
             
             # Extrair posições da aba
-            posicoes = self._extrair_aba_posicao(file_path)
+            posicoes = self._extrair_aba_posicao(origem)
             
             # Estatísticas
             log['total'] = len(posicoes)
             
-            for pos in posicoes:
-                classe = pos.get('classe_anbima', 'outros')
+            for classe in posicoes.colunas['classe_anbima']:
+                classe = classe or 'outros'
                 log['por_classe'][classe] = log['por_classe'].get(classe, 0) + 1
             
             print(f"[INFO] Total de posições extraídas: {len(posicoes)}")
@@ -54,7 +105,7 @@ class AdvisorExtractService:
             print(f"[ERRO] Erro ao processar arquivo Advisor: {str(e)}")
             return posicoes, log
     
-    def _extrair_aba_posicao(self, file_path):
+    def _extrair_aba_posicao(self, origem) -> LotePosicoes:
         """
         Extrai dados da aba 'Posição'
         
@@ -68,118 +119,66 @@ class AdvisorExtractService:
         6: Movimento
         7: SaldoBruto (saldo_bruto)
         
+        Processamento por coluna: números, classe, risco e data são convertidos na
+        coluna inteira e formam as colunas do LotePosicoes devolvido.
+        
         Returns:
-            list: Lista de dicionários com dados das posições
+            LotePosicoes: posições da aba (itera como PosicaoExtraida)
         """
-        posicoes = []
-        
         try:
-            # Ler arquivo Excel para listar abas disponíveis
-            excel_file = pd.ExcelFile(file_path)
-            available_sheets = excel_file.sheet_names
+            # Abrir em streaming: as linhas da aba são lidas sob demanda
+            with LeitorPlanilha(origem) as leitor:
+                available_sheets = leitor.abas
+                
+                print(f"[INFO] Total de abas no arquivo: {len(available_sheets)}")
+                print(f"[INFO] Abas disponíveis: {available_sheets}")
+                
+                sheet_name = self._localizar_aba_posicao(available_sheets)
+                print(f"[INFO] Usando aba: '{sheet_name}'")
+                
+                linhas = leitor.linhas(sheet_name)
+                
+                # Primeira linha é o cabeçalho
+                cabecalho = next(linhas, ())
+                print(f"[INFO] Colunas: {list(cabecalho)[:5]}...")  # Mostrar primeiras 5 colunas
+                
+                df = pd.DataFrame(list(linhas), dtype=object)
             
-            print(f"[INFO] Total de abas no arquivo: {len(available_sheets)}")
-            print(f"[INFO] Abas disponíveis: {available_sheets}")
+            df = df.reindex(columns=range(max(NUM_COLUNAS, df.shape[1])))
             
-            # Buscar aba "Posição" (com variações) OU pela posição (índice 11)
-            sheet_name = None
-            sheet_index = None
+            # Validar se linha tem dados mínimos (ativo e quantidade)
+            df = df[df[1].notna() & df[3].notna()]
+            if df.empty:
+                return LotePosicoes()
             
-            # MÉTODO 1: Tentar por nome
-            possible_names = ['Posição', 'Posicao', 'POSIÇÃO', 'POSICAO', 'posição', 'posicao']
+            nomes = df[1].astype(str).str.strip()
             
-            for name in possible_names:
-                if name in available_sheets:
-                    sheet_name = name
-                    break
+            # Normalizar classe (tabela de mapeamento) e determinar risco: poucas classes
+            # distintas, então cada uma é resolvida uma vez e aplicada à coluna por map
+            classes_raw = df[0].where(df[0].notna(), 'Outros').astype(str)
+            normalizacao = {
+                bruta: MAPEAMENTO_CLASSES.get(bruta.strip().lower(), bruta.strip())
+                for bruta in classes_raw.unique()
+            }
+            classes = classes_raw.map(normalizacao)
+            riscos = {classe: self._determinar_risco(classe) for classe in set(normalizacao.values())}
             
-            # Busca case-insensitive se não encontrou exato
-            if not sheet_name:
-                for available in available_sheets:
-                    if available.lower().strip() in [n.lower() for n in possible_names]:
-                        sheet_name = available
-                        break
-            
-            # MÉTODO 2: Se não encontrou por nome, tentar pelo índice (aba 12 = índice 11)
-            if not sheet_name:
-                print("[WARN] Não encontrou por nome, tentando pelo índice...")
-                # Procurar aba que contenha "posi" no nome (case insensitive)
-                for idx, name in enumerate(available_sheets):
-                    if 'posi' in name.lower():
-                        sheet_index = idx
-                        sheet_name = name
-                        print(f"[INFO] Encontrou aba similar no índice {idx}: '{name}'")
-                        break
-            
-            if not sheet_name and not sheet_index:
-                raise ValueError(f"Aba 'Posição' não encontrada. Abas disponíveis: {available_sheets}")
-            
-            print(f"[INFO] Usando aba: '{sheet_name}'" + (f" (índice {sheet_index})" if sheet_index is not None else ""))
-            
-            # Ler aba encontrada
-            if sheet_index is not None:
-                df = pd.read_excel(file_path, sheet_name=sheet_index, header=0)
-            else:
-                df = pd.read_excel(file_path, sheet_name=sheet_name, header=0)
-            
-            print(f"[INFO] Aba '{sheet_name}' - {len(df)} linhas x {len(df.columns)} colunas")
-            print(f"[INFO] Colunas: {df.columns.tolist()[:5]}...")  # Mostrar primeiras 5 colunas
-            
-            # Processar cada linha
-            for idx, row in df.iterrows():
-                try:
-                    # Validar se linha tem dados mínimos
-                    if pd.isna(row.iloc[1]) or pd.isna(row.iloc[3]):
-                        continue
-                    
-                    # Extrair dados
-                    classe_raw = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else "Outros"
-                    nome_ativo = str(row.iloc[1]).strip()
-                    data_ult = row.iloc[2] if pd.notna(row.iloc[2]) else datetime.now()
-                    quantidade = self._parse_numero_br(row.iloc[3])
-                    preco = self._parse_numero_br(row.iloc[4]) if pd.notna(row.iloc[4]) else 0.0
-                    saldo_anterior = self._parse_numero_br(row.iloc[5]) if pd.notna(row.iloc[5]) else 0.0
-                    saldo_bruto = self._parse_numero_br(row.iloc[7]) if pd.notna(row.iloc[7]) else 0.0
-                    
-                    # Normalizar classe
-                    classe_normalizada = self._normalizar_classe(classe_raw)
-                    
-                    # Determinar risco
-                    risco, subtipo_risco = self._determinar_risco(classe_normalizada)
-                    
-                    # Converter data
-                    if not isinstance(data_ult, datetime):
-                        try:
-                            if isinstance(data_ult, str):
-                                # Formato: dd/mm/yyyy
-                                data_ult = datetime.strptime(data_ult, "%d/%m/%Y")
-                            else:
-                                data_ult = datetime.now()
-                        except:
-                            data_ult = datetime.now()
-                    
-                    # Montar dicionário da posição
-                    posicao = {
-                        "nome_fundo": nome_ativo,
-                        "cnpj": None,  # Advisor não fornece CNPJ
-                        "classe_anbima": classe_normalizada,
-                        "num_cotas": quantidade,
-                        "valor_cota": preco,
-                        "data": data_ult,
-                        "risco": risco,
-                        "subtipo_risco": subtipo_risco,
-                        "saldo_anterior": saldo_anterior,
-                        "saldo_bruto": saldo_bruto,
-                        "tipo": "advisor"
-                    }
-                    
-                    posicoes.append(posicao)
-                    
-                    print(f"[INFO] Extraído: {nome_ativo[:50]} | Classe: {classe_normalizada} | Qtd: {quantidade}")
-                    
-                except Exception as e:
-                    print(f"[AVISO] Erro ao processar linha {idx}: {str(e)}")
-                    continue
+            # Colunas prontas viram o lote direto, sem um dicionário por posição
+            riscos_por_linha = [riscos[classe] for classe in classes.tolist()]
+            tamanho = len(df)
+            posicoes = LotePosicoes({
+                'nome_fundo': nomes.tolist(),
+                'cnpj': [None] * tamanho,  # Advisor não fornece CNPJ
+                'classe_anbima': classes.tolist(),
+                'num_cotas': self._parse_numeros_br(df[3]).tolist(),
+                'valor_cota': self._parse_numeros_br(df[4]).tolist(),
+                'data': self._converter_datas(df[2]).tolist(),
+                'risco': [risco for risco, _ in riscos_por_linha],
+                'subtipo_risco': [subtipo for _, subtipo in riscos_por_linha],
+                'saldo_anterior': self._parse_numeros_br(df[5]).tolist(),
+                'saldo_bruto': self._parse_numeros_br(df[7]).tolist(),
+                'tipo': ['advisor'] * tamanho,
+            })
             
             return posicoes
             
@@ -187,47 +186,59 @@ class AdvisorExtractService:
             print(f"[ERRO] Erro ao ler aba Posição: {str(e)}")
             raise e
     
-    def _parse_numero_br(self, valor):
+    def _localizar_aba_posicao(self, available_sheets):
+        """
+        Localiza a aba "Posição" por nome (com variações) ou por similaridade.
+        
+        Raises:
+            ValueError: se nenhuma aba compatível for encontrada
+        """
+        sheet_name = localizar_aba_posicao(available_sheets)
+        if sheet_name is None:
+            raise ValueError(f"Aba 'Posição' não encontrada. Abas disponíveis: {available_sheets}")
+        if sheet_name.strip().lower() not in NOMES_ABA_POSICAO:
+            print(f"[INFO] Encontrou aba similar: '{sheet_name}'")
+        return sheet_name
+    
+    @staticmethod
+    def _parse_numeros_br(coluna):
         """
-        Converte número para float
+        Converte a coluna para float
         Formato do Excel Advisor: Internacional (vírgula=milhar, ponto=decimal)
         Ex: '2,542.69915361' → 2542.69915361
+        Vazios e textos não numéricos viram 0.0
         """
-        if pd.isna(valor):
-            return 0.0
+        numeros = pd.to_numeric(coluna, errors='coerce')
         
-        if isinstance(valor, (int, float)):
-            return float(valor)
+        # Só os textos que não converteram direto (ex.: com separador de milhar) passam pela limpeza
+        pendentes = numeros.isna() & coluna.notna()
+        if pendentes.any():
+            texto = coluna[pendentes].astype(str).str.replace(',', '', regex=False).str.strip()
+            numeros[pendentes] = pd.to_numeric(texto, errors='coerce')
+            
+            for valor in coluna[pendentes & numeros.isna()]:
+                print(f"[WARN] Não foi possível converter '{valor}' para número")
         
-        # Se vier como string, remover vírgulas (separador de milhar) e converter
-        try:
-            valor_str = str(valor).replace(',', '')  # Remove vírgula de milhar
-            return float(valor_str)
-        except:
-            print(f"[WARN] Não foi possível converter '{valor}' para número")
-            return 0.0
+        return numeros.fillna(0.0).astype(float)
     
-    def _normalizar_classe(self, classe_raw):
+    @staticmethod
+    def _converter_datas(coluna):
         """
-        Normaliza nome da classe ANBIMA
-        Remove espaços e padroniza nomenclatura
+        Datas já lidas como datetime são mantidas; textos no formato dd/mm/yyyy são
+        convertidos; vazios e valores inválidos viram None (extrato sem data).
         """
-        classe = classe_raw.strip().lower()
-        
-        # Mapeamento de classes comuns
-        mapeamento = {
-            'fundos de renda fixa': 'Renda Fixa',
-            'renda fixa': 'Renda Fixa',
-            'fundos de ações': 'Ações',
-            'ações': 'Ações',
-            'acoes': 'Ações',
-            'multimercado': 'Multimercado',
-            'fundos multimercado': 'Multimercado',
-            'cambial': 'Cambial',
-            'fundos cambiais': 'Cambial',
-        }
+        tipos = coluna.map(lambda v: DATA if isinstance(v, datetime) else TEXTO if isinstance(v, str) else OUTRO).to_numpy()
+        eh_datetime = tipos == DATA
+        eh_texto = tipos == TEXTO
+        
+        # Array de objetos: mantém datetime do Python (uma Series converteria para Timestamp)
+        datas = coluna.to_numpy(dtype=object, copy=True)
+        datas[~eh_datetime] = None
         
-        return mapeamento.get(classe, classe_raw.strip())
+        convertidas = pd.to_datetime(coluna[eh_texto], format="%d/%m/%Y", errors='coerce')
+        validas = convertidas.notna().to_numpy()
+        datas[eh_texto.nonzero()[0][validas]] = convertidas[validas].dt.to_pydatetime()
+        return datas
     
     def _determinar_risco(self, classe_anbima):
         """
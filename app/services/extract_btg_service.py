@@ -1,25 +1,70 @@
 """
 Serviço para processar arquivos Excel do BTG
 Extrai posições de todas as abas: Fundos, Previdência Individual, Previdência Externa, Renda Fixa e Renda Variável
+
+Parsing puro: não usa sessão de banco. Recebe o arquivo (caminho, bytes ou
+objeto binário) e devolve registros PosicaoExtraida.
 """
 
 import pandas as pd
 from datetime import datetime
-from app.models.geld_models import RiscoEnum, SubtipoRiscoEnum, create_session
-from app.services.global_services import GlobalServices
+from typing import List, Tuple
+from app.models.geld_models import RiscoEnum
+from app.services.cnpj_utils import validar_cnpj, formatar_cnpj
+from app.services.leitor_planilha_service import LeitorPlanilha, celula
+from app.services.posicao_extraida import PosicaoExtraida
+from concurrent.futures import ProcessPoolExecutor
 import hashlib
+import os
 import re
+import time
+
+
+def extrair_posicoes_btg(origem) -> Tuple[List[PosicaoExtraida], dict]:
+    """
+    Extrai as posições de um extrato BTG, sem acesso ao banco.
+    
+    Args:
+        origem: Caminho do arquivo, bytes ou objeto binário
+        
+    Returns:
+        tuple: (lista de PosicaoExtraida deduplicada, log_processamento)
+    """
+    return ExtractBTGService().processar_arquivo_btg_completo(origem)
+
+
+def _processar_aba_isolada(origem, nome_aba, processador):
+    """Ponto de entrada do processo filho no modo paralelo: abre o arquivo e processa uma aba"""
+    with LeitorPlanilha(origem) as leitor:
+        return ExtractBTGService()._processar_aba(leitor, nome_aba, processador)
 
 
 class ExtractBTGService:
     
+    # (chave no log, nome da aba, método processador, rótulo do print)
+    ABAS = (
+        ('fundos', 'Fundos', '_processar_aba_fundos', 'Fundos extraídos'),
+        ('previdencia_individual', 'Previdência Individual', '_processar_aba_previdencia_individual', 'Previdência Individual extraída'),
+        ('previdencia_externa', 'Previdência Externa', '_processar_aba_previdencia_externa', 'Previdência Externa extraída'),
+        ('renda_fixa', 'Renda Fixa', '_processar_aba_renda_fixa', 'Renda Fixa extraída'),
+        ('renda_variavel', 'Renda Variavel', '_processar_aba_renda_variavel', 'Renda Variável extraída'),
+    )
     
-    def __init__(self, db, global_services):
-        
-        self.db = db
-        self.global_services = global_services
+    # Seções da aba Renda Variável: marcador → (tipo, prefixo do CNPJ dummy, classe, risco, rótulo)
+    SECOES_RENDA_VARIAVEL = {
+        "Posição > Ações": ("acao", "97.001", "acoes", "alto", "Ação extraída"),
+        "Posição > Fundos imobiliários": ("fii", "97.002", "fundos_imobiliarios", "moderado", "FII extraído"),
+    }
     
-    def processar_arquivo_btg_completo(self, file_path, cliente_id):
+    def processar_arquivo_btg_completo(self, origem, cliente_id=None, paralelo=False,
+                                       max_processos=None) -> Tuple[List[PosicaoExtraida], dict]:
+        """
+        Args:
+            origem: Caminho do arquivo, bytes ou objeto binário
+            cliente_id: Usado apenas nos logs
+            paralelo: Processa as abas simultaneamente em processos separados
+            max_processos: Limite de processos no modo paralelo (padrão: uma por aba, até o nº de CPUs)
+        """
         
         todas_posicoes = []
         log_processamento = {
@@ -28,44 +73,41 @@ class ExtractBTGService:
             'previdencia_externa': 0,
             'renda_fixa': 0,
             'renda_variavel': 0,
-            'erros': []
+            'erros': [],
+            'erros_por_aba': {},
+            'tempos': {}  # segundos por etapa (cada aba inclui a própria leitura)
         }
+        tempos = log_processamento['tempos']
+        inicio_total = time.perf_counter()
         
         try:
-            print(f"[INFO] Processando arquivo BTG para cliente {cliente_id}")
-            
-            # 1. PROCESSAR ABA FUNDOS
-            posicoes_fundos = self._processar_aba_fundos(file_path)
-            todas_posicoes.extend(posicoes_fundos)
-            log_processamento['fundos'] = len(posicoes_fundos)
-            print(f"[INFO] Fundos extraídos: {len(posicoes_fundos)}")
-            
-            # 2. PROCESSAR PREVIDÊNCIA INDIVIDUAL
-            posicoes_prev_ind = self._processar_aba_previdencia_individual(file_path)
-            todas_posicoes.extend(posicoes_prev_ind)
-            log_processamento['previdencia_individual'] = len(posicoes_prev_ind)
-            print(f"[INFO] Previdência Individual extraída: {len(posicoes_prev_ind)}")
-            
-            # 3. PROCESSAR PREVIDÊNCIA EXTERNA  
-            posicoes_prev_ext = self._processar_aba_previdencia_externa(file_path)
-            todas_posicoes.extend(posicoes_prev_ext)
-            log_processamento['previdencia_externa'] = len(posicoes_prev_ext)
-            print(f"[INFO] Previdência Externa extraída: {len(posicoes_prev_ext)}")
-            
-            # 4. PROCESSAR RENDA FIXA
-            posicoes_rf = self._processar_aba_renda_fixa(file_path)
-            todas_posicoes.extend(posicoes_rf)
-            log_processamento['renda_fixa'] = len(posicoes_rf)
-            print(f"[INFO] Renda Fixa extraída: {len(posicoes_rf)}")
-            
-            # 5. PROCESSAR RENDA VARIÁVEL
-            posicoes_rv = self._processar_aba_renda_variavel(file_path)
-            todas_posicoes.extend(posicoes_rv)
-            log_processamento['renda_variavel'] = len(posicoes_rv)
-            print(f"[INFO] Renda Variável extraída: {len(posicoes_rv)}")
+            print(f"[INFO] Processando arquivo BTG para cliente {cliente_id}"
+                  + (" (abas em paralelo)" if paralelo else ""))
+            
+            # 1-5. PROCESSAR AS ABAS → {chave: (posicoes, segundos, erro)}
+            if paralelo:
+                resultados = self._processar_abas_em_paralelo(origem, max_processos)
+            else:
+                resultados = self._processar_abas_em_sequencia(origem, tempos)
+            
+            # Junta na ordem de ABAS, antes da deduplicação
+            for chave, nome_aba, _, rotulo in self.ABAS:
+                posicoes_aba, segundos, erro = resultados[chave]
+                tempos[chave] = round(segundos, 4)
+                
+                if erro:
+                    log_processamento['erros_por_aba'][chave] = erro
+                    log_processamento['erros'].append(f"{nome_aba}: {erro}")
+                    print(f"[ERRO] Falha na aba {nome_aba}: {erro}")
+                
+                todas_posicoes.extend(posicoes_aba)
+                log_processamento[chave] = len(posicoes_aba)
+                print(f"[INFO] {rotulo}: {len(posicoes_aba)}")
             
             # 6. DEDUPLICAÇÃO POR CNPJ
+            inicio = time.perf_counter()
             posicoes_unicas = self._deduplificar_posicoes(todas_posicoes)
+            tempos['deduplicacao'] = round(time.perf_counter() - inicio, 4)
             posicoes_removidas = len(todas_posicoes) - len(posicoes_unicas)
             
             if posicoes_removidas > 0:
@@ -79,136 +121,201 @@ class ExtractBTGService:
             log_processamento['erros'].append(str(e))
             print(f"[ERRO] Erro no processamento completo BTG: {str(e)}")
             return todas_posicoes, log_processamento
+        
+        finally:
+            tempos['total'] = round(time.perf_counter() - inicio_total, 4)
+            print(f"[INFO] Tempos BTG (s): {tempos}")
+    
+    def _processar_abas_em_sequencia(self, origem, tempos):
+        """Abre a planilha uma única vez e processa uma aba por vez"""
+        inicio = time.perf_counter()
+        with LeitorPlanilha(origem) as leitor:
+            tempos['abertura'] = round(time.perf_counter() - inicio, 4)
+            return {
+                chave: self._processar_aba(leitor, nome_aba, processador)
+                for chave, nome_aba, processador, _ in self.ABAS
+            }
+    
+    def _processar_abas_em_paralelo(self, origem, max_processos=None):
+        """
+        Processa cada aba em um processo (o parsing é CPU-bound). Cada processo
+        abre o arquivo por conta própria; o tempo total tende ao da aba mais lenta.
+        """
+        if not isinstance(origem, (str, bytes, bytearray, os.PathLike)):
+            origem = origem.read()  # objetos de arquivo não atravessam processos
+        
+        max_processos = max_processos or min(len(self.ABAS), os.cpu_count() or 1)
+        resultados = {}
+        
+        with ProcessPoolExecutor(max_workers=max_processos) as executor:
+            futuros = {
+                chave: executor.submit(_processar_aba_isolada, origem, nome_aba, processador)
+                for chave, nome_aba, processador, _ in self.ABAS
+            }
+            for chave, futuro in futuros.items():
+                try:
+                    resultados[chave] = futuro.result()
+                except Exception as e:
+                    resultados[chave] = ([], 0.0, str(e))
+        
+        return resultados
+    
+    def _processar_aba(self, leitor, nome_aba, processador):
+        """
+        Lê uma aba e aplica o processador; falhas ficam restritas à aba.
+        
+        Returns:
+            tuple: (posicoes, segundos, mensagem de erro ou None)
+        """
+        inicio = time.perf_counter()
+        try:
+            if nome_aba not in leitor.abas:
+                print(f"[AVISO] Aba '{nome_aba}' não encontrada no arquivo")
+            
+            df = self._ler_aba(leitor, nome_aba)
+            posicoes = getattr(self, processador)(df)
+            return posicoes, time.perf_counter() - inicio, None
+        
+        except Exception as e:
+            return [], time.perf_counter() - inicio, str(e)
+    
+    # =========================================================================
+    # LEITURA E MÁSCARAS
+    # =========================================================================
+    
+    @staticmethod
+    def _ler_aba(leitor, nome_aba):
+        """
+        Monta o DataFrame de uma aba a partir das linhas do leitor em streaming.
+        dtype=object preserva os tipos das células (str, número, datetime, None).
+        """
+        return pd.DataFrame(list(leitor.linhas(nome_aba)), dtype=object)
+    
+    @staticmethod
+    def _texto(df, coluna):
+        """Coluna só com as células de texto (demais viram NaN), pronta para .str"""
+        if coluna >= df.shape[1]:
+            return pd.Series(None, index=df.index, dtype=object)
+        serie = df[coluna]
+        return serie.where(serie.map(type) == str)
+    
+    @staticmethod
+    def _numerico(df, coluna):
+        """Máscara das células numéricas (int/float não nulos) da coluna"""
+        if coluna >= df.shape[1]:
+            return pd.Series(False, index=df.index)
+        return df[coluna].map(lambda v: isinstance(v, (int, float)) and not pd.isna(v)).astype(bool)
+    
+    @staticmethod
+    def _contem(texto, termo):
+        """Máscara booleana de células que contêm o termo (literal)"""
+        return texto.str.contains(termo, regex=False, na=False).astype(bool)
+    
+    @staticmethod
+    def _primeira(mascara, inicio=0, fim=None):
+        """Índice da primeira linha True em [inicio, fim), ou None"""
+        acertos = mascara.to_numpy()[inicio:fim].nonzero()[0]
+        return inicio + int(acertos[0]) if len(acertos) else None
+    
+    @staticmethod
+    def _converter_data(valor, formato):
+        """Converte célula de data; texto usa o formato informado. Sem data válida: None"""
+        if isinstance(valor, datetime):
+            return valor
+        try:
+            if isinstance(valor, str):
+                return datetime.strptime(valor, formato)
+        except:
+            pass
+        return None
     
     # =========================================================================
     # PROCESSADORES DE ABAS ESPECÍFICAS
+    # Cada processador localiza as fronteiras das seções com máscaras de texto
+    # na coluna 1 e extrai cada bloco por fatia.
     # =========================================================================
     
-    def _processar_aba_fundos(self, file_path):
+    def _processar_aba_fundos(self, df) -> List[PosicaoExtraida]:
         """Processa aba 'Fundos' extraindo CNPJs e posições"""
         posicoes = []
         
         try:
-            df = pd.read_excel(file_path, sheet_name="Fundos", header=None)
+            texto = self._texto(df, 1)
             
             # 1. Mapear CNPJs da seção "Detalhamento >"
             cnpjs_fundos = {}
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Detalhamento >" in cell_value:
-                    try:
-                        parts = cell_value.split(" - ")
-                        fund_name = parts[0].replace("Detalhamento > ", "").strip()
-                        cnpj_bruto = parts[1].strip()
-                        
-                        is_valid, cnpj_normalizado, _ = self.global_services.validar_cnpj(cnpj_bruto)
-                        if is_valid:
-                            cnpj_formatado = self.global_services.formatar_cnpj(cnpj_normalizado)
-                            cnpjs_fundos[fund_name] = cnpj_formatado
-                    except Exception as e:
-                        print(f"[AVISO] Erro ao mapear CNPJ na linha {i}: {str(e)}")
-                        continue
+            detalhes = texto[self._contem(texto, "Detalhamento >")]
+            partes = detalhes.str.split(" - ")
+            nomes_detalhe = partes.str[0].str.replace("Detalhamento > ", "", regex=False).str.strip()
+            cnpjs_brutos = partes.str[1].str.strip()
+            
+            for i, fund_name, cnpj_bruto in zip(detalhes.index, nomes_detalhe, cnpjs_brutos):
+                if not isinstance(cnpj_bruto, str):
+                    print(f"[AVISO] Erro ao mapear CNPJ na linha {i}: CNPJ ausente")
+                    continue
+                is_valid, cnpj_normalizado, _ = validar_cnpj(cnpj_bruto)
+                if is_valid:
+                    cnpjs_fundos[fund_name] = formatar_cnpj(cnpj_normalizado)
             
             print(f"[INFO] CNPJs mapeados: {len(cnpjs_fundos)}")
             
             # 2. Localizar seção de posições
-            posicao_portfolio_index = None
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Posição > Portfólio de fundos" in cell_value:
-                    posicao_portfolio_index = i
-                    break
-                    
+            posicao_portfolio_index = self._primeira(self._contem(texto, "Posição > Portfólio de fundos"))
             if posicao_portfolio_index is None:
                 print("[AVISO] Seção 'Posição > Portfólio de fundos' não encontrada")
                 return posicoes
-                
-            # 3. Localizar cabeçalho com colunas
-            header_row_index = None
-            for i in range(posicao_portfolio_index, min(posicao_portfolio_index + 4, len(df))):
-                row = df.iloc[i]
-                if any(isinstance(cell, str) and "Quantidade de Cotas" in cell for cell in row):
-                    header_row_index = i
-                    break
-                    
-            if header_row_index is None:
+            
+            # 3. Localizar cabeçalho (até 4 linhas a partir da seção) e coluna de cotas
+            bloco_cabecalho = df.iloc[posicao_portfolio_index:posicao_portfolio_index + 4]
+            marcas = bloco_cabecalho.map(lambda v: isinstance(v, str) and "Quantidade de Cotas" in v).astype(bool)
+            linhas_marcadas = marcas.any(axis=1).to_numpy().nonzero()[0]
+            
+            if not len(linhas_marcadas):
                 print("[AVISO] Cabeçalho não encontrado na aba Fundos")
                 return posicoes
-                
-            # 4. Identificar coluna de cotas
-            cotas_column = None
+            
+            header_row_index = posicao_portfolio_index + int(linhas_marcadas[0])
+            cotas_column = int(marcas.iloc[linhas_marcadas[0]].to_numpy().nonzero()[0][0])
             date_column = 1  # Coluna padrão para data
             
-            for j in range(len(df.columns)):
-                if (j < len(df.iloc[header_row_index]) and 
-                    isinstance(df.iloc[header_row_index, j], str) and 
-                    "Quantidade de Cotas" in df.iloc[header_row_index, j]):
-                    cotas_column = j
-                    break
-                    
-            if cotas_column is None:
-                print("[AVISO] Coluna de cotas não encontrada na aba Fundos")
-                return posicoes
+            # 4. Fim da seção: próxima linha com "Detalhamento" ou "Rentabilidade"
+            fim_secao = self._primeira(
+                self._contem(texto, "Detalhamento") | self._contem(texto, "Rentabilidade"),
+                header_row_index + 1
+            )
+            bloco = texto.iloc[header_row_index + 1:fim_secao]
+            
+            # 5. Linhas de nome: texto que não é "Total"/"Data" seguido de linha com cotas numéricas
+            eh_nome = bloco.notna() & ~bloco.str.startswith("Total", na=True) & ~bloco.str.startswith("Data", na=True)
+            cotas_seguinte = self._numerico(df, cotas_column).shift(-1, fill_value=False)
+            nomes = bloco[eh_nome.astype(bool) & cotas_seguinte.loc[bloco.index]]
+            
+            nomes_limpos = nomes.str.replace("*", "", regex=False).str.strip().str.split(" - Classe CNPJ:").str[0].str.strip()
+            quotas = df[cotas_column].shift(-1).loc[nomes.index]
+            datas = df[date_column].shift(-1).loc[nomes.index]
+            
+            # Buscar CNPJ correspondente (comparação sem diferenciar maiúsculas)
+            cnpjs_por_nome = {}
+            for key, value in cnpjs_fundos.items():
+                cnpjs_por_nome.setdefault(key.lower(), value)
+            
+            for fund_name, quota, date_value in zip(nomes_limpos, quotas, datas):
+                cnpj = cnpjs_por_nome.get(fund_name.lower())
+                if not cnpj:
+                    print(f"[AVISO] CNPJ não encontrado para: {fund_name}")
+                    cnpj = f"DUMMY-FUNDOS-{len(posicoes):04d}"
                 
-            # 5. Extrair posições dos fundos
-            for i in range(header_row_index + 1, len(df)):
-                # Parar se chegou ao fim da seção
-                if (pd.notna(df.iloc[i, 1]) and isinstance(df.iloc[i, 1], str) and 
-                    ("Detalhamento" in df.iloc[i, 1] or "Rentabilidade" in df.iloc[i, 1])):
-                    break
-                    
-                # Processar linha de nome do fundo
-                if (pd.notna(df.iloc[i, 1]) and isinstance(df.iloc[i, 1], str) and 
-                    not df.iloc[i, 1].startswith("Total") and not df.iloc[i, 1].startswith("Data")):
-                    
-                    # Extrair nome limpo do fundo
-                    fund_name_raw = str(df.iloc[i, 1]).replace("*", "").strip()
-                    if " - Classe CNPJ:" in fund_name_raw:
-                        fund_name = fund_name_raw.split(" - Classe CNPJ:")[0].strip()
-                    else:
-                        fund_name = fund_name_raw
-                    
-                    # Verificar se próxima linha tem dados de cotas
-                    if (i + 1 < len(df) and pd.notna(df.iloc[i+1, cotas_column]) and 
-                        isinstance(df.iloc[i+1, cotas_column], (int, float))):
-                        
-                        date_value = df.iloc[i+1, date_column] if date_column < len(df.columns) else datetime.now()
-                        quotas = float(df.iloc[i+1, cotas_column])
-                        
-                        # Buscar CNPJ correspondente
-                        cnpj = None
-                        for key, value in cnpjs_fundos.items():
-                            if fund_name.lower() == key.lower():
-                                cnpj = value
-                                break
-                        
-                        if not cnpj:
-                            print(f"[AVISO] CNPJ não encontrado para: {fund_name}")
-                            cnpj = f"DUMMY-FUNDOS-{len(posicoes):04d}"
-                        
-                        # Converter data
-                        if not isinstance(date_value, datetime):
-                            try:
-                                if isinstance(date_value, str):
-                                    date_value = datetime.strptime(date_value, "%d/%m/%Y")
-                                else:
-                                    date_value = datetime.now()
-                            except:
-                                date_value = datetime.now()
-                        
-                        posicao = {
-                            "nome_fundo": fund_name,
-                            "cnpj": cnpj,
-                            "classe_anbima": "Fundos de Investimento",
-                            "num_cotas": quotas,
-                            "data": date_value,
-                            "tipo": "fundo",
-                            "risco": RiscoEnum.moderado,
-                            "subtipo_risco": None
-                        }
-                        
-                        posicoes.append(posicao)
-                        print(f"[INFO] Fundo: {fund_name[:50]} | CNPJ: {cnpj} | Cotas: {quotas}")
+                posicoes.append(PosicaoExtraida(
+                    nome_fundo=fund_name,
+                    cnpj=cnpj,
+                    classe_anbima="Fundos de Investimento",
+                    num_cotas=float(quota),
+                    data=self._converter_data(date_value, "%d/%m/%Y"),
+                    tipo="fundo",
+                    risco=RiscoEnum.moderado,
+                    subtipo_risco=None
+                ))
+                print(f"[INFO] Fundo: {fund_name[:50]} | CNPJ: {cnpj} | Cotas: {float(quota)}")
             
             return posicoes
             
@@ -216,215 +323,162 @@ class ExtractBTGService:
             print(f"[ERRO] Erro ao processar aba Fundos: {str(e)}")
             return posicoes
     
-    def _processar_aba_previdencia_individual(self, file_path):
+    def _blocos_previdencia(self, texto, fim_secao):
+        """
+        Fatias (início, fim) dos blocos de dados das seções "Posição >" de uma aba
+        de previdência: cada bloco começa após o cabeçalho "Fundo" (até 5 linhas
+        após a seção) e termina no delimitador ou na seção seguinte.
+        """
+        inicios = self._contem(texto, "Posição >").to_numpy().nonzero()[0].tolist()
+        eh_cabecalho = texto.str.strip().str.lower().eq("fundo").fillna(False).astype(bool)
+        total_linhas = len(texto)
+        
+        blocos = []
+        for n, inicio_secao in enumerate(inicios):
+            proxima_secao = inicios[n + 1] if n + 1 < len(inicios) else total_linhas
+            
+            linha_cabecalho = self._primeira(eh_cabecalho, inicio_secao, min(inicio_secao + 5, proxima_secao))
+            if linha_cabecalho is None:
+                continue
+            
+            fim = self._primeira(fim_secao, linha_cabecalho + 1, proxima_secao)
+            blocos.append((linha_cabecalho + 1, proxima_secao if fim is None else fim))
+        
+        return blocos
+    
+    def _processar_aba_previdencia_individual(self, df) -> List[PosicaoExtraida]:
         """Processa aba Previdência Individual com busca inteligente por seções"""
         posicoes = []
         
         try:
-            df = pd.read_excel(file_path, sheet_name="Previdência Individual", header=None)
-            
-            # 1. Localizar todas as seções que contêm "Posição >"
-            secoes_posicao = []
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Posição >" in cell_value:
-                    secoes_posicao.append(i)
-            
-            # 2. Processar cada seção de posição encontrada
-            for inicio_secao in secoes_posicao:
-                # 3. Localizar cabeçalho "Fundo"
-                linha_cabecalho = None
-                for i in range(inicio_secao, min(inicio_secao + 5, len(df))):
-                    cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                    if isinstance(cell_value, str) and cell_value.strip().lower() == "fundo":
-                        linha_cabecalho = i
-                        break
-                
-                if linha_cabecalho is None:
-                    continue
-                
-                # 4. Extrair dados da seção até encontrar delimitador
-                linha_atual = linha_cabecalho + 1
-                while linha_atual < len(df):
-                    row = df.iloc[linha_atual]
-                    
-                    # Parar se encontrar fim da seção
-                    if (pd.notna(row.iloc[1]) and isinstance(row.iloc[1], str) and 
-                        (row.iloc[1].strip().lower() in ["total", "rentabilidade"] or 
-                         "rentabilidade" in row.iloc[1].lower())):
-                        break
+            if df.shape[1] < 7:
+                return posicoes
+            
+            texto = self._texto(df, 1)
+            rotulo = texto.str.strip().str.lower()
+            fim_secao = (rotulo.isin(["total"]) | self._contem(texto.str.lower(), "rentabilidade")).astype(bool)
+            
+            # Linhas de dados válidas: nome com FOF/FI, CNPJ em texto e cotas numéricas
+            nome_upper = texto.str.upper()
+            validas = (
+                texto.notna()
+                & self._texto(df, 2).notna()
+                & self._numerico(df, 4)
+                & (self._contem(nome_upper, "FOF") | self._contem(nome_upper, "FI"))
+                & texto.str.strip().str.len().gt(10)
+            ).astype(bool)
+            
+            for inicio, fim in self._blocos_previdencia(texto, fim_secao):
+                for i in validas.index[inicio:fim][validas.iloc[inicio:fim].to_numpy()]:
+                    nome_fundo = texto[i].strip()
+                    cnpj_bruto = df.at[i, 2].strip()
+                    data_ref = df.at[i, 3] if pd.notna(df.at[i, 3]) else None
+                    quantidade_cotas = float(df.at[i, 4])
                     
-                    # Verificar se é linha de dados válida
-                    if (len(row) >= 7 and 
-                        pd.notna(row.iloc[1]) and isinstance(row.iloc[1], str) and
-                        pd.notna(row.iloc[2]) and isinstance(row.iloc[2], str) and
-                        pd.notna(row.iloc[4]) and isinstance(row.iloc[4], (int, float)) and
-                        ("FOF" in str(row.iloc[1]).upper() or "FI" in str(row.iloc[1]).upper()) and
-                        len(str(row.iloc[1]).strip()) > 10):
-                        
-                        nome_fundo = str(row.iloc[1]).strip()
-                        cnpj_bruto = str(row.iloc[2]).strip()
-                        data_ref = row.iloc[3] if pd.notna(row.iloc[3]) else datetime.now()
-                        quantidade_cotas = float(row.iloc[4])
-                        
-                        # Validar CNPJ
-                        session_temp = create_session()
-                        global_service = GlobalServices(session_temp)
-                        is_valid, cnpj_normalizado, msg = global_service.validar_cnpj(cnpj_bruto)
-                        session_temp.close()
-                        
-                        if is_valid:
-                            cnpj_formatado = global_service.formatar_cnpj(cnpj_normalizado)
-                            
-                            # Normalizar data
-                            if not isinstance(data_ref, datetime):
-                                try:
-                                    if isinstance(data_ref, str):
-                                        data_ref = datetime.strptime(data_ref, "%Y-%m-%d")
-                                except:
-                                    data_ref = datetime.now()
-                            
-                            posicoes.append({
-                                "nome_fundo": nome_fundo,
-                                "cnpj": cnpj_formatado,
-                                "num_cotas": quantidade_cotas,
-                                "data": data_ref,
-                                "tipo": "previdencia_individual"
-                            })
+                    is_valid, cnpj_normalizado, msg = validar_cnpj(cnpj_bruto)
                     
-                    linha_atual += 1
+                    if is_valid:
+                        posicoes.append(PosicaoExtraida(
+                            nome_fundo=nome_fundo,
+                            cnpj=formatar_cnpj(cnpj_normalizado),
+                            num_cotas=quantidade_cotas,
+                            data=self._converter_data(data_ref, "%Y-%m-%d"),
+                            tipo="previdencia_individual"
+                        ))
                         
         except Exception as e:
             print(f"[ERRO] Erro na Previdência Individual: {str(e)}")
         
         return posicoes
     
-    def _processar_aba_previdencia_externa(self, file_path):
+    def _processar_aba_previdencia_externa(self, df) -> List[PosicaoExtraida]:
         """Processa aba Previdência Externa - BUSCA INTELIGENTE"""
         posicoes = []
         
         try:
-            df = pd.read_excel(file_path, sheet_name="Previdência Externa", header=None)
             print(f"[DEBUG] Previdência Externa - DataFrame shape: {df.shape}")
+            if df.shape[1] < 6:
+                return posicoes
             
-            # 1. Buscar seções que contêm "Posição >"
-            secoes_posicao = []
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Posição >" in cell_value:
-                    secoes_posicao.append(i)
-                    print(f"[DEBUG] Seção de posição encontrada na linha {i}: {cell_value}")
-            
-            # 2. Para cada seção de posição, procurar dados
-            for inicio_secao in secoes_posicao:
-                print(f"[DEBUG] Processando seção que inicia na linha {inicio_secao}")
-                
-                # 3. Procurar linha com cabeçalho "Fundo"
-                linha_cabecalho = None
-                for i in range(inicio_secao, min(inicio_secao + 5, len(df))):
-                    cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                    if isinstance(cell_value, str) and cell_value.strip().lower() == "fundo":
-                        linha_cabecalho = i
-                        print(f"[DEBUG] Cabeçalho 'Fundo' encontrado na linha {i}")
-                        break
-                
-                if linha_cabecalho is None:
-                    print(f"[DEBUG] Cabeçalho 'Fundo' não encontrado para seção {inicio_secao}")
-                    continue
+            texto = self._texto(df, 1)
+            minusculo = texto.str.lower()
+            fim_secao = (self._contem(minusculo, "rentabilidade") | self._contem(minusculo, "plano >")).astype(bool)
+            
+            # Linhas de dados válidas: nome de plano conhecido e mais de 100 cotas
+            nome_upper = texto.str.upper()
+            numerico = self._numerico(df, 3)
+            validas = (
+                texto.notna()
+                & numerico
+                & (self._contem(nome_upper, "FOF") | self._contem(nome_upper, "ICATU")
+                   | self._contem(nome_upper, "SUPERPREVIDENCIA") | self._contem(nome_upper, "EMPIRICUS"))
+                & texto.str.strip().str.len().gt(15)
+                & pd.to_numeric(df[3].where(numerico), errors='coerce').gt(100)
+            ).astype(bool)
+            
+            for inicio, fim in self._blocos_previdencia(texto, fim_secao):
+                print(f"[DEBUG] Processando bloco de dados nas linhas {inicio}-{fim}")
                 
-                # 4. Processar dados após o cabeçalho até encontrar delimitador
-                linha_atual = linha_cabecalho + 1
-                while linha_atual < len(df):
-                    row = df.iloc[linha_atual]
-                    
-                    # Parar se encontrar delimitadores
-                    if (pd.notna(row.iloc[1]) and isinstance(row.iloc[1], str) and 
-                        (row.iloc[1].strip().lower() in ["rentabilidade"] or 
-                         "rentabilidade" in row.iloc[1].lower() or
-                         "plano >" in row.iloc[1].lower())):
-                        print(f"[DEBUG] Fim da seção encontrado na linha {linha_atual}: {row.iloc[1]}")
-                        break
-                    
-                    # Verificar se é linha de dados válida
-                    if (len(row) >= 6 and 
-                        pd.notna(row.iloc[1]) and isinstance(row.iloc[1], str) and
-                        pd.notna(row.iloc[3]) and isinstance(row.iloc[3], (int, float)) and
-                        ("FOF" in str(row.iloc[1]).upper() or 
-                         "ICATU" in str(row.iloc[1]).upper() or 
-                         "SUPERPREVIDENCIA" in str(row.iloc[1]).upper() or
-                         "EMPIRICUS" in str(row.iloc[1]).upper()) and
-                        len(str(row.iloc[1]).strip()) > 15 and
-                        float(row.iloc[3]) > 100):
-                        
-                        nome_fundo = str(row.iloc[1]).strip()
-                        data_ref = row.iloc[2] if pd.notna(row.iloc[2]) else datetime.now()
-                        quantidade_cotas = float(row.iloc[3])
-                        
-                        print(f"[DEBUG] Candidato a fundo encontrado na linha {linha_atual}: {nome_fundo}")
-                        
-                        # Gerar CNPJ dummy
-                        cnpj_dummy = self._gerar_cnpj_dummy(nome_fundo)
-                        
-                        if not isinstance(data_ref, datetime):
-                            try:
-                                if isinstance(data_ref, str):
-                                    data_ref = datetime.strptime(data_ref, "%Y-%m-%d")
-                            except:
-                                data_ref = datetime.now()
-                        
-                        posicoes.append({
-                            "nome_fundo": nome_fundo,
-                            "cnpj": cnpj_dummy,
-                            "num_cotas": quantidade_cotas,
-                            "data": data_ref,
-                            "tipo": "previdencia_externa"
-                        })
-                        print(f"[INFO] Previdência Externa encontrada: {nome_fundo}")
+                for i in validas.index[inicio:fim][validas.iloc[inicio:fim].to_numpy()]:
+                    nome_fundo = texto[i].strip()
+                    data_ref = df.at[i, 2] if pd.notna(df.at[i, 2]) else None
+                    quantidade_cotas = float(df.at[i, 3])
                     
-                    linha_atual += 1
+                    posicoes.append(PosicaoExtraida(
+                        nome_fundo=nome_fundo,
+                        cnpj=self._gerar_cnpj_dummy(nome_fundo),
+                        num_cotas=quantidade_cotas,
+                        data=self._converter_data(data_ref, "%Y-%m-%d"),
+                        tipo="previdencia_externa"
+                    ))
+                    print(f"[INFO] Previdência Externa encontrada: {nome_fundo}")
                         
         except Exception as e:
             print(f"[ERRO] Erro na Previdência Externa: {str(e)}")
         
         return posicoes
     
-    def _processar_aba_renda_fixa(self, file_path):
+    def _fatia_tabela(self, df, texto, inicio_secao, marcadores_secao=()):
+        """
+        Fatia de dados de uma tabela simples (seção, cabeçalho, linhas): começa
+        duas linhas após a seção e vai até a primeira célula vazia, "Total" ou
+        início de outra seção.
+        """
+        fim_tabela = df[1].isna() | self._contem(texto, "Total")
+        for marcador in marcadores_secao:
+            fim_tabela = fim_tabela | self._contem(texto, marcador)
+        
+        inicio = inicio_secao + 2
+        fim = self._primeira(fim_tabela.astype(bool), inicio)
+        return df.iloc[inicio:fim]
+    
+    def _processar_aba_renda_fixa(self, df) -> List[PosicaoExtraida]:
         """Processa aba Renda Fixa extraindo CDBs, LCIs, etc"""
         posicoes = []
+        print(f"[INFO] Processando Renda Fixa - {len(df)} linhas")
         
         try:
-            df = pd.read_excel(file_path, sheet_name="Renda Fixa", header=None)
-            print(f"[INFO] Processando Renda Fixa - {len(df)} linhas")
-            
+            texto = self._texto(df, 1)
             contador_rf = 1
             
-            secao_inicio = None
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Posição > CDB" in cell_value:
-                    secao_inicio = i
-                    break
-            
+            secao_inicio = self._primeira(self._contem(texto, "Posição > CDB"))
             if secao_inicio is None:
                 print("[AVISO] Seção 'Posição > CDB' não encontrada em Renda Fixa")
                 return posicoes
             
             header_row = secao_inicio + 1
-            
-            if not (isinstance(df.iloc[header_row, 1], str) and "Emissor" in df.iloc[header_row, 1]):
+            if not (header_row < len(df) and self._contem(texto, "Emissor").iloc[header_row]):
                 print("[AVISO] Cabeçalho de Renda Fixa não encontrado")
                 return posicoes
             
-            for i in range(header_row + 1, len(df)):
-                emissor = df.iloc[i, 1] if df.shape[1] > 1 else None
-                
-                if pd.isna(emissor) or (isinstance(emissor, str) and "Total" in emissor):
-                    break
-                
+            bloco = self._fatia_tabela(df, texto, secao_inicio)
+            
+            for i, row in zip(bloco.index, bloco.itertuples(index=False, name=None)):
                 try:
-                    codigo_ativo = str(df.iloc[i, 2]).strip() if pd.notna(df.iloc[i, 2]) else None
-                    quantidade = float(df.iloc[i, 9]) if pd.notna(df.iloc[i, 9]) else 0
-                    preco = float(df.iloc[i, 10]) if pd.notna(df.iloc[i, 10]) else 0
+                    emissor = row[1]
+                    codigo_ativo = str(row[2]).strip() if pd.notna(celula(row, 2)) else None
+                    quantidade = float(row[9]) if pd.notna(celula(row, 9)) else 0
+                    preco = float(row[10]) if pd.notna(celula(row, 10)) else 0
                     
                     if not codigo_ativo or quantidade == 0:
                         continue
@@ -434,17 +488,17 @@ class ExtractBTGService:
                     
                     nome_fundo = f"{emissor} - {codigo_ativo}"
                     
-                    posicoes.append({
-                        "nome_fundo": nome_fundo,
-                        "cnpj": cnpj_dummy,
-                        "num_cotas": quantidade,
-                        "data": datetime.now(),
-                        "tipo": "renda_fixa",
-                        "codigo_ativo": codigo_ativo,
-                        "classe_anbima": "renda_fixa",
-                        "risco": "baixo",
-                        "valor_cota": preco
-                    })
+                    posicoes.append(PosicaoExtraida(
+                        nome_fundo=nome_fundo,
+                        cnpj=cnpj_dummy,
+                        num_cotas=quantidade,
+                        data=None,  # a aba não traz data por ativo
+                        tipo="renda_fixa",
+                        codigo_ativo=codigo_ativo,
+                        classe_anbima="renda_fixa",
+                        risco="baixo",
+                        valor_cota=preco
+                    ))
                     
                     print(f"[INFO] RF extraída: {nome_fundo[:50]} | Qtd: {quantidade}")
                     
@@ -459,113 +513,54 @@ class ExtractBTGService:
             print(f"[ERRO] Erro ao processar aba Renda Fixa: {str(e)}")
             return posicoes
     
-    def _processar_aba_renda_variavel(self, file_path):
-        """Processa aba Renda Variável extraindo Ações e FIIs"""
+    def _processar_aba_renda_variavel(self, df) -> List[PosicaoExtraida]:
+        """Processa aba Renda Variável extraindo Ações e FIIs (seções de SECOES_RENDA_VARIAVEL)"""
         posicoes = []
+        print(f"[INFO] Processando Renda Variável - {len(df)} linhas")
         
         try:
-            df = pd.read_excel(file_path, sheet_name="Renda Variavel", header=None)
-            print(f"[INFO] Processando Renda Variável - {len(df)} linhas")
-            
-            contador_acoes = 1
-            contador_fiis = 1
-            
-            # ===== PROCESSAR AÇÕES =====
-            secao_acoes = None
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Posição > Ações" in cell_value:
-                    secao_acoes = i
-                    break
-            
-            if secao_acoes is not None:
-                header_acoes = secao_acoes + 1
-                
-                for i in range(header_acoes + 1, len(df)):
-                    codigo = df.iloc[i, 1] if df.shape[1] > 1 else None
-                    
-                    if pd.isna(codigo) or (isinstance(codigo, str) and "Total" in codigo):
-                        break
-                    
-                    try:
-                        nome_acao = str(df.iloc[i, 2]).strip() if pd.notna(df.iloc[i, 2]) else ""
-                        quantidade = float(df.iloc[i, 3]) if pd.notna(df.iloc[i, 3]) else 0
-                        preco = float(df.iloc[i, 4]) if pd.notna(df.iloc[i, 4]) else 0
-                        
-                        if quantidade == 0:
-                            continue
-                        
-                        codigo_limpo = str(codigo).replace("*", "").strip()
-                        cnpj_dummy = f"97.001.{contador_acoes:03d}/0001-{contador_acoes:02d}"
-                        contador_acoes += 1
-                        
-                        nome_fundo = f"{codigo_limpo} - {nome_acao}"
-                        
-                        posicoes.append({
-                            "nome_fundo": nome_fundo,
-                            "cnpj": cnpj_dummy,
-                            "num_cotas": quantidade,
-                            "data": datetime.now(),
-                            "tipo": "acao",
-                            "codigo_ativo": codigo_limpo,
-                            "classe_anbima": "acoes",
-                            "risco": "alto",
-                            "valor_cota": preco
-                        })
-                        
-                        print(f"[INFO] Ação extraída: {codigo_limpo} | Qtd: {quantidade}")
-                        
-                    except Exception as e:
-                        print(f"[AVISO] Erro ao processar ação linha {i}: {str(e)}")
-                        continue
+            texto = self._texto(df, 1)
             
-            # ===== PROCESSAR FIIs =====
-            secao_fiis = None
-            for i in range(len(df)):
-                cell_value = df.iloc[i, 1] if df.shape[1] > 1 else None
-                if isinstance(cell_value, str) and "Posição > Fundos imobiliários" in cell_value:
-                    secao_fiis = i
-                    break
-            
-            if secao_fiis is not None:
-                header_fiis = secao_fiis + 1
+            for marcador, (tipo, prefixo_cnpj, classe_anbima, risco, rotulo) in self.SECOES_RENDA_VARIAVEL.items():
+                secao_inicio = self._primeira(self._contem(texto, marcador))
+                if secao_inicio is None:
+                    continue
                 
-                for i in range(header_fiis + 1, len(df)):
-                    codigo = df.iloc[i, 1] if df.shape[1] > 1 else None
-                    
-                    if pd.isna(codigo) or (isinstance(codigo, str) and "Total" in codigo):
-                        break
-                    
+                bloco = self._fatia_tabela(df, texto, secao_inicio, self.SECOES_RENDA_VARIAVEL)
+                contador = 1
+                
+                for i, row in zip(bloco.index, bloco.itertuples(index=False, name=None)):
                     try:
-                        nome_fii = str(df.iloc[i, 2]).strip() if pd.notna(df.iloc[i, 2]) else ""
-                        quantidade = float(df.iloc[i, 3]) if pd.notna(df.iloc[i, 3]) else 0
-                        preco = float(df.iloc[i, 4]) if pd.notna(df.iloc[i, 4]) else 0
+                        codigo = row[1]
+                        nome_ativo = str(row[2]).strip() if pd.notna(celula(row, 2)) else ""
+                        quantidade = float(row[3]) if pd.notna(celula(row, 3)) else 0
+                        preco = float(row[4]) if pd.notna(celula(row, 4)) else 0
                         
                         if quantidade == 0:
                             continue
                         
                         codigo_limpo = str(codigo).replace("*", "").strip()
-                        cnpj_dummy = f"97.002.{contador_fiis:03d}/0001-{contador_fiis:02d}"
-                        contador_fiis += 1
+                        cnpj_dummy = f"{prefixo_cnpj}.{contador:03d}/0001-{contador:02d}"
+                        contador += 1
                         
-                        nome_fundo = f"{codigo_limpo} - {nome_fii}"
+                        nome_fundo = f"{codigo_limpo} - {nome_ativo}"
                         
-                        posicoes.append({
-                            "nome_fundo": nome_fundo,
-                            "cnpj": cnpj_dummy,
-                            "num_cotas": quantidade,
-                            "data": datetime.now(),
-                            "tipo": "fii",
-                            "codigo_ativo": codigo_limpo,
-                            "classe_anbima": "fundos_imobiliarios",
-                            "risco": "moderado",
-                            "valor_cota": preco
-                        })
+                        posicoes.append(PosicaoExtraida(
+                            nome_fundo=nome_fundo,
+                            cnpj=cnpj_dummy,
+                            num_cotas=quantidade,
+                            data=None,  # a aba não traz data por ativo
+                            tipo=tipo,
+                            codigo_ativo=codigo_limpo,
+                            classe_anbima=classe_anbima,
+                            risco=risco,
+                            valor_cota=preco
+                        ))
                         
-                        print(f"[INFO] FII extraído: {codigo_limpo} | Qtd: {quantidade}")
+                        print(f"[INFO] {rotulo}: {codigo_limpo} | Qtd: {quantidade}")
                         
                     except Exception as e:
-                        print(f"[AVISO] Erro ao processar FII linha {i}: {str(e)}")
+                        print(f"[AVISO] Erro ao processar {tipo} linha {i}: {str(e)}")
                         continue
             
             print(f"[INFO] Total Renda Variável extraídas: {len(posicoes)}")
@@ -596,24 +591,24 @@ class ExtractBTGService:
         print(f"[DEBUG] CNPJ dummy gerado: {cnpj_dummy}")
         return cnpj_dummy
     
-    def _deduplificar_posicoes(self, posicoes):
-        """Remove posições duplicadas baseado em CNPJ"""
+    def _deduplificar_posicoes(self, posicoes: List[PosicaoExtraida]) -> List[PosicaoExtraida]:
+        """Remove posições duplicadas baseado em CNPJ (chave_cnpj, calculada na criação)"""
         posicoes_unicas = {}
         
         for pos in posicoes:
-            cnpj_norm = pos['cnpj'].replace('.', '').replace('/', '').replace('-', '')
+            cnpj_norm = pos.chave_cnpj
             
             if cnpj_norm in posicoes_unicas:
                 pos_existente = posicoes_unicas[cnpj_norm]
                 
                 prioridades = {'fundo_normal': 3, 'previdencia_individual': 2, 'previdencia_externa': 1}
                 
-                prioridade_atual = prioridades.get(pos.get('tipo', ''), 0)
-                prioridade_existente = prioridades.get(pos_existente.get('tipo', ''), 0)
+                prioridade_atual = prioridades.get(pos.tipo or '', 0)
+                prioridade_existente = prioridades.get(pos_existente.tipo or '', 0)
                 
                 if prioridade_atual > prioridade_existente:
                     posicoes_unicas[cnpj_norm] = pos
-                    print(f"[INFO] Substituindo posição duplicada: {pos['nome_fundo']}")
+                    print(f"[INFO] Substituindo posição duplicada: {pos.nome_fundo}")
             else:
                 posicoes_unicas[cnpj_norm] = pos
         
@@ -1,36 +1,53 @@
 import pandas as pd
 from sqlalchemy.orm import Session
-import os, requests, zipfile
+import requests, tempfile, zipfile
+from contextlib import contextmanager
 from io import StringIO
 from app.models.geld_models import create_session, InfoFundo, PosicaoFundo, RiscoEnum, StatusFundoEnum
 from app.services.global_services import GlobalServices
 from datetime import datetime, timedelta
 # REMOVIDO: from flask import flash - não deve ser usado aqui
 
+# Acima deste tamanho o ZIP baixado da CVM transborda da memória para um
+# arquivo temporário anônimo (nome único, apagado ao fechar)
+LIMITE_ZIP_EM_MEMORIA = 64 * 1024 * 1024  # 64MB
+
 class ExtractServices:
     def __init__(self, db:Session = None):
         self.db=db
 
     #IPCA
     def extracao_bcb(self, codigo, data_inicio, data_fim):
-        """Extrai dados do Banco Central do Brasil"""
+        """
+        Extrai dados do Banco Central do Brasil (SGS).
+
+        Returns:
+            DataFrame com coluna 'valor' indexado pela data (vazio se o intervalo não tem pontos)
+
+        Raises:
+            RuntimeError: falha de rede, resposta HTTP de erro ou conteúdo inválido -
+                          quem chama não deve tratar como "intervalo sem dados"
+        """
+        url = f'https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo}/dados?formato=json&dataInicial={data_inicio}&dataFinal={data_fim}'
         try:
-            url = f'https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo}/dados?formato=json&dataInicial={data_inicio}&dataFinal={data_fim}'
             response = requests.get(url, timeout=10)
-            
+
+            # O SGS responde 404 quando o intervalo não tem nenhum valor
+            if response.status_code == 404:
+                return pd.DataFrame(columns=['valor'])
             if response.status_code != 200:
-                print(f"Erro ao acessar API do BCB. Status: {response.status_code}")
-                return pd.DataFrame()
-            
+                raise RuntimeError(f"status {response.status_code}")
+
             df = pd.read_json(StringIO(response.text))
-            
+            if df.empty:
+                return pd.DataFrame(columns=['valor'])
+
             df.set_index('data', inplace=True)
             df.index = pd.to_datetime(df.index, dayfirst=True)
             return df
-    
+
         except Exception as e:
-            print(f"Erro ao extrair dados do BCB: {str(e)}")
-            return pd.DataFrame()
+            raise RuntimeError(f"Erro ao extrair série {codigo} do BCB ({data_inicio} a {data_fim}): {e}") from e
 
     #VALOR DA COTA  
     def extracao_cvm(self):
@@ -41,9 +58,6 @@ class ExtractServices:
         Returns:
             DataFrame com colunas: CNPJ_FUNDO_CLASSE, VL_QUOTA, DT_COMPTC, DENOM_SOCIAL
         """
-        from datetime import datetime, timedelta
-        import zipfile
-        
         hoje = datetime.now()
         
         # Tentar mês atual primeiro
@@ -55,35 +69,24 @@ class ExtractServices:
             "anterior")
         ]
         
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
         for ano, mes, label in tentativas:
             ano_str = str(ano)
             mes_str = f"{mes:02d}"
             
-            url = f'https://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/inf_diario_fi_{ano_str}{mes_str}.zip'
-            zip_path = os.path.join(temp_dir, f"inf_diario_fi_{ano_str}{mes_str}.zip")
+            url = self.url_inf_diario_mes(ano, mes)
             
             try:
                 print(f"Baixando dados de {mes_str}/{ano_str} (mês {label})...")
                 
-                response = requests.get(url, timeout=30)
-                
-                if response.status_code == 404:
-                    print(f"❌ {mes_str}/{ano_str} não disponível")
-                    continue  # Tenta próximo mês
-                
-                if response.status_code != 200:
-                    print(f"Erro HTTP {response.status_code}")
-                    continue
-                
-                # Salvar ZIP
-                with open(zip_path, "wb") as arquivo_cvm:
-                    arquivo_cvm.write(response.content)
-                
-                # Extrair e ler CSV
-                with zipfile.ZipFile(zip_path) as arquivo_zip:
+                with self._abrir_zip_remoto(url, timeout=30) as (status, arquivo_zip):
+                    if status == 404:
+                        print(f"❌ {mes_str}/{ano_str} não disponível")
+                        continue  # Tenta próximo mês
+                    
+                    if status != 200:
+                        print(f"Erro HTTP {status}")
+                        continue
+                    
                     df = pd.read_csv(arquivo_zip.open(arquivo_zip.namelist()[0]), sep=";", encoding='ISO-8859-1')
                 
                 print(f"✅ {len(df)} registros de {mes_str}/{ano_str}")
@@ -92,19 +95,68 @@ class ExtractServices:
             except Exception as e:
                 print(f"Erro ao processar {mes_str}/{ano_str}: {str(e)}")
                 continue
-                
-            finally:
-                # Limpar arquivo temporário
-                try:
-                    if os.path.exists(zip_path):
-                        os.remove(zip_path)
-                except:
-                    pass
     
         # Se chegou aqui, nenhum mês funcionou
         print("❌ Não foi possível baixar dados da CVM")
         return pd.DataFrame()
 
+    @contextmanager
+    def _abrir_zip_remoto(self, url, timeout):
+        """
+        Baixa um ZIP em streaming para um buffer próprio da chamada e o abre.
+
+        O buffer fica em memória até LIMITE_ZIP_EM_MEMORIA e depois transborda
+        para um arquivo temporário anônimo, então não há caminho fixo em disco
+        nem disputa entre atualizações concorrentes.
+
+        Yields:
+            tuple: (status_code, zipfile.ZipFile ou None se status != 200)
+        """
+        with requests.get(url, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                yield response.status_code, None
+                return
+
+            with tempfile.SpooledTemporaryFile(max_size=LIMITE_ZIP_EM_MEMORIA) as buffer:
+                for bloco in response.iter_content(chunk_size=1024 * 1024):
+                    buffer.write(bloco)
+                buffer.seek(0)
+
+                with zipfile.ZipFile(buffer) as arquivo_zip:
+                    yield response.status_code, arquivo_zip
+
+    def verificar_arquivo_cvm(self, url):
+        """
+        Consulta apenas os cabeçalhos (HEAD) de um arquivo da CVM.
+
+        Returns:
+            dict {'etag', 'last_modified'} ou None se não foi possível verificar
+        """
+        try:
+            response = requests.head(url, timeout=15, allow_redirects=True)
+            if response.status_code != 200:
+                return None
+
+            validadores = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+            if not validadores['etag'] and not validadores['last_modified']:
+                return None
+            return validadores
+
+        except Exception as e:
+            print(f"[CVM] Erro ao verificar {url}: {str(e)}")
+            return None
+
+    def url_inf_diario_mes(self, ano, mes):
+        """URL do inf_diario_fi de um mês"""
+        return f"https://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/inf_diario_fi_{ano}{mes:02d}.zip"
+
+    def url_inf_mensal_fii(self, ano):
+        """URL do informe mensal de FIIs de um ano"""
+        return f"https://dados.cvm.gov.br/dados/FII/DOC/INF_MENSAL/DADOS/inf_mensal_fii_{ano}.zip"
+
     def baixar_inf_diario_mes(self, ano, mes):
         """
         Baixa o inf_diario_fi de um mês específico.
@@ -118,29 +170,20 @@ class ExtractServices:
         """
         ano_str = str(ano)
         mes_str = f"{mes:02d}"
-        nome_arquivo = f"inf_diario_fi_{ano_str}{mes_str}"
-        url = f"https://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/{nome_arquivo}.zip"
-        
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        zip_path = os.path.join(temp_dir, f"{nome_arquivo}.zip")
+        url = self.url_inf_diario_mes(ano, mes)
         
         try:
             print(f"[CVM] Baixando FI {mes_str}/{ano_str}...")
-            response = requests.get(url, timeout=60)
-            
-            if response.status_code == 404:
-                print(f"[CVM] {mes_str}/{ano_str} não disponível (404)")
-                return pd.DataFrame()
-            
-            if response.status_code != 200:
-                print(f"[CVM] Erro HTTP {response.status_code}")
-                return pd.DataFrame()
-            
-            with open(zip_path, "wb") as f:
-                f.write(response.content)
             
-            with zipfile.ZipFile(zip_path) as zf:
+            with self._abrir_zip_remoto(url, timeout=60) as (status, zf):
+                if status == 404:
+                    print(f"[CVM] {mes_str}/{ano_str} não disponível (404)")
+                    return pd.DataFrame()
+                
+                if status != 200:
+                    print(f"[CVM] Erro HTTP {status}")
+                    return pd.DataFrame()
+                
                 df = pd.read_csv(zf.open(zf.namelist()[0]), sep=";", encoding='ISO-8859-1')
             
             # Normalizar CNPJ uma única vez aqui
@@ -153,14 +196,8 @@ class ExtractServices:
             return df
             
         except Exception as e:
-            print(f"[CVM] Erro ao baixar {tipo.upper()} {mes_str}/{ano_str}: {str(e)}")
+            print(f"[CVM] Erro ao baixar FI {mes_str}/{ano_str}: {str(e)}")
             return pd.DataFrame()
-        finally:
-            try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-            except:
-                pass
 
     def baixar_inf_mensal_fii(self, ano):
         """
@@ -174,30 +211,21 @@ class ExtractServices:
             DataFrame com CNPJ_NORM e Valor_Patrimonial_Cotas, ou DataFrame vazio
         """
         ano_str = str(ano)
-        nome_arquivo = f"inf_mensal_fii_{ano_str}"
-        url = f"https://dados.cvm.gov.br/dados/FII/DOC/INF_MENSAL/DADOS/{nome_arquivo}.zip"
-
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        zip_path = os.path.join(temp_dir, f"{nome_arquivo}.zip")
+        url = self.url_inf_mensal_fii(ano)
 
         try:
             print(f"[CVM] Baixando informe mensal FII {ano_str}...")
-            response = requests.get(url, timeout=60)
-
-            if response.status_code == 404:
-                print(f"[CVM] Informe mensal FII {ano_str} não disponível (404)")
-                return pd.DataFrame()
 
-            if response.status_code != 200:
-                print(f"[CVM] Erro HTTP {response.status_code}")
-                return pd.DataFrame()
+            with self._abrir_zip_remoto(url, timeout=60) as (status, zf):
+                if status == 404:
+                    print(f"[CVM] Informe mensal FII {ano_str} não disponível (404)")
+                    return pd.DataFrame()
 
-            with open(zip_path, "wb") as f:
-                f.write(response.content)
+                if status != 200:
+                    print(f"[CVM] Erro HTTP {status}")
+                    return pd.DataFrame()
 
-            # Dentro do zip, queremos o CSV 'complemento'
-            with zipfile.ZipFile(zip_path) as zf:
+                # Dentro do zip, queremos o CSV 'complemento'
                 csv_target = next(
                     (name for name in zf.namelist() if 'complemento' in name.lower()),
                     None
@@ -228,12 +256,6 @@ class ExtractServices:
         except Exception as e:
             print(f"[CVM] Erro ao baixar informe mensal FII {ano_str}: {str(e)}")
             return pd.DataFrame()
-        finally:
-            try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-            except:
-                pass
 
     # FUNÇÃO INFO DOS FUNDOS CVM
     def extracao_cvm_info(self, cnpj, max_meses_anteriores=3):
@@ -7,6 +7,7 @@ from datetime import datetime
 from app.models.geld_models import InfoFundo, RiscoEnum, SubtipoRiscoEnum, StatusFundoEnum
 from app.services.extract_services import ExtractServices
 from app.services.global_services import GlobalServices
+from app.services.cnpj_utils import normalizar_cnpj
 
 
 class FundoRegistrationService:
@@ -36,7 +37,7 @@ class FundoRegistrationService:
         Cadastra automaticamente fundos que não existem no banco
         
         Args:
-            posicoes: Lista de posições extraídas (cada posição tem 'cnpj' e dados do fundo)
+            posicoes: Lista de PosicaoExtraida (cada posição tem cnpj/chave_cnpj e dados do fundo)
             
         Returns:
             dict: Mapeamento {cnpj_normalizado: fundo_id} de TODOS os fundos (novos + existentes)
@@ -107,11 +108,8 @@ class FundoRegistrationService:
         new_cnpjs = []
         
         for pos in posicoes:
-            cnpj = pos.get('cnpj')
-            if cnpj:
-                cnpj_normalizado = self._normalizar_cnpj(cnpj)
-                if cnpj_normalizado not in existing_funds:
-                    new_cnpjs.append(cnpj)
+            if pos.cnpj and pos.chave_cnpj not in existing_funds:
+                new_cnpjs.append(pos.cnpj)
         
         # Remover duplicatas
         return list(set(new_cnpjs))
@@ -273,8 +271,8 @@ class FundoRegistrationService:
         # Criar mapeamento CNPJ -> dados da posição
         cnpj_to_posicao = {}
         for pos in posicoes:
-            if pos['cnpj'] in cnpjs_dummy:
-                cnpj_to_posicao[pos['cnpj']] = pos
+            if pos.cnpj in cnpjs_dummy:
+                cnpj_to_posicao[pos.cnpj] = pos
         
         # Cadastrar cada fundo dummy
         for cnpj in cnpjs_dummy:
@@ -286,20 +284,20 @@ class FundoRegistrationService:
                 pos_data = cnpj_to_posicao[cnpj]
                 
                 # Determinar risco baseado no tipo
-                risco = self._determinar_risco_por_tipo(pos_data.get('tipo'))
+                risco = self._determinar_risco_por_tipo(pos_data.tipo)
                 
                 # Determinar subtipo de risco
-                subtipo_risco = pos_data.get('subtipo_risco')
+                subtipo_risco = pos_data.subtipo_risco
                 
                 # Usar valor_cota do Excel se disponível, senão 1.0
-                valor_cota = pos_data.get('valor_cota', 1.0)
+                valor_cota = pos_data.valor_cota if pos_data.valor_cota is not None else 1.0
                 
                 # Criar fundo
                 novo_fundo = self.global_services.create_classe(
                     InfoFundo,
-                    nome_fundo=pos_data['nome_fundo'],
+                    nome_fundo=pos_data.nome_fundo,
                     cnpj=cnpj,
-                    classe_anbima=pos_data.get('classe_anbima', 'Outros'),
+                    classe_anbima=pos_data.classe_anbima or 'Outros',
                     mov_min=None,
                     risco=risco,
                     subtipo_risco=subtipo_risco,
@@ -312,8 +310,8 @@ class FundoRegistrationService:
                 cnpj_normalizado = self._normalizar_cnpj(cnpj)
                 existing_funds[cnpj_normalizado] = novo_fundo.id
                 
-                tipo_label = pos_data.get('tipo', 'Ativo').upper()
-                nome_curto = pos_data['nome_fundo'][:50]
+                tipo_label = (pos_data.tipo or 'Ativo').upper()
+                nome_curto = pos_data.nome_fundo[:50]
                 print(f"[INFO] {tipo_label} cadastrado: {nome_curto} | Cota: {valor_cota}")
                 
             except Exception as e:
@@ -350,4 +348,4 @@ class FundoRegistrationService:
         Returns:
             str: CNPJ sem pontuação
         """
-        return cnpj.replace('.', '').replace('/', '').replace('-', '')
\ No newline at end of file
+        return normalizar_cnpj(cnpj)
\ No newline at end of file
@@ -1,10 +1,10 @@
 from sqlalchemy.orm import Session
 from typing import TypeVar, Type, Optional
 from functools import wraps
-from flask import session, redirect, url_for
+from flask import session, redirect, url_for, request, g
 import tkinter as tk
 from tkinter import filedialog
-import re
+from app.services import cnpj_utils
 
 #define classe genérica para abstrair os serviços
 class_set = TypeVar('class_set')
@@ -20,6 +20,34 @@ def login_required(f):
     return decorated_function
 
 
+#LIMITE DE UPLOAD
+
+def limite_upload(tamanho_maximo):
+    """
+    Limita o corpo da requisição da rota ao tamanho_maximo do upload (mais a folga
+    multipart) antes de ele ser lido: acima disso o Werkzeug recusa com 413 durante
+    a leitura. processar_upload_arquivo e a mensagem de 413 usam o mesmo limite.
+    """
+    from app.config import UPLOAD_FOLGA_MULTIPART
+
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            request.max_content_length = tamanho_maximo + UPLOAD_FOLGA_MULTIPART
+            g.upload_tamanho_maximo = tamanho_maximo
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorador
+
+
+def mensagem_arquivo_grande(tamanho_maximo=None):
+    """Mensagem de upload recusado, com o limite da rota atual (limite_upload)"""
+    from app.config import UPLOAD_TAMANHO_MAXIMO
+
+    tamanho_maximo = tamanho_maximo or g.get('upload_tamanho_maximo', UPLOAD_TAMANHO_MAXIMO)
+    return f"Arquivo muito grande. Tamanho máximo: {tamanho_maximo // (1024*1024)}MB"
+
+
 class GlobalServices:
     def __init__(self, db:Session):
         self.db=db
@@ -101,44 +129,35 @@ class GlobalServices:
 
 #Validar CNPJ
     def validar_cnpj(self, cnpj):
-        """ARGS: cnpj (qlq formato) retorna: tupla(is_valid, cnpj_normalizado, MSG)"""
-
-        cnpj_normalizado = re.sub(r'\D', '', cnpj)
-
-        if len(cnpj_normalizado) != 14:
-            return False, cnpj_normalizado, "CNPJ deve ter 14 dígitos"
-
-        return True, cnpj_normalizado, "CNPJ válido"
+        """ARGS: cnpj (qlq formato) retorna: tupla(is_valid, cnpj_normalizado, MSG) - ver cnpj_utils"""
+        return cnpj_utils.validar_cnpj(cnpj)
 
     def formatar_cnpj(self, cnpj_normalizado):
-        """Formata o CNPJ para o padrão XX.XXX.XXX/XXXX-XX"""
-
-        if len(cnpj_normalizado) != 14:
-            return cnpj_normalizado
-        return f"{cnpj_normalizado[:2]}.{cnpj_normalizado[2:5]}.{cnpj_normalizado[5:8]}/{cnpj_normalizado[8:12]}-{cnpj_normalizado[12:]}"
+        """Formata o CNPJ para o padrão XX.XXX.XXX/XXXX-XX - ver cnpj_utils"""
+        return cnpj_utils.formatar_cnpj(cnpj_normalizado)
 
 
 # # Selecionar arquivo
 
-    def processar_upload_arquivo(self):
+    def processar_upload_arquivo(self, extensoes=('xlsx', 'xls'), tamanho_maximo=None):
         """
-        Processa o upload de arquivo via Flask request
-        Retorna: (sucesso: bool, caminho_arquivo: str, mensagem: str)
+        Devolve o arquivo enviado via Flask request sem gravar em uploads/: o próprio stream
+        do Werkzeug (memória ou temporário anônimo), sem nova cópia. O corpo da requisição já
+        é limitado na leitura pelo limite da rota (limite_upload); aqui o arquivo em si é
+        conferido contra o mesmo limite.
+        Args: extensoes aceitas, tamanho_maximo em bytes (padrão: o de limite_upload, ou
+              UPLOAD_TAMANHO_MAXIMO)
+        Retorna: (sucesso: bool, buffer: arquivo binário posicionado no início, mensagem: str)
+        O chamador deve fechar o buffer após o processamento.
         """
-        from flask import request
-        from werkzeug.utils import secure_filename
         import os
+        from werkzeug.exceptions import RequestEntityTooLarge
+        from app.config import UPLOAD_TAMANHO_MAXIMO
 
-        try:
-            # Configurações
-            UPLOAD_FOLDER = 'uploads'
-            ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
-            MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
-
-            # Criar pasta de uploads se não existir
-            if not os.path.exists(UPLOAD_FOLDER):
-                os.makedirs(UPLOAD_FOLDER)
+        ALLOWED_EXTENSIONS = set(extensoes)
+        TAMANHO_MAXIMO = tamanho_maximo or g.get('upload_tamanho_maximo', UPLOAD_TAMANHO_MAXIMO)
 
+        try:
             # Verifica se há arquivo na requisição
             if 'arquivo' not in request.files:
                 return False, None, "Nenhum arquivo foi selecionado"
@@ -153,25 +172,22 @@ class GlobalServices:
             if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS):
                 return False, None, f"Tipo de arquivo não permitido. Tipos aceitos: {', '.join(ALLOWED_EXTENSIONS)}"
 
-            # Verifica o tamanho do arquivo
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)  # Volta para o início
-
-            if file_size > MAX_FILE_SIZE:
-                return False, None, f"Arquivo muito grande. Tamanho máximo: {MAX_FILE_SIZE // (1024*1024)}MB"
+            buffer = file.stream
+            tamanho = buffer.seek(0, os.SEEK_END)
+            buffer.seek(0)
 
-            # Salva o arquivo
-            filename = secure_filename(file.filename)
-            # Adiciona timestamp para evitar conflitos de nome
-            import time
-            timestamp = str(int(time.time() * 1000))
-            filename = f"{timestamp}_{filename}"
+            if tamanho > TAMANHO_MAXIMO:
+                buffer.close()
+                return False, None, mensagem_arquivo_grande(TAMANHO_MAXIMO)
 
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(filepath)
+            if tamanho == 0:
+                buffer.close()
+                return False, None, "O arquivo enviado está vazio"
 
-            return True, filepath, f"Arquivo '{file.filename}' enviado com sucesso"
+            return True, buffer, f"Arquivo '{file.filename}' recebido ({tamanho // 1024} KB)"
 
+        except RequestEntityTooLarge:
+            # Corpo acima do limite da rota: recusado pelo Werkzeug antes de ser lido inteiro
+            return False, None, mensagem_arquivo_grande(TAMANHO_MAXIMO)
         except Exception as e:
-            return False, None, f"Erro ao processar arquivo: {str(e)}"
\ No newline at end of file
+            return False, None, f"Erro ao processar arquivo: {str(e)}"
@@ -0,0 +1,314 @@
+"""
+Importação em lote de extratos (BTG, Advisor) de vários clientes
+
+Recebe um ZIP ou uma pasta com os extratos do mês e importa cada arquivo para o
+cliente identificado pelo CPF no nome do arquivo ou, se não houver, no conteúdo
+das primeiras linhas da planilha. O parsing (CPU-bound e sem banco) roda em
+processos separados; a gravação roda no processo principal, em uma única sessão,
+com o mesmo pipeline do upload individual (PipelineIngestao).
+Cada arquivo é confirmado em sua própria transação: um extrato com erro não
+desfaz os demais.
+
+Uso (na raiz do projeto):
+    python -m app.services.importacao_lote_service extratos_outubro.zip
+    python -m app.services.importacao_lote_service pasta_extratos/ --processos 4
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import UPLOAD_TAMANHO_MAXIMO, IMPORTACAO_LOTE_MAX_ARQUIVOS, IMPORTACAO_LOTE_TAMANHO_TOTAL
+from app.services.pipeline_ingestao_service import LEITORES, PipelineIngestao
+from app.services.posicao_extraida import LotePosicoes
+from app.services.verificacao_extrato_service import LINHAS_AMOSTRA, verificar_extrato
+
+
+EXTENSOES = ('.xlsx', '.xls')
+LINHAS_BUSCA_CPF = LINHAS_AMOSTRA   # linhas de cada aba onde se procura o CPF do titular
+
+ARQUIVOS_POR_PROCESSO = 2         # extratos lidos e enviados aos processos à frente do mais antigo pendente
+
+PADRAO_CPF = re.compile(r'(?<!\d)(\d{3})\.?(\d{3})\.?(\d{3})-?(\d{2})(?!\d)')
+
+
+def cpfs_no_texto(texto) -> List[str]:
+    """CPFs (11 dígitos, com ou sem pontuação) presentes no texto"""
+    return [''.join(grupos) for grupos in PADRAO_CPF.findall(str(texto))]
+
+
+def _cpfs_no_conteudo(amostras: Dict[str, List[tuple]]) -> List[str]:
+    """CPFs nas primeiras linhas das abas (lidas pela verificação prévia)"""
+    encontrados = []
+    for linhas in amostras.values():
+        for linha in linhas[:LINHAS_BUSCA_CPF]:
+            for valor in linha:
+                if isinstance(valor, str):
+                    encontrados.extend(cpf for cpf in cpfs_no_texto(valor) if cpf not in encontrados)
+    return encontrados
+
+
+def _extrair_arquivo(nome: str, conteudo: bytes) -> Dict:
+    """
+    Ponto de entrada do processo filho: verificação prévia (formato e layout),
+    CPFs no conteúdo e extração pelo leitor do formato. Não acessa o banco.
+    """
+    inicio = time.perf_counter()
+    resultado = {'arquivo': nome, 'formato': None, 'cpfs': [], 'posicoes': [], 'erro': None,
+                 'hash': hashlib.sha256(conteudo).hexdigest()}
+    try:
+        diagnostico = verificar_extrato(conteudo)
+        resultado['formato'] = diagnostico['formato']
+        resultado['cpfs'] = _cpfs_no_conteudo(diagnostico['amostras'])
+
+        if diagnostico['erro']:
+            raise ValueError(diagnostico['erro'])
+
+        posicoes, log = LEITORES[resultado['formato']].extrair(conteudo)
+        # Em colunas: volta ao processo principal em um pickle bem menor que um objeto por posição
+        resultado['posicoes'] = posicoes if isinstance(posicoes, LotePosicoes) else LotePosicoes.de_registros(posicoes)
+        if log.get('erros') and not posicoes:
+            resultado['erro'] = '; '.join(map(str, log['erros']))
+    except Exception as e:
+        resultado['erro'] = str(e)
+
+    resultado['tempo_extracao'] = time.perf_counter() - inicio
+    return resultado
+
+
+class ImportacaoLoteService:
+
+    @staticmethod
+    @contextmanager
+    def coletar_arquivos(origem) -> Iterator[Tuple[List[Tuple[str, Callable[[], bytes]]], List[Dict]]]:
+        """
+        Lista os extratos de um ZIP (caminho, bytes ou objeto binário) ou de uma pasta,
+        sem ler o conteúdo: cada arquivo vem com uma função que o lê quando chamada,
+        enquanto o bloco with estiver aberto (o ZIP fica aberto até a saída).
+
+        Raises:
+            ValueError: lote acima de IMPORTACAO_LOTE_MAX_ARQUIVOS ou IMPORTACAO_LOTE_TAMANHO_TOTAL
+
+        Yields:
+            ([(nome, ler)], [itens do relatório para arquivos ignorados])
+        """
+        if isinstance(origem, (str, os.PathLike)) and os.path.isdir(origem):
+            entradas = []
+            for raiz, _, nomes in os.walk(origem):
+                for nome in sorted(nomes):
+                    caminho = os.path.join(raiz, nome)
+                    if ImportacaoLoteService._eh_extrato(nome):
+                        entradas.append((os.path.relpath(caminho, origem), os.path.getsize(caminho),
+                                         partial(ImportacaoLoteService._ler_arquivo, caminho)))
+            yield ImportacaoLoteService._filtrar_entradas(entradas)
+            return
+
+        if isinstance(origem, (bytes, bytearray)):
+            origem = io.BytesIO(origem)
+
+        with zipfile.ZipFile(origem) as zf:
+            entradas = [
+                (info.filename, info.file_size, partial(zf.read, info))
+                for info in zf.infolist()
+                if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                and ImportacaoLoteService._eh_extrato(os.path.basename(info.filename))
+            ]
+            yield ImportacaoLoteService._filtrar_entradas(entradas)
+
+    @staticmethod
+    def _filtrar_entradas(entradas):
+        """
+        Confere os limites do lote pelos tamanhos declarados (sem ler nada) e separa os
+        arquivos acima do limite de upload individual.
+        """
+        if len(entradas) > IMPORTACAO_LOTE_MAX_ARQUIVOS:
+            raise ValueError(f"Lote com {len(entradas)} extratos. Máximo: {IMPORTACAO_LOTE_MAX_ARQUIVOS}")
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        if total > IMPORTACAO_LOTE_TAMANHO_TOTAL:
+            raise ValueError(f"Lote com {total // (1024*1024)}MB descompactados. "
+                             f"Máximo: {IMPORTACAO_LOTE_TAMANHO_TOTAL // (1024*1024)}MB")
+
+        arquivos = []
+        ignorados = []
+        for nome, tamanho, ler in entradas:
+            if tamanho > UPLOAD_TAMANHO_MAXIMO:
+                ignorados.append(ImportacaoLoteService._item_erro(nome, 'Arquivo maior que o limite de upload'))
+            else:
+                arquivos.append((nome, ler))
+        return arquivos, ignorados
+
+    @staticmethod
+    def _ler_arquivo(caminho):
+        with open(caminho, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def importar(origem, max_processos: Optional[int] = None) -> Dict:
+        """
+        Importa todos os extratos do ZIP/pasta.
+
+        Args:
+            origem: ZIP (caminho, bytes ou objeto binário) ou caminho de uma pasta
+            max_processos: Processos de parsing (None = núcleos da máquina; 1 = sem processos filhos)
+
+        Returns:
+            dict: {'arquivos': [relatório por arquivo], 'resumo': {status: quantidade}, 'tempos': {...}}
+        """
+        # Imports tardios: o parsing nos processos filhos não precisa do banco
+        from app.models.geld_models import create_session, Cliente
+        from app.services.dashboard_service import DashboardService
+
+        inicio = time.perf_counter()
+        tempos = {}
+
+        with ImportacaoLoteService.coletar_arquivos(origem) as (arquivos, relatorio):
+            tempos['leitura'] = time.perf_counter() - inicio
+            print(f"[INFO] Importação em lote: {len(arquivos)} extratos encontrados")
+
+            # 1. Parsing em paralelo (sem banco); cada arquivo é lido só quando vai para a extração
+            etapa = time.perf_counter()
+            extraidos = ImportacaoLoteService._extrair_todos(arquivos, max_processos)
+            tempos['extracao'] = time.perf_counter() - etapa
+
+        db = create_session()
+        try:
+            clientes_por_cpf = {cpf: (cliente_id, nome) for cliente_id, nome, cpf in db.query(Cliente.id, Cliente.nome, Cliente.cpf)}
+
+            # 2. Gravação sequencial em uma única sessão
+            etapa = time.perf_counter()
+            houve_alteracao = False
+
+            for (nome, _), extraido in zip(arquivos, extraidos):
+                item = {
+                    'arquivo': nome, 'formato': extraido['formato'], 'cliente_id': None, 'cliente': None,
+                    'status': 'erro', 'mensagem': '', 'tempo_extracao': extraido['tempo_extracao'], 'tempo_gravacao': 0.0,
+                }
+                relatorio.append(item)
+
+                if extraido['erro']:
+                    item['mensagem'] = extraido['erro']
+                    continue
+
+                cliente = ImportacaoLoteService._identificar_cliente(nome, extraido['cpfs'], clientes_por_cpf)
+                if cliente is None:
+                    item['status'] = 'sem_cliente'
+                    item['mensagem'] = 'Nenhum CPF de cliente cadastrado no nome do arquivo ou no conteúdo'
+                    continue
+                item['cliente_id'], item['cliente'] = cliente
+
+                if not extraido['posicoes']:
+                    item['mensagem'] = 'Nenhuma posição válida foi extraída do arquivo'
+                    continue
+
+                inicio_gravacao = time.perf_counter()
+                try:
+                    # Mesmo pipeline do upload individual, a partir das posições já extraídas
+                    pipeline = PipelineIngestao(db, extraido['formato'], atualizar_dashboard=False)
+                    resultado = pipeline.importar_extraidas(item['cliente_id'], extraido['posicoes'],
+                                                            extraido['hash'], os.path.basename(nome))
+                    item['status'] = resultado['status']
+                    item['mensagem'] = resultado['mensagem']
+                    houve_alteracao = houve_alteracao or resultado['houve_alteracao']
+                except Exception as e:
+                    item['status'] = 'erro'
+                    item['mensagem'] = f"Erro ao gravar: {str(e)}"
+                    print(f"[ERRO] {nome}: {str(e)}")
+                finally:
+                    item['tempo_gravacao'] = time.perf_counter() - inicio_gravacao
+
+            if houve_alteracao:
+                DashboardService.atualizar_snapshot(db)
+            tempos['gravacao'] = time.perf_counter() - etapa
+        finally:
+            db.close()
+
+        tempos['total'] = time.perf_counter() - inicio
+
+        resumo = {}
+        for item in relatorio:
+            resumo[item['status']] = resumo.get(item['status'], 0) + 1
+        print(f"[INFO] Importação em lote concluída em {tempos['total']:.1f}s: {resumo}")
+
+        return {'arquivos': relatorio, 'resumo': resumo, 'tempos': tempos}
+
+    @staticmethod
+    def _extrair_todos(arquivos, max_processos=None) -> List[Dict]:
+        """
+        Extrai os arquivos em processos separados, preservando a ordem de entrada.
+        Cada arquivo é lido só ao ser enviado, com no máximo ARQUIVOS_POR_PROCESSO por
+        processo em trânsito: o lote nunca fica inteiro em memória.
+        """
+        if max_processos == 1 or len(arquivos) <= 1:
+            return [_extrair_arquivo(nome, ler()) for nome, ler in arquivos]
+
+        janela = (max_processos or os.cpu_count() or 1) * ARQUIVOS_POR_PROCESSO
+        extraidos = []
+        pendentes = deque()
+        with ProcessPoolExecutor(max_workers=max_processos) as executor:
+            for nome, ler in arquivos:
+                if len(pendentes) >= janela:
+                    extraidos.append(pendentes.popleft().result())
+                pendentes.append(executor.submit(_extrair_arquivo, nome, ler()))
+            extraidos.extend(futuro.result() for futuro in pendentes)
+        return extraidos
+
+    @staticmethod
+    def _identificar_cliente(nome_arquivo, cpfs_conteudo, clientes_por_cpf):
+        """
+        CPF no nome do arquivo tem prioridade; no conteúdo, só vale se apontar para um único cliente.
+
+        Returns:
+            (cliente_id, nome) ou None
+        """
+        for cpf in cpfs_no_texto(os.path.basename(nome_arquivo)):
+            if cpf in clientes_por_cpf:
+                return clientes_por_cpf[cpf]
+
+        encontrados = {clientes_por_cpf[cpf] for cpf in cpfs_conteudo if cpf in clientes_por_cpf}
+        if len(encontrados) == 1:
+            return encontrados.pop()
+        return None
+
+    @staticmethod
+    def _eh_extrato(nome):
+        return nome.lower().endswith(EXTENSOES) and not nome.startswith(('~$', '.'))
+
+    @staticmethod
+    def _item_erro(nome, mensagem):
+        return {
+            'arquivo': nome, 'formato': None, 'cliente_id': None, 'cliente': None,
+            'status': 'erro', 'mensagem': mensagem, 'tempo_extracao': 0.0, 'tempo_gravacao': 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('origem', help='arquivo .zip ou pasta com os extratos')
+    parser.add_argument('--processos', type=int, default=None,
+                        help='processos de parsing (padrão: núcleos da máquina; 1 = sem processos filhos)')
+    args = parser.parse_args()
+
+    from app.models.geld_models import init_db
+    init_db()
+
+    resultado = ImportacaoLoteService.importar(args.origem, max_processos=args.processos)
+
+    for item in resultado['arquivos']:
+        cliente = item['cliente'] or '-'
+        print(f"{item['status']:<11} {item['arquivo'][:45]:<45} {(item['formato'] or '-'):<8} {cliente[:25]:<25} "
+              f"extração {item['tempo_extracao'] * 1000:7.0f} ms | gravação {item['tempo_gravacao'] * 1000:7.0f} ms | {item['mensagem']}")
+    tempos = ', '.join(f"{etapa}={segundos:.2f}s" for etapa, segundos in resultado['tempos'].items())
+    print(f"[INFO] Resumo: {resultado['resumo']} | {tempos}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Serviço de indicadores econômicos (séries do BCB/SGS).
+
+Responsabilidade: manter uma cópia local das séries usadas pelo sistema e
+responder leituras sem chamar a API do Banco Central.
+
+Fluxo de sincronização:
+1. Descobre o último ponto gravado da série
+2. Pede à API apenas as datas posteriores (janelas de até 10 anos)
+3. Grava os pontos novos em SerieEconomica
+4. Se uma janela falha, para ali: a próxima sincronização recomeça dela, sem
+   deixar buraco no histórico
+"""
+
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.geld_models import SerieEconomica, IndicadoresEconomicos
+from app.services.extract_services import ExtractServices
+from app.services.cache_requisicao import memorizar_por_requisicao
+
+
+class IndicadorService:
+
+    SERIE_IPCA_MENSAL = 433    # IPCA variação mensal (%)
+    SERIE_IPCA_12M    = 13522  # IPCA acumulado 12 meses (%)
+
+    SERIES_SINCRONIZADAS = (SERIE_IPCA_MENSAL, SERIE_IPCA_12M)
+
+    # Primeira data pedida quando a série ainda não tem nenhum ponto local
+    DATA_INICIO_HISTORICO = datetime(1995, 1, 1)
+
+    # A API do SGS limita o intervalo de cada consulta a 10 anos
+    JANELA_MAXIMA_DIAS = 365 * 10
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.extract = ExtractServices(db)
+        self.series_incompletas = []  # séries cuja sincronização parou em uma janela com falha
+
+    @staticmethod
+    @memorizar_por_requisicao
+    def indicadores_atuais(session: Session) -> Optional[IndicadoresEconomicos]:
+        """Registro de indicadores mais recente (IPCA anual e mensal) - uma leitura por requisição"""
+        return session.query(IndicadoresEconomicos).order_by(
+            IndicadoresEconomicos.data_atualizacao.desc()
+        ).first()
+
+    @staticmethod
+    @memorizar_por_requisicao
+    def ponto_em(session: Session, codigo: int, as_of: datetime) -> Optional[Tuple[datetime, float]]:
+        """(data, valor) do último ponto da série até as_of, ou None - avaliação em data passada"""
+        ponto = session.query(SerieEconomica.data, SerieEconomica.valor).filter(
+            SerieEconomica.codigo_serie == codigo,
+            SerieEconomica.data <= as_of
+        ).order_by(SerieEconomica.data.desc()).first()
+
+        return (ponto.data, ponto.valor) if ponto else None
+
+    @staticmethod
+    def ipca_mensal_equivalente(ipca_12m: float) -> float:
+        """IPCA mensal (%) equivalente ao acumulado em 12 meses (%)"""
+        return ((1 + ipca_12m / 100) ** (1 / 12) - 1) * 100
+
+    # =========================================================================
+    # SINCRONIZAÇÃO
+    # =========================================================================
+
+    def sincronizar_serie(self, codigo: int) -> int:
+        """
+        Busca na API apenas os pontos posteriores ao último gravado.
+        Para na primeira janela que falhar (série entra em series_incompletas):
+        os pontos gravados até ali são contínuos e a próxima execução recomeça dela.
+        NÃO faz commit — responsabilidade da rota.
+
+        Returns:
+            int: quantidade de pontos novos gravados
+        """
+        ultima_data = self.db.query(func.max(SerieEconomica.data)).filter(
+            SerieEconomica.codigo_serie == codigo
+        ).scalar()
+
+        inicio = ultima_data + timedelta(days=1) if ultima_data else self.DATA_INICIO_HISTORICO
+        hoje = datetime.now()
+
+        if inicio > hoje:
+            return 0
+
+        novos = 0
+        while inicio <= hoje:
+            fim = min(inicio + timedelta(days=self.JANELA_MAXIMA_DIAS), hoje)
+            try:
+                df = self.extract.extracao_bcb(codigo, inicio.strftime('%d/%m/%Y'), fim.strftime('%d/%m/%Y'))
+            except RuntimeError as e:
+                print(f"[BCB] {e} - sincronização interrompida, retomada na próxima execução")
+                self.series_incompletas.append(codigo)
+                break
+
+            if not df.empty:
+                for data, valor in zip(df.index, df['valor']):
+                    data = data.to_pydatetime()
+                    # A API devolve o último ponto mesmo quando dataInicial é posterior a ele
+                    if ultima_data and data <= ultima_data:
+                        continue
+                    self.db.add(SerieEconomica(codigo_serie=codigo, data=data, valor=float(valor)))
+                    ultima_data = data
+                    novos += 1
+
+            inicio = fim + timedelta(days=1)
+
+        print(f"[BCB] Série {codigo}: {novos} pontos novos")
+        return novos
+
+    def atualizar_indicadores(self) -> dict:
+        """
+        Sincroniza as séries de IPCA e atualiza o registro de IndicadoresEconomicos
+        a partir dos dados locais. NÃO faz commit.
+
+        Returns:
+            dict: {'novos_pontos': {codigo: int}, 'series_incompletas': [codigo],
+                   'ipca': float | None, 'ipca_mes': float | None}
+        """
+        novos_pontos = {codigo: self.sincronizar_serie(codigo) for codigo in self.SERIES_SINCRONIZADAS}
+        self.db.flush()
+
+        resultado = {
+            'novos_pontos': novos_pontos,
+            'series_incompletas': list(self.series_incompletas),
+            'ipca': None,
+            'ipca_mes': None
+        }
+
+        ultimo_ipca = self.ultimo_ponto(self.SERIE_IPCA_12M)
+        if not ultimo_ipca:
+            return resultado
+
+        ipca_12m = ultimo_ipca[1]
+        ipca_mes = self.ipca_mensal_equivalente(ipca_12m)
+
+        indicadores = self.db.query(IndicadoresEconomicos).first()
+        if not indicadores:
+            indicadores = IndicadoresEconomicos()
+            self.db.add(indicadores)
+
+        indicadores.ipca = ipca_12m
+        indicadores.ipca_mes = ipca_mes
+        indicadores.data_atualizacao = datetime.now()
+
+        resultado['ipca'] = ipca_12m
+        resultado['ipca_mes'] = ipca_mes
+        return resultado
+
+    # =========================================================================
+    # LEITURAS LOCAIS
+    # =========================================================================
+
+    def ultimo_ponto(self, codigo: int) -> Optional[Tuple[datetime, float]]:
+        """Retorna (data, valor) do ponto mais recente da série, ou None"""
+        ponto = self.db.query(SerieEconomica.data, SerieEconomica.valor).filter(
+            SerieEconomica.codigo_serie == codigo
+        ).order_by(SerieEconomica.data.desc()).first()
+
+        return (ponto.data, ponto.valor) if ponto else None
+
+    def historico(self, codigo: int, desde: Optional[datetime] = None) -> List[Tuple[datetime, float]]:
+        """Retorna [(data, valor)] da série em ordem cronológica"""
+        query = self.db.query(SerieEconomica.data, SerieEconomica.valor).filter(
+            SerieEconomica.codigo_serie == codigo
+        )
+        if desde:
+            query = query.filter(SerieEconomica.data >= desde)
+
+        return [(p.data, p.valor) for p in query.order_by(SerieEconomica.data).all()]
@@ -0,0 +1,161 @@
+"""
+Serviço de ingestão de extratos - cache por conteúdo (SHA-256)
+
+O mesmo extrato BTG/Advisor costuma ser reenviado várias vezes. Cada importação
+fica registrada em ingestoes_extrato com o hash do arquivo e as posições extraídas;
+no reenvio do mesmo arquivo para o mesmo cliente a rota:
+- não faz nada, se essa foi a última importação e as posições não mudaram desde então;
+- senão reaplica as posições guardadas, sem abrir a planilha de novo.
+
+Usado por:
+- posicao.py (upload_cotas)
+- posicao_advisor.py (upload_advisor)
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.geld_models import IngestaoExtrato, PosicaoFundo, RiscoEnum, SubtipoRiscoEnum
+from app.services.posicao_extraida import LotePosicoes, PosicaoExtraida
+
+
+TAMANHO_BLOCO = 64 * 1024
+
+# Enums que aparecem em PosicaoExtraida (risco/subtipo_risco)
+ENUMS_SERIALIZAVEIS = {
+    'RiscoEnum': RiscoEnum,
+    'SubtipoRiscoEnum': SubtipoRiscoEnum,
+}
+
+
+class IngestaoService:
+
+    @staticmethod
+    def calcular_sha256(arquivo) -> str:
+        """SHA-256 do arquivo binário (lido em blocos); o arquivo volta para o início."""
+        sha = hashlib.sha256()
+        arquivo.seek(0)
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+            sha.update(bloco)
+        arquivo.seek(0)
+        return sha.hexdigest()
+
+    @staticmethod
+    def buscar(session: Session, cliente_id: int, banco_custodia: str, sha256: str) -> Optional[IngestaoExtrato]:
+        return session.query(IngestaoExtrato).filter_by(
+            cliente_id=cliente_id,
+            banco_custodia=banco_custodia,
+            sha256=sha256
+        ).first()
+
+    @staticmethod
+    def listar_recentes(session: Session, cliente_id: int, banco_custodia: str, limite: int = 5) -> List[IngestaoExtrato]:
+        """Importações do cliente nesse banco, da aplicada mais recentemente para a mais antiga."""
+        return session.query(IngestaoExtrato).filter_by(
+            cliente_id=cliente_id,
+            banco_custodia=banco_custodia
+        ).order_by(IngestaoExtrato.data_aplicacao.desc()).limit(limite).all()
+
+    @staticmethod
+    def contar_posicoes(session: Session, cliente_id: int, banco_custodia: str):
+        """(quantidade, data_atualizacao mais recente) das posições do cliente nesse banco."""
+        return session.query(
+            func.count(PosicaoFundo.id),
+            func.max(PosicaoFundo.data_atualizacao)
+        ).filter(
+            PosicaoFundo.cliente_id == cliente_id,
+            PosicaoFundo.banco_custodia == banco_custodia
+        ).one()
+
+    @staticmethod
+    def pode_ignorar(session: Session, ingestao: IngestaoExtrato) -> bool:
+        """
+        True se reaplicar o extrato não mudaria nada: ele foi o último aplicado nesse banco
+        e as posições continuam como ficaram (mesma quantidade, nenhuma criada ou editada
+        manualmente depois - essas rotas gravam data_atualizacao = agora).
+        """
+        ultima = IngestaoService.listar_recentes(session, ingestao.cliente_id, ingestao.banco_custodia, limite=1)
+        if not ultima or ultima[0].id != ingestao.id:
+            return False
+
+        quantidade, data_mais_recente = IngestaoService.contar_posicoes(
+            session, ingestao.cliente_id, ingestao.banco_custodia
+        )
+        if quantidade != ingestao.posicoes_registradas:
+            return False
+        return data_mais_recente is None or data_mais_recente <= ingestao.data_aplicacao
+
+    @staticmethod
+    def carregar_posicoes(ingestao: IngestaoExtrato) -> LotePosicoes:
+        dados = json.loads(ingestao.posicoes, object_hook=IngestaoService._decodificar)
+        if isinstance(dados, list):
+            # Importações gravadas antes do formato em colunas: uma posição por dicionário
+            return LotePosicoes.de_registros(PosicaoExtraida.de_dict(pos) for pos in dados)
+        return LotePosicoes(dados['colunas'])
+
+    @staticmethod
+    def registrar(session: Session, cliente_id: int, banco_custodia: str, sha256: str,
+                  posicoes: Iterable[PosicaoExtraida], resultado: str, nome_arquivo: str = None) -> IngestaoExtrato:
+        """
+        Grava a importação depois que as posições foram aplicadas. Reenvio de um arquivo
+        já conhecido conta como reutilização. Não faz commit.
+        """
+        agora = datetime.now()
+        ingestao = IngestaoService.buscar(session, cliente_id, banco_custodia, sha256)
+
+        if ingestao is None:
+            ingestao = IngestaoExtrato(
+                cliente_id=cliente_id,
+                banco_custodia=banco_custodia,
+                sha256=sha256,
+                posicoes=json.dumps(
+                    {'colunas': LotePosicoes.de_registros(posicoes).para_colunas()},
+                    default=IngestaoService._codificar
+                ),
+                data_importacao=agora,
+                reutilizacoes=0
+            )
+            session.add(ingestao)
+        else:
+            ingestao.reutilizacoes = (ingestao.reutilizacoes or 0) + 1
+            ingestao.data_reenvio = agora
+
+        if nome_arquivo:
+            ingestao.nome_arquivo = nome_arquivo
+        ingestao.resultado = resultado
+        ingestao.posicoes_registradas = IngestaoService.contar_posicoes(session, cliente_id, banco_custodia)[0]
+        ingestao.data_aplicacao = agora
+        session.flush()
+        return ingestao
+
+    @staticmethod
+    def marcar_reenvio_ignorado(session: Session, ingestao: IngestaoExtrato) -> None:
+        """Reenvio idêntico que não precisou de nenhuma gravação. Não faz commit."""
+        ingestao.reutilizacoes = (ingestao.reutilizacoes or 0) + 1
+        ingestao.data_reenvio = datetime.now()
+        session.flush()
+
+    @staticmethod
+    def _codificar(valor):
+        """json.dumps default: datas e enums das posições extraídas."""
+        if isinstance(valor, datetime):
+            return {'__datetime__': valor.isoformat()}
+        for nome, classe in ENUMS_SERIALIZAVEIS.items():
+            if isinstance(valor, classe):
+                return {'__enum__': nome, 'nome': valor.name}
+        if hasattr(valor, 'item'):  # escalares numpy
+            return valor.item()
+        raise TypeError(f"Valor não serializável na posição: {valor!r}")
+
+    @staticmethod
+    def _decodificar(objeto):
+        if '__datetime__' in objeto:
+            return datetime.fromisoformat(objeto['__datetime__'])
+        if '__enum__' in objeto:
+            return ENUMS_SERIALIZAVEIS[objeto['__enum__']][objeto['nome']]
+        return objeto
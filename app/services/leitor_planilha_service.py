@@ -0,0 +1,97 @@
+"""
+Leitor de planilhas de extrato em streaming (BTG, Advisor)
+
+Abre o XLSX com openpyxl em modo read_only/values_only e entrega as linhas de
+uma aba sob demanda, como tuplas. A memória não cresce com o tamanho da aba e
+o processamento começa antes de a aba inteira ser lida.
+Arquivos .xls (Excel 97-2003, não suportado pelo openpyxl) caem no pandas.
+"""
+
+import io
+import pandas as pd
+from openpyxl import load_workbook
+
+
+ASSINATURA_XLS = b'\xd0\xcf\x11\xe0'  # cabeçalho OLE2 dos arquivos .xls
+
+
+def celula(linha, indice):
+    """Valor da coluna `indice` da linha, ou None se a linha for mais curta."""
+    return linha[indice] if indice < len(linha) else None
+
+
+class LeitorPlanilha:
+
+    def __init__(self, origem):
+        """
+        Args:
+            origem: Caminho do arquivo, bytes ou objeto binário (com read/seek)
+        """
+        self._workbook = None
+        self._excel_xls = None
+
+        if isinstance(origem, (bytes, bytearray)):
+            origem = io.BytesIO(origem)
+
+        if self._eh_xls(origem):
+            self._excel_xls = pd.ExcelFile(origem)
+        else:
+            self._workbook = load_workbook(origem, read_only=True, data_only=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        """Libera o arquivo (o modo read_only mantém o zip aberto)."""
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._excel_xls is not None:
+            self._excel_xls.close()
+            self._excel_xls = None
+
+    @property
+    def abas(self):
+        """Nomes das abas na ordem do arquivo."""
+        if self._workbook is not None:
+            return list(self._workbook.sheetnames)
+        return list(self._excel_xls.sheet_names)
+
+    def linhas(self, aba, limite=None):
+        """
+        Gera as linhas da aba como tuplas, com None nas células vazias.
+        Cada linha vai até a sua última célula preenchida (use celula() para
+        ler colunas que podem faltar). Aba inexistente não gera nenhuma linha.
+
+        Args:
+            limite: Lê só as primeiras `limite` linhas (None = aba inteira)
+        """
+        if aba not in self.abas:
+            return
+
+        if self._workbook is not None:
+            ws = self._workbook[aba]
+            # A tag <dimension> de exportações de corretora costuma estar errada
+            # (ex.: "A1"); sem ela o openpyxl lê as linhas e colunas que existem
+            ws.reset_dimensions()
+            for linha in ws.iter_rows(max_row=limite, values_only=True):
+                yield tuple(linha)  # linha vazia vem como lista
+        else:
+            df = self._excel_xls.parse(aba, header=None, nrows=limite)
+            for linha in df.itertuples(index=False, name=None):
+                yield tuple(None if pd.isna(valor) else valor for valor in linha)
+
+    @staticmethod
+    def _eh_xls(origem):
+        """Identifica .xls pela assinatura do arquivo, não pela extensão."""
+        if isinstance(origem, str) or hasattr(origem, '__fspath__'):
+            with open(origem, 'rb') as f:
+                return f.read(len(ASSINATURA_XLS)) == ASSINATURA_XLS
+
+        posicao = origem.tell()
+        assinatura = origem.read(len(ASSINATURA_XLS))
+        origem.seek(posicao)
+        return assinatura == ASSINATURA_XLS
@@ -0,0 +1,73 @@
+"""
+Utilitários de nome de fundo - funções puras, sem sessão de banco
+
+O Advisor não traz CNPJ: os fundos são casados pelo nome normalizado
+(app.utils.nome_fundo.normalizar_nome_fundo, gravado em InfoFundo.nome_normalizado);
+IndiceNomesFundos é o índice de trigramas em memória usado quando a chave exata
+não existe.
+"""
+
+from collections import defaultdict
+from typing import Iterable, Optional, Tuple
+
+
+def trigramas(nome_normalizado):
+    """Conjunto de trigramas do nome já normalizado (com bordas, como o pg_trgm)."""
+    texto = f"  {nome_normalizado} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _numeros(nome_normalizado):
+    return {p for p in nome_normalizado.split() if p.isdigit()}
+
+
+class IndiceNomesFundos:
+    """
+    Índice invertido trigrama → fundos. A busca só compara o nome com os fundos
+    que têm algum trigrama em comum e devolve o mais parecido (Jaccard) acima do limiar.
+    Números do nome (séries, anos-alvo: "2030", "II") precisam coincidir: fundos que
+    só diferem por eles são fundos diferentes.
+    """
+
+    def __init__(self, fundos: Iterable[Tuple[int, str]]):
+        """
+        Args:
+            fundos: pares (fundo_id, nome_normalizado)
+        """
+        self._trigramas = {}
+        self._nomes = {}
+        self._indice = defaultdict(set)
+
+        for fundo_id, nome in fundos:
+            if not nome:
+                continue
+            grams = trigramas(nome)
+            self._trigramas[fundo_id] = grams
+            self._nomes[fundo_id] = nome
+            for gram in grams:
+                self._indice[gram].add(fundo_id)
+
+    def __len__(self):
+        return len(self._nomes)
+
+    def buscar(self, nome_normalizado, limiar) -> Optional[Tuple[int, float]]:
+        """
+        Returns:
+            (fundo_id, similaridade) do fundo mais parecido com similaridade >= limiar, ou None
+        """
+        grams = trigramas(nome_normalizado)
+        comuns = defaultdict(int)
+        for gram in grams:
+            for fundo_id in self._indice.get(gram, ()):
+                comuns[fundo_id] += 1
+
+        numeros = _numeros(nome_normalizado)
+        melhor = None
+        for fundo_id, quantidade in comuns.items():
+            similaridade = quantidade / (len(grams) + len(self._trigramas[fundo_id]) - quantidade)
+            if similaridade < limiar or _numeros(self._nomes[fundo_id]) != numeros:
+                continue
+            if melhor is None or similaridade > melhor[1] or (similaridade == melhor[1] and fundo_id < melhor[0]):
+                melhor = (fundo_id, similaridade)
+
+        return melhor
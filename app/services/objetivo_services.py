@@ -1,12 +1,15 @@
+from datetime import datetime
+from typing import Optional
 from sqlalchemy.orm import Session
-from app.models.geld_models import Objetivo, IndicadoresEconomicos
+from app.models.geld_models import Objetivo
+from app.services.indicador_service import IndicadorService
 
 class ObjetivoServices:
     def __init__(self, db: Session = None):
         self.db = db
 
-    def calc_aporte_mensal(self, objetivo_id, taxa_anual_adicional=3.5):
-        
+    def calc_aporte_mensal(self, objetivo_id, taxa_anual_adicional=3.5, as_of: Optional[datetime] = None):
+        # as_of: calcula como na data informada (prazo restante e IPCA 12 meses até essa data)
         try:
             # Buscar o objetivo
             objetivo = self.db.query(Objetivo).filter(Objetivo.id == objetivo_id).first()
@@ -14,17 +17,22 @@ class ObjetivoServices:
                 return {"error": f"Objetivo com ID {objetivo_id} não encontrado"}
             
             # Buscar o IPCA mensal
-            indicadores = self.db.query(IndicadoresEconomicos).first()
-            if not indicadores or not indicadores.ipca_mes:
-                return {"error": "IPCA mensal não encontrado"}
-            
-            ipca_mensal = indicadores.ipca_mes / 100  # Converter de percentual para decimal
+            ponto_ipca = IndicadorService.ponto_em(self.db, IndicadorService.SERIE_IPCA_12M, as_of) if as_of else None
+            if ponto_ipca:
+                ipca_mes = IndicadorService.ipca_mensal_equivalente(ponto_ipca[1])
+            else:
+                indicadores = IndicadorService.indicadores_atuais(self.db)
+                if not indicadores or not indicadores.ipca_mes:
+                    return {"error": "IPCA mensal não encontrado"}
+                ipca_mes = indicadores.ipca_mes
+
+            ipca_mensal = ipca_mes / 100  # Converter de percentual para decimal
             
             # Converter taxa anual adicional para mensal
             i = ipca_mensal + ((1 + taxa_anual_adicional/100) ** (1/12)) - 1
             
             # Período restante em meses
-            n = objetivo.duracao_meses
+            n = objetivo.duracao_meses_em(as_of) if as_of else objetivo.duracao_meses
             
             # Valor presente (capital atual)
             PV = float(objetivo.valor_real)
@@ -58,7 +66,7 @@ class ObjetivoServices:
         except Exception as e:
             return {"error": f"Erro ao calcular aporte: {str(e)}"}
     
-    def calc_aportes_cliente(self, cliente_id, taxa_anual_adicional=3.5):
+    def calc_aportes_cliente(self, cliente_id, taxa_anual_adicional=3.5, as_of: Optional[datetime] = None):
        
         try:
             # Buscar todos os objetivos do cliente
@@ -71,7 +79,7 @@ class ObjetivoServices:
             aporte_total = 0
             
             for objetivo in objetivos:
-                resultado = self.calc_aporte_mensal(objetivo.id, taxa_anual_adicional)
+                resultado = self.calc_aporte_mensal(objetivo.id, taxa_anual_adicional, as_of)
                 
                 if "error" in resultado:
                     print(f"Erro no objetivo {objetivo.id}: {resultado['error']}")
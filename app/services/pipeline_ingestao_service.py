@@ -0,0 +1,334 @@
+"""
+Pipeline de ingestão de extratos - o mesmo fluxo para todas as corretoras
+
+Etapas encadeadas como geradores (cada uma consome a anterior sob demanda):
+
+    ler → extrair → normalizar → resolver_fundos → diferenca → gravar
+
+- ler: verificação prévia (corretora e layout) e SHA-256 do arquivo; extrato já
+  importado termina aqui (nada mudou) ou pula a extração com as posições guardadas
+- extrair: leitor da corretora (LeitorExtrato) gera as PosicaoExtraida
+- normalizar: descarta posições sem identificação ou sem cotas e limpa o nome
+- resolver_fundos, diferenca, gravar: PosicaoImportService, seguidas do registro
+  da ingestão e do commit em uma única transação
+
+Cada corretora só fornece o leitor (LEITORES); verificação, cache por conteúdo,
+resolução de fundos por CNPJ ou nome e gravação por diferença valem para todas.
+Tempos e contagens de cada etapa ficam na InstrumentacaoPipeline ([PIPELINE]).
+
+Usado por:
+- posicao.py (upload_cotas)
+- posicao_advisor.py (upload_advisor)
+- importacao_lote_service.py (importação em lote)
+"""
+
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.services.dashboard_service import DashboardService
+from app.services.extract_advisor_service import AdvisorExtractService
+from app.services.extract_btg_service import ExtractBTGService
+from app.services.ingestao_service import IngestaoService
+from app.services.posicao_extraida import PosicaoExtraida
+from app.services.posicao_import_service import PosicaoImportService
+from app.services.verificacao_extrato_service import motivo_recusa, verificar_extrato
+
+
+ETAPAS = ('ler', 'extrair', 'normalizar', 'resolver_fundos', 'diferenca', 'gravar', 'dashboard')
+
+
+# =============================================================================
+# LEITORES (um por corretora)
+# =============================================================================
+
+class LeitorExtrato(ABC):
+    """
+    Plugin de corretora: só a extração das posições, sem banco.
+    Para uma corretora nova basta uma subclasse registrada em LEITORES (e a
+    detecção do formato em verificacao_extrato_service).
+    """
+
+    formato = None   # chave em LEITORES e banco_custodia das posições
+
+    @abstractmethod
+    def extrair(self, origem, cliente_id=None, paralelo=False) -> Tuple[Iterable[PosicaoExtraida], dict]:
+        """
+        Returns:
+            (posições, log do extrator - 'erros' com as falhas)
+        """
+
+    def descrever(self, log: dict) -> str:
+        """Resumo da extração para o usuário"""
+        return f"Processadas {log.get('total', 0)} posições"
+
+
+class LeitorBTG(LeitorExtrato):
+
+    formato = 'BTG'
+
+    def extrair(self, origem, cliente_id=None, paralelo=False):
+        return ExtractBTGService().processar_arquivo_btg_completo(origem, cliente_id, paralelo=paralelo)
+
+    def descrever(self, log):
+        total = log['fundos'] + log['previdencia_individual'] + log['previdencia_externa'] + log['renda_fixa'] + log['renda_variavel']
+        return (f"Processadas {total} posições: {log['fundos']} fundos, {log['previdencia_individual']} prev.ind, "
+                f"{log['previdencia_externa']} prev.ext, {log['renda_fixa']} RF, {log['renda_variavel']} RV")
+
+
+class LeitorAdvisor(LeitorExtrato):
+
+    formato = 'ADVISOR'
+
+    def extrair(self, origem, cliente_id=None, paralelo=False):
+        return AdvisorExtractService().processar_arquivo_advisor(origem, cliente_id)
+
+    def descrever(self, log):
+        return f"Processadas {log['total']} posições do Advisor"
+
+
+LEITORES = {
+    LeitorBTG.formato: LeitorBTG(),
+    LeitorAdvisor.formato: LeitorAdvisor(),
+}
+
+
+# =============================================================================
+# INSTRUMENTAÇÃO
+# =============================================================================
+
+class InstrumentacaoPipeline:
+    """
+    Tempo e itens de cada etapa. O tempo é exclusivo: enquanto uma etapa espera
+    a anterior produzir o próximo item, o relógio conta para a anterior.
+    """
+
+    def __init__(self, ordem: Iterable[str] = ()):
+        """
+        Args:
+            ordem: ordem das etapas no resumo (as demais vêm depois, na ordem de execução)
+        """
+        self.etapas = {}   # nome → {'itens': n, 'segundos': s}
+        self._ordem = list(ordem)
+        self._pilha = []   # [nome, início] das etapas em execução
+
+    def medir(self, nome: str, itens: Iterable) -> Iterator:
+        """Envolve o gerador de uma etapa contando os itens e o tempo gasto nele."""
+        iterador = iter(itens)
+        self._registro(nome)
+        while True:
+            self._entrar(nome)
+            try:
+                item = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                self._sair()
+            self.etapas[nome]['itens'] += 1
+            yield item
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """Etapa que não gera itens (verificação, commit...)."""
+        self._registro(nome)
+        self._entrar(nome)
+        try:
+            yield
+        finally:
+            self._sair()
+
+    def resumo(self) -> str:
+        nomes = [nome for nome in self._ordem if nome in self.etapas]
+        nomes += [nome for nome in self.etapas if nome not in nomes]
+        return ' | '.join(
+            f"{nome} {self.etapas[nome]['segundos'] * 1000:.0f} ms ({self.etapas[nome]['itens']})" for nome in nomes
+        )
+
+    def _registro(self, nome):
+        return self.etapas.setdefault(nome, {'itens': 0, 'segundos': 0.0})
+
+    def _entrar(self, nome):
+        agora = time.perf_counter()
+        if self._pilha:
+            anterior = self._pilha[-1]
+            self.etapas[anterior[0]]['segundos'] += agora - anterior[1]
+        self._pilha.append([nome, agora])
+
+    def _sair(self):
+        agora = time.perf_counter()
+        nome, inicio = self._pilha.pop()
+        self.etapas[nome]['segundos'] += agora - inicio
+        if self._pilha:
+            self._pilha[-1][1] = agora
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+class PipelineIngestao:
+
+    def __init__(self, session: Session, formato: str, paralelo: bool = False, atualizar_dashboard: bool = True):
+        """
+        Args:
+            formato: chave em LEITORES ('BTG', 'ADVISOR')
+            paralelo: repassado ao leitor (abas do BTG em processos separados)
+            atualizar_dashboard: refaz o snapshot do dashboard quando algo mudou
+                (a importação em lote desliga e refaz uma vez no final)
+        """
+        self.session = session
+        self.leitor = LEITORES[formato]
+        self.formato = formato
+        self.paralelo = paralelo
+        self.atualizar_dashboard = atualizar_dashboard
+        self.instrumentacao = InstrumentacaoPipeline(ETAPAS)
+
+    def executar(self, cliente_id: int, arquivo, nome_arquivo: str = None) -> Dict:
+        """
+        Fluxo completo de um upload, da planilha à gravação. O arquivo não é fechado.
+
+        Returns:
+            dict de _novo_resultado: status ('importado', 'ignorado' ou 'erro'),
+            mensagens [(texto, categoria)] para o usuário, mensagem final e etapas
+        """
+        resultado = self._novo_resultado()
+
+        # ===== LER: verificação prévia + extrato já importado? =====
+        with self.instrumentacao.etapa('ler'):
+            diagnostico = verificar_extrato(arquivo)
+            recusa = motivo_recusa(diagnostico, self.formato)
+            if recusa is None:
+                sha256 = IngestaoService.calcular_sha256(arquivo)
+                ingestao = IngestaoService.buscar(self.session, cliente_id, self.formato, sha256)
+
+        if recusa:
+            print(f"[AVISO] Extrato recusado na verificação prévia ({diagnostico['tempo'] * 1000:.0f} ms): {recusa}")
+            return self._finalizar(resultado, 'erro', recusa, 'error')
+
+        if ingestao is not None and IngestaoService.pode_ignorar(self.session, ingestao):
+            return self._ignorar(resultado, ingestao, sha256)
+
+        if ingestao is not None:
+            # Arquivo já processado antes: reaplica as posições guardadas, sem abrir a planilha
+            posicoes = IngestaoService.carregar_posicoes(ingestao)
+            print(f"[INFO] Extrato já importado (sha256 {sha256[:12]}): reaproveitando {len(posicoes)} posições")
+            resultado['mensagens'].append((
+                f"Extrato já importado em {ingestao.data_importacao.strftime('%d/%m/%Y %H:%M')}: "
+                f"{len(posicoes)} posições reaproveitadas sem reprocessar o arquivo", 'info'
+            ))
+        else:
+            posicoes = self._extrair(arquivo, cliente_id, resultado)
+
+        return self._gravar(resultado, cliente_id, posicoes, sha256, nome_arquivo)
+
+    def importar_extraidas(self, cliente_id: int, posicoes: List[PosicaoExtraida],
+                           sha256: str, nome_arquivo: str = None) -> Dict:
+        """
+        Para posições já extraídas em outro processo (importação em lote): pula ler e
+        extrair, mas respeita o cache por conteúdo.
+        """
+        resultado = self._novo_resultado()
+
+        with self.instrumentacao.etapa('ler'):
+            ingestao = IngestaoService.buscar(self.session, cliente_id, self.formato, sha256)
+            ignorar = ingestao is not None and IngestaoService.pode_ignorar(self.session, ingestao)
+
+        if ignorar:
+            return self._ignorar(resultado, ingestao, sha256)
+        return self._gravar(resultado, cliente_id, posicoes, sha256, nome_arquivo)
+
+    # =========================================================================
+    # ETAPAS
+    # =========================================================================
+
+    def _extrair(self, arquivo, cliente_id, resultado) -> Iterator[PosicaoExtraida]:
+        """Etapa de extração: roda o leitor e repassa as posições; falhas vão para resultado['erros_extracao']"""
+        print(f"[INFO] Iniciando processamento do arquivo {self.formato}...")
+        posicoes, log = self.leitor.extrair(arquivo, cliente_id, paralelo=self.paralelo)
+        resultado['erros_extracao'] = list(log.get('erros', []))
+        resultado['mensagens'].append((self.leitor.descrever(log), 'info'))
+        yield from posicoes
+
+    @staticmethod
+    def _normalizar(posicoes: Iterable[PosicaoExtraida], descartadas: List) -> Iterator[PosicaoExtraida]:
+        """Etapa de normalização: nome sem espaços nas pontas; sem CNPJ nem nome, ou sem cotas, é descartada"""
+        for pos in posicoes:
+            nome = str(pos.nome_fundo or '').strip()
+            if (not nome and not pos.chave_cnpj) or pos.num_cotas is None:
+                descartadas.append(pos)
+                continue
+            pos.nome_fundo = nome
+            yield pos
+
+    def _gravar(self, resultado, cliente_id, posicoes, sha256, nome_arquivo) -> Dict:
+        """normalizar → resolver_fundos → diferenca → gravar, registro da ingestão e commit"""
+        medir = self.instrumentacao.medir
+        descartadas = []
+        normalizadas = []
+
+        def guardar(itens):
+            # Posições normalizadas ficam guardadas no registro da ingestão (cache)
+            for pos in itens:
+                normalizadas.append(pos)
+                yield pos
+
+        try:
+            fluxo = guardar(medir('normalizar', self._normalizar(medir('extrair', posicoes), descartadas)))
+            with self.instrumentacao.etapa('gravar'):
+                importacao = PosicaoImportService.importar(self.session, cliente_id, self.formato, fluxo, medir)
+
+            if descartadas:
+                print(f"[AVISO] {len(descartadas)} posições sem identificação ou sem cotas descartadas")
+
+            if not normalizadas:
+                self.session.rollback()
+                erros = resultado.get('erros_extracao')
+                mensagem = '; '.join(map(str, erros)) if erros else "Nenhuma posição válida foi extraída do arquivo."
+                return self._finalizar(resultado, 'erro', mensagem, 'warning')
+
+            if not importacao['aplicado']:
+                # Fundos cadastrados via CVM já foram gravados; nenhuma posição foi tocada
+                self.session.commit()
+                return self._finalizar(resultado, 'erro', "Nenhuma posição foi registrada: nenhum fundo do extrato foi reconhecido.", 'warning')
+
+            mensagem = PosicaoImportService.descrever(importacao)
+            with self.instrumentacao.etapa('gravar'):
+                IngestaoService.registrar(self.session, cliente_id, self.formato, sha256, normalizadas, mensagem, nome_arquivo)
+                self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        resultado['houve_alteracao'] = PosicaoImportService.houve_alteracao(importacao)
+        if resultado['houve_alteracao'] and self.atualizar_dashboard:
+            with self.instrumentacao.etapa('dashboard'):
+                DashboardService.atualizar_snapshot(self.session)
+
+        return self._finalizar(resultado, 'importado', mensagem, 'success')
+
+    def _ignorar(self, resultado, ingestao, sha256) -> Dict:
+        IngestaoService.marcar_reenvio_ignorado(self.session, ingestao)
+        self.session.commit()
+        print(f"[INFO] Extrato idêntico ao último importado (sha256 {sha256[:12]}): nada a fazer")
+        mensagem = (f"Este extrato já foi importado em {ingestao.data_aplicacao.strftime('%d/%m/%Y %H:%M')} "
+                    f"e as posições não mudaram desde então. Nenhuma alteração foi feita.")
+        return self._finalizar(resultado, 'ignorado', mensagem, 'info')
+
+    # =========================================================================
+    # RESULTADO
+    # =========================================================================
+
+    @staticmethod
+    def _novo_resultado() -> Dict:
+        return {'status': 'erro', 'mensagens': [], 'mensagem': '', 'houve_alteracao': False, 'etapas': {}}
+
+    def _finalizar(self, resultado, status, mensagem, categoria) -> Dict:
+        resultado['status'] = status
+        resultado['mensagem'] = mensagem
+        resultado['mensagens'].append((mensagem, categoria))
+        resultado['etapas'] = self.instrumentacao.etapas
+        print(f"[PIPELINE] {self.formato} {status}: {self.instrumentacao.resumo()}")
+        return resultado
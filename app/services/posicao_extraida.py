@@ -0,0 +1,131 @@
+"""
+Registro de posição extraída de extratos (BTG, Advisor)
+
+Formato comum devolvido pelos extratores e consumido pelo pipeline de ingestão
+e pelo FundoRegistrationService.
+
+PosicaoExtraida usa __slots__ (sem dicionário por posição) e calcula a chave do
+CNPJ (só dígitos) uma única vez, na criação: deduplicação, cadastro de fundos e
+resolução usam chave_cnpj em vez de normalizar o CNPJ de novo a cada passagem.
+LotePosicoes guarda um extrato inteiro em colunas (uma lista por campo), que é
+como o Advisor já extrai e como as posições viajam entre processos (importação
+em lote) e ficam guardadas no cache de ingestões.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from app.models.geld_models import RiscoEnum, SubtipoRiscoEnum
+from app.services.cnpj_utils import normalizar_cnpj
+
+
+class PosicaoExtraida:
+
+    # Campos na ordem do construtor (e das colunas de LotePosicoes)
+    CAMPOS = (
+        'nome_fundo',
+        'cnpj',            # formatado, dummy (97./98./99./DUMMY-) ou None (Advisor)
+        'num_cotas',
+        'data',            # data da posição no extrato; None se a fonte não informa
+        'tipo',            # fundo, previdencia_individual, previdencia_externa, renda_fixa, acao, fii, advisor
+        'classe_anbima',
+        'risco',           # Advisor/Fundos usam o enum; RF/RV usam o nome
+        'subtipo_risco',
+        'codigo_ativo',    # RF e RV
+        'valor_cota',      # RF, RV e Advisor
+        'saldo_anterior',  # Advisor
+        'saldo_bruto',     # Advisor
+    )
+
+    __slots__ = tuple(campo for campo in CAMPOS if campo != 'cnpj') + ('_cnpj', 'chave_cnpj')
+
+    def __init__(self, nome_fundo: str, cnpj: Optional[str], num_cotas: float, data: Optional[datetime], tipo: str,
+                 classe_anbima: Optional[str] = None, risco: Union[RiscoEnum, str, None] = None,
+                 subtipo_risco: Optional[SubtipoRiscoEnum] = None, codigo_ativo: Optional[str] = None,
+                 valor_cota: Optional[float] = None, saldo_anterior: Optional[float] = None,
+                 saldo_bruto: Optional[float] = None):
+        self.nome_fundo = nome_fundo
+        self.cnpj = cnpj
+        self.num_cotas = num_cotas
+        self.data = data
+        self.tipo = tipo
+        self.classe_anbima = classe_anbima
+        self.risco = risco
+        self.subtipo_risco = subtipo_risco
+        self.codigo_ativo = codigo_ativo
+        self.valor_cota = valor_cota
+        self.saldo_anterior = saldo_anterior
+        self.saldo_bruto = saldo_bruto
+
+    @property
+    def cnpj(self) -> Optional[str]:
+        return self._cnpj
+
+    @cnpj.setter
+    def cnpj(self, cnpj):
+        self._cnpj = cnpj
+        self.chave_cnpj = normalizar_cnpj(cnpj) if cnpj else None
+
+    def para_dict(self) -> Dict:
+        """Campos preenchidos (para logs e compatibilidade)"""
+        return {campo: getattr(self, campo) for campo in self.CAMPOS if getattr(self, campo) is not None}
+
+    @classmethod
+    def de_dict(cls, dados: Dict) -> 'PosicaoExtraida':
+        """Registro a partir de um dicionário (formato antigo do cache de ingestões)"""
+        return cls(**{campo: dados.get(campo) for campo in cls.CAMPOS})
+
+    def __getstate__(self):
+        return tuple(getattr(self, campo) for campo in self.CAMPOS)
+
+    def __setstate__(self, estado):
+        self.__init__(*estado)
+
+    def __repr__(self):
+        return f"<PosicaoExtraida({self.tipo}: {self.nome_fundo!r}, cnpj={self.cnpj}, cotas={self.num_cotas})>"
+
+
+class LotePosicoes:
+    """
+    Posições de um extrato em colunas. Itera como uma lista de PosicaoExtraida,
+    criando cada registro só quando é lido.
+    """
+
+    __slots__ = ('colunas',)
+
+    def __init__(self, colunas: Optional[Dict[str, List]] = None):
+        """
+        Args:
+            colunas: {campo: lista de valores}, todas do mesmo tamanho; campos ausentes valem None
+        """
+        colunas = colunas or {}
+        tamanhos = {len(valores) for valores in colunas.values()}
+        if len(tamanhos) > 1:
+            raise ValueError(f"Colunas com tamanhos diferentes: {tamanhos}")
+        tamanho = tamanhos.pop() if tamanhos else 0
+        self.colunas = {campo: list(colunas.get(campo) or [None] * tamanho) for campo in PosicaoExtraida.CAMPOS}
+
+    @classmethod
+    def de_registros(cls, posicoes: Iterable[PosicaoExtraida]) -> 'LotePosicoes':
+        lote = cls()
+        for pos in posicoes:
+            lote.adicionar(pos)
+        return lote
+
+    def adicionar(self, pos: PosicaoExtraida) -> None:
+        for campo, valores in self.colunas.items():
+            valores.append(getattr(pos, campo))
+
+    def __len__(self):
+        return len(self.colunas['nome_fundo'])
+
+    def __iter__(self) -> Iterator[PosicaoExtraida]:
+        for valores in zip(*(self.colunas[campo] for campo in PosicaoExtraida.CAMPOS)):
+            yield PosicaoExtraida(*valores)
+
+    def __getitem__(self, indice) -> PosicaoExtraida:
+        return PosicaoExtraida(*(self.colunas[campo][indice] for campo in PosicaoExtraida.CAMPOS))
+
+    def para_colunas(self) -> Dict[str, List]:
+        """Colunas com algum valor preenchido (o resto é None ao recarregar)"""
+        return {campo: valores for campo, valores in self.colunas.items() if any(v is not None for v in valores)}
@@ -0,0 +1,384 @@
+"""
+Serviço de importação de posições - aplica um extrato como diferença
+
+Compara as posições gravadas do cliente em um banco de custódia (BTG, ADVISOR)
+com as posições do extrato e grava só o que mudou:
+- fundo novo no extrato          -> insere
+- cotas/data/saldos diferentes   -> atualiza a linha existente (mantém o id)
+  (posição sem data no extrato compara só cotas e saldos e mantém a data gravada)
+- fundo que sumiu do extrato     -> remove
+Tudo na sessão recebida, sem commit: o pipeline confirma a diferença junto com
+os totais por classe em uma única transação.
+
+importar() é o fluxo completo de um extrato já extraído: resolve os fundos
+(por CNPJ ou, sem CNPJ, por nome), aplica a diferença e atualiza os totais.
+resolver_fundos, calcular_diferenca e gravar_diferenca são as etapas do
+pipeline de ingestão, encadeadas como geradores.
+
+Usado por:
+- pipeline_ingestao_service.py (uploads e importação em lote)
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict
+
+from sqlalchemy.orm import Session
+
+from app.config import ADVISOR_LIMIAR_SIMILARIDADE
+from app.models.geld_models import InfoFundo, PosicaoFundo, StatusFundoEnum
+from app.services.fundo_registration_service import FundoRegistrationService
+from app.services.nome_fundo_utils import IndiceNomesFundos
+from app.utils.nome_fundo import normalizar_nome_fundo
+from app.services.posicao_extraida import PosicaoExtraida
+from app.services.posicao_service import PosicaoService
+
+
+CASAS_COTAS = 6   # Numeric(15,6)
+CASAS_SALDO = 2   # Numeric(15,2)
+LOTE_CONSULTA = 500  # nomes por consulta IN (limite de variáveis do SQLite)
+
+# Operações geradas por calcular_diferenca
+INSERIR, ATUALIZAR, MANTER, REMOVER = 'inserir', 'atualizar', 'manter', 'remover'
+
+
+class PosicaoImportada(TypedDict, total=False):
+    fundo_id: int
+    cotas: float
+    data: Optional[datetime]          # None: o extrato não informa a data
+    saldo_anterior: Optional[float]   # Advisor
+    saldo_bruto: Optional[float]      # Advisor
+
+
+class PosicaoImportService:
+
+    @staticmethod
+    def importar(session: Session, cliente_id: int, banco_custodia: str,
+                 posicoes: Iterable[PosicaoExtraida], medir=None) -> Dict:
+        """
+        Fluxo completo de um extrato extraído: resolve os fundos, aplica a diferença das
+        posições e atualiza os totais por classe dos clientes afetados. Fundos resolvidos
+        pelo nome (cadastro e cotas) e posições ficam para o commit do chamador; o cadastro
+        via CVM grava por conta própria.
+
+        Args:
+            medir: instrumentação das etapas (InstrumentacaoPipeline.medir), opcional
+
+        Returns:
+            dict de aplicar() mais: aplicado (False se nenhum fundo foi reconhecido - nada é
+            gravado), falhas (posições sem fundo) e fundos_cota_alterada
+        """
+        medir = medir or (lambda etapa, itens: itens)
+        resolucao = {}
+
+        importadas = medir('resolver_fundos', PosicaoImportService.resolver_fundos(session, posicoes, resolucao))
+        operacoes = medir('diferenca', PosicaoImportService.calcular_diferenca(session, cliente_id, banco_custodia, importadas))
+        resultado = PosicaoImportService.gravar_diferenca(session, cliente_id, banco_custodia, operacoes)
+
+        # Sem nenhum fundo reconhecido a diferença não gera operações (apagaria todas as posições do banco)
+        resultado['aplicado'] = resolucao['resolvidas'] > 0
+
+        # Cotas alteradas afetam outros clientes com posição nesses fundos
+        PosicaoService.atualizar_totais_por_fundos(resolucao['fundos_cota_alterada'], session)
+        PosicaoService.atualizar_totais_clientes([cliente_id], session)
+
+        resultado['falhas'] = resolucao['falhas']
+        resultado['fundos_cota_alterada'] = sorted(resolucao['fundos_cota_alterada'])
+        return resultado
+
+    @staticmethod
+    def resolver_fundos(session: Session, posicoes: Iterable[PosicaoExtraida],
+                        resolucao: Dict) -> Iterator[PosicaoImportada]:
+        """
+        Etapa de resolução: posições com CNPJ pelo cadastro automático (CVM/dummy), sem CNPJ
+        pelo nome normalizado (cadastra os que faltam e atualiza a cota). As consultas são em
+        lote, então todas as posições são lidas antes da primeira sair.
+        Preenche resolucao com resolvidas, falhas e fundos_cota_alterada.
+        """
+        posicoes = list(posicoes)
+        com_cnpj = [pos for pos in posicoes if pos.chave_cnpj]
+        sem_cnpj = [pos for pos in posicoes if not pos.chave_cnpj]
+
+        fundos_por_cnpj = {}
+        if com_cnpj:
+            print("[INFO] Cadastrando novos fundos automaticamente...")
+            fundos_por_cnpj = FundoRegistrationService(session).cadastrar_fundos_automaticamente(com_cnpj)
+
+        fundos_por_nome, fundos_cota_alterada = {}, set()
+        if sem_cnpj:
+            fundos_por_nome, fundos_cota_alterada = PosicaoImportService._resolver_fundos_por_nome(session, sem_cnpj)
+
+        resolucao.update(resolvidas=0, falhas=0, fundos_cota_alterada=fundos_cota_alterada)
+        for pos in posicoes:
+            if pos.chave_cnpj:
+                fundo_id = fundos_por_cnpj.get(pos.chave_cnpj)
+            else:
+                fundo_id = fundos_por_nome.get(normalizar_nome_fundo(pos.nome_fundo))
+
+            if fundo_id is None:
+                print(f"[AVISO] Fundo {pos.cnpj or pos.nome_fundo[:50]} não encontrado no banco de dados.")
+                resolucao['falhas'] += 1
+                continue
+
+            importada = {'fundo_id': fundo_id, 'cotas': pos.num_cotas, 'data': pos.data}
+            if pos.saldo_anterior is not None or pos.saldo_bruto is not None:
+                importada['saldo_anterior'] = pos.saldo_anterior or 0.0
+                importada['saldo_bruto'] = pos.saldo_bruto or 0.0
+            resolucao['resolvidas'] += 1
+            yield importada
+
+    @staticmethod
+    def houve_alteracao(resultado: Dict) -> bool:
+        """True se a importação mudou posições ou cotas (o snapshot do dashboard precisa ser refeito)."""
+        return bool(resultado['inseridas'] or resultado['atualizadas'] or resultado['removidas']
+                    or resultado.get('fundos_cota_alterada'))
+
+    @staticmethod
+    def aplicar(session: Session, cliente_id: int, banco_custodia: str,
+                posicoes: Iterable[PosicaoImportada]) -> Dict:
+        """
+        Aplica as posições do extrato como diferença sobre as gravadas para (cliente, banco).
+        Posições repetidas do mesmo fundo no extrato são somadas.
+
+        Returns:
+            dict com contagens (inseridas, atualizadas, removidas, inalteradas) e os
+            fundo_ids de cada grupo (fundos_inseridos, fundos_atualizados, fundos_removidos)
+        """
+        operacoes = PosicaoImportService.calcular_diferenca(session, cliente_id, banco_custodia, posicoes)
+        return PosicaoImportService.gravar_diferenca(session, cliente_id, banco_custodia, operacoes)
+
+    @staticmethod
+    def calcular_diferenca(session: Session, cliente_id: int, banco_custodia: str,
+                           posicoes: Iterable[PosicaoImportada]) -> Iterator[Tuple]:
+        """
+        Etapa de diferença: gera (operação, fundo_id, posição gravada, posição nova), com
+        operação INSERIR, ATUALIZAR, MANTER ou REMOVER. Sem nenhuma posição nova não gera nada.
+        """
+        novas = PosicaoImportService._agrupar_por_fundo(posicoes)
+        if not novas:
+            return
+
+        gravadas = {}
+        duplicadas = []
+        for posicao in session.query(PosicaoFundo).filter(
+            PosicaoFundo.cliente_id == cliente_id,
+            PosicaoFundo.banco_custodia == banco_custodia
+        ):
+            # Importações antigas (apagar-e-reinserir) podem ter deixado o mesmo fundo repetido
+            if posicao.fundo_id in gravadas:
+                duplicadas.append(posicao)
+            else:
+                gravadas[posicao.fundo_id] = posicao
+
+        for fundo_id, nova in novas.items():
+            atual = gravadas.get(fundo_id)
+            if atual is None:
+                yield INSERIR, fundo_id, None, nova
+            elif PosicaoImportService._mudou(atual, nova):
+                yield ATUALIZAR, fundo_id, atual, nova
+            else:
+                yield MANTER, fundo_id, atual, nova
+
+        for fundo_id, atual in gravadas.items():
+            if fundo_id not in novas:
+                yield REMOVER, fundo_id, atual, None
+        for atual in duplicadas:
+            yield REMOVER, None, atual, None
+
+    @staticmethod
+    def gravar_diferenca(session: Session, cliente_id: int, banco_custodia: str,
+                         operacoes: Iterable[Tuple]) -> Dict:
+        """
+        Etapa de gravação: aplica as operações de calcular_diferenca na sessão (remoções em
+        um único DELETE), sem commit.
+
+        Returns:
+            dict descrito em aplicar()
+        """
+        diff = {
+            'inseridas': 0, 'atualizadas': 0, 'removidas': 0, 'inalteradas': 0,
+            'fundos_inseridos': [], 'fundos_atualizados': [], 'fundos_removidos': [],
+        }
+        removidas = []
+
+        for operacao, fundo_id, atual, nova in operacoes:
+            if operacao == INSERIR:
+                session.add(PosicaoFundo(
+                    cliente_id=cliente_id,
+                    fundo_id=fundo_id,
+                    cotas=nova['cotas'],
+                    data_atualizacao=nova['data'] or datetime.now(),
+                    banco_custodia=banco_custodia,
+                    saldo_anterior=nova.get('saldo_anterior'),
+                    saldo_bruto=nova.get('saldo_bruto')
+                ))
+                diff['inseridas'] += 1
+                diff['fundos_inseridos'].append(fundo_id)
+
+            elif operacao == ATUALIZAR:
+                atual.cotas = nova['cotas']
+                atual.data_atualizacao = nova['data'] or datetime.now()
+                if 'saldo_anterior' in nova:
+                    atual.saldo_anterior = nova['saldo_anterior']
+                if 'saldo_bruto' in nova:
+                    atual.saldo_bruto = nova['saldo_bruto']
+                diff['atualizadas'] += 1
+                diff['fundos_atualizados'].append(fundo_id)
+
+            elif operacao == REMOVER:
+                removidas.append(atual.id)
+                if fundo_id is not None:
+                    diff['fundos_removidos'].append(fundo_id)
+
+            else:
+                diff['inalteradas'] += 1
+
+        diff['removidas'] = len(removidas)
+        if removidas:
+            session.query(PosicaoFundo).filter(
+                PosicaoFundo.id.in_(removidas)
+            ).delete(synchronize_session=False)
+
+        session.flush()
+        print(f"[POSICAO] {banco_custodia} cliente {cliente_id}: {diff['inseridas']} inseridas, "
+              f"{diff['atualizadas']} atualizadas, {diff['removidas']} removidas, {diff['inalteradas']} inalteradas")
+        return diff
+
+    @staticmethod
+    def descrever(diff: Dict) -> str:
+        """Resumo da diferença (e das posições sem fundo, se houver) para exibir ao usuário."""
+        if not (diff['inseridas'] or diff['atualizadas'] or diff['removidas']):
+            texto = f"Nenhuma alteração: as {diff['inalteradas']} posições já estavam atualizadas."
+        else:
+            texto = (f"{diff['inseridas']} novas posições, {diff['atualizadas']} atualizadas, "
+                     f"{diff['removidas']} removidas e {diff['inalteradas']} sem alteração.")
+        if diff.get('falhas'):
+            texto += f" ({diff['falhas']} posições sem fundo cadastrado)"
+        return texto
+
+    @staticmethod
+    def _resolver_fundos_por_nome(session: Session, posicoes: List[PosicaoExtraida]):
+        """
+        Posições sem CNPJ (Advisor): fundos são identificados pelo nome normalizado
+        (InfoFundo.nome_normalizado, indexado). Nomes sem correspondência exata passam pelo
+        índice de trigramas (ADVISOR_LIMIAR_SIMILARIDADE) antes de virar fundo novo, para
+        "FIC FIM" e "FIC DE FIM" não gerarem dois cadastros. Cadastra os que faltam e
+        atualiza o valor da cota dos existentes, tudo na sessão do chamador (sem commit).
+
+        Returns:
+            ({nome_normalizado: fundo_id}, {fundo_ids com cota alterada})
+        """
+        nomes = {normalizar_nome_fundo(pos.nome_fundo) for pos in posicoes}
+        fundos_existentes_por_nome = PosicaoImportService._buscar_fundos_por_nome(session, nomes)
+
+        faltantes = nomes - fundos_existentes_por_nome.keys()
+        if faltantes and ADVISOR_LIMIAR_SIMILARIDADE < 1:
+            indice = IndiceNomesFundos(session.query(InfoFundo.id, InfoFundo.nome_normalizado))
+            for nome in sorted(faltantes):
+                encontrado = indice.buscar(nome, ADVISOR_LIMIAR_SIMILARIDADE)
+                if encontrado:
+                    fundos_existentes_por_nome[nome] = encontrado[0]
+                    print(f"[INFO] Fundo '{nome[:50]}' associado ao fundo {encontrado[0]} "
+                          f"(similaridade {encontrado[1]:.2f})")
+
+        # Uma entrada por nome: vale a última cota do extrato (como a atualização linha a linha fazia)
+        por_nome = {}
+        for pos in posicoes:
+            por_nome[normalizar_nome_fundo(pos.nome_fundo)] = pos
+
+        agora = datetime.now()
+        fundos_cota_alterada = set()
+
+        # Cotas dos existentes: uma consulta para carregar, gravadas no flush do chamador
+        ids_existentes = {fundos_existentes_por_nome[nome]: nome for nome in por_nome if nome in fundos_existentes_por_nome}
+        for fundo in PosicaoImportService._carregar_fundos(session, ids_existentes):
+            valor_cota = por_nome[ids_existentes[fundo.id]].valor_cota
+            if fundo.valor_cota is None or round(float(fundo.valor_cota), CASAS_COTAS) != round(float(valor_cota), CASAS_COTAS):
+                fundos_cota_alterada.add(fundo.id)
+            fundo.valor_cota = valor_cota
+            fundo.data_atualizacao = agora
+
+        # Fundos novos: inseridos juntos, ids obtidos no flush
+        novos = {}
+        for nome, pos in por_nome.items():
+            if nome in fundos_existentes_por_nome:
+                continue
+            novos[nome] = InfoFundo(
+                nome_fundo=pos.nome_fundo,
+                cnpj=None,  # Advisor não fornece CNPJ
+                classe_anbima=pos.classe_anbima,
+                mov_min=None,
+                risco=pos.risco,
+                subtipo_risco=pos.subtipo_risco,
+                status_fundo=StatusFundoEnum.ativo,
+                valor_cota=pos.valor_cota,
+                data_atualizacao=agora
+            )
+            print(f"[INFO] Fundo cadastrado: {pos.nome_fundo[:50]}")
+
+        session.add_all(novos.values())
+        session.flush()
+        for nome, fundo in novos.items():
+            fundos_existentes_por_nome[nome] = fundo.id
+
+        print(f"[INFO] Fundos novos cadastrados: {len(novos)}")
+        return fundos_existentes_por_nome, fundos_cota_alterada
+
+    @staticmethod
+    def _carregar_fundos(session: Session, fundo_ids) -> List[InfoFundo]:
+        fundo_ids = sorted(fundo_ids)
+        fundos = []
+        for inicio in range(0, len(fundo_ids), LOTE_CONSULTA):
+            fundos.extend(session.query(InfoFundo).filter(
+                InfoFundo.id.in_(fundo_ids[inicio:inicio + LOTE_CONSULTA])
+            ))
+        return fundos
+
+    @staticmethod
+    def _buscar_fundos_por_nome(session: Session, nomes) -> Dict[str, int]:
+        """
+        {nome_normalizado: fundo_id} dos nomes já cadastrados, em consultas IN pelo índice.
+        Com cadastros repetidos do mesmo nome (anteriores à coluna), fica o mais antigo.
+        """
+        nomes = sorted(n for n in nomes if n)
+        encontrados = {}
+        for inicio in range(0, len(nomes), LOTE_CONSULTA):
+            for fundo_id, nome in session.query(InfoFundo.id, InfoFundo.nome_normalizado).filter(
+                InfoFundo.nome_normalizado.in_(nomes[inicio:inicio + LOTE_CONSULTA])
+            ):
+                if nome not in encontrados or fundo_id < encontrados[nome]:
+                    encontrados[nome] = fundo_id
+        return encontrados
+
+    @staticmethod
+    def _agrupar_por_fundo(posicoes: Iterable[PosicaoImportada]) -> Dict[int, PosicaoImportada]:
+        agrupadas = {}
+        for pos in posicoes:
+            fundo_id = pos['fundo_id']
+            if fundo_id not in agrupadas:
+                agrupadas[fundo_id] = dict(pos)
+                continue
+
+            existente = agrupadas[fundo_id]
+            existente['cotas'] += pos['cotas']
+            datas = [d for d in (existente['data'], pos['data']) if d is not None]
+            existente['data'] = max(datas) if datas else None
+            for campo in ('saldo_anterior', 'saldo_bruto'):
+                if campo in pos:
+                    existente[campo] = (existente.get(campo) or 0) + (pos[campo] or 0)
+        return agrupadas
+
+    @staticmethod
+    def _mudou(atual: PosicaoFundo, nova: PosicaoImportada) -> bool:
+        if round(float(atual.cotas), CASAS_COTAS) != round(float(nova['cotas']), CASAS_COTAS):
+            return True
+        if nova['data'] is not None and atual.data_atualizacao != nova['data']:
+            return True
+        for campo in ('saldo_anterior', 'saldo_bruto'):
+            if campo not in nova:
+                continue
+            valor_atual = getattr(atual, campo)
+            valor_atual = None if valor_atual is None else round(float(valor_atual), CASAS_SALDO)
+            valor_novo = None if nova[campo] is None else round(float(nova[campo]), CASAS_SALDO)
+            if valor_atual != valor_novo:
+                return True
+        return False
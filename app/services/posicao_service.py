@@ -3,24 +3,200 @@ Serviço de posições - cálculos sobre PosicaoFundo
 
 Responsabilidade única: responder "quanto o cliente tem investido, e em quê?"
 
+Os totais por subclasse ficam materializados em client_class_totals e são
+recalculados só para os clientes afetados quando uma posição ou cota muda.
+
+Com as_of, as posições atuais são avaliadas pela cota de cada fundo naquela
+data (CotaHistoricaService) e os totais são recalculados, sem usar nem gravar
+client_class_totals. O histórico de posições não é guardado: o as_of muda o
+preço, não a quantidade de cotas.
+
 Usado por:
 - posicao.py (rota) - exibição na tela
 - balance_service.py - cálculos de balanceamento
 - distribuicao_capital_service.py - simulação de alocação
 """
 
-from app.models.geld_models import PosicaoFundo, InfoFundo, RiscoEnum, SubtipoRiscoEnum
+from app.models.geld_models import PosicaoFundo, InfoFundo, ClienteClasseTotal, RiscoEnum, SubtipoRiscoEnum
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Dict
+from sqlalchemy import func, case
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from app.services.cache_requisicao import limpar as limpar_cache_requisicao, memorizar_por_requisicao
+from app.services.cota_historica_service import CotaHistoricaService
+
+
+CLASSES = ('baixo_di', 'baixo_rfx', 'moderado', 'alto')
 
 
 class PosicaoService:
 
     @staticmethod
-    def calcular_totais_por_classe(cliente_id: int, session: Session) -> Dict[str, float]:
+    def _expressao_classe():
+        """CASE SQL que mapeia risco/subtipo do fundo para a subclasse de CLASSES."""
+        return case(
+            (
+                (InfoFundo.risco == RiscoEnum.baixo) & (InfoFundo.subtipo_risco == SubtipoRiscoEnum.di),
+                'baixo_di'
+            ),
+            (InfoFundo.risco == RiscoEnum.baixo, 'baixo_rfx'),
+            (InfoFundo.risco == RiscoEnum.moderado, 'moderado'),
+            (InfoFundo.risco == RiscoEnum.alto, 'alto'),
+            else_=None
+        )
+
+    @staticmethod
+    def recalcular_totais(
+        session: Session,
+        cliente_ids: Optional[Iterable[int]] = None,
+        as_of: Optional[datetime] = None
+    ) -> Dict[int, Dict[str, float]]:
+        """
+        Recalcula os totais por subclasse direto de PosicaoFundo, em uma única
+        consulta agrupada por (cliente, classe). Não grava nada.
+
+        Args:
+            session: Sessão do banco
+            cliente_ids: Clientes a recalcular (None = todos com posição)
+            as_of: Data de avaliação das cotas (None = valor_cota atual)
+
+        Returns:
+            {cliente_id: {'baixo_di': float, 'baixo_rfx': float, 'moderado': float, 'alto': float}}
+        """
+        classe = PosicaoService._expressao_classe()
+        valor_cota = InfoFundo.valor_cota
+        if as_of is not None:
+            cotas = CotaHistoricaService.subconsulta_cotas_em(session, as_of)
+            valor_cota = func.coalesce(cotas.c.valor_cota, InfoFundo.valor_cota)
+
+        query = session.query(
+            PosicaoFundo.cliente_id,
+            classe,
+            func.sum(PosicaoFundo.cotas * valor_cota)
+        ).join(
+            InfoFundo, PosicaoFundo.fundo_id == InfoFundo.id
+        )
+        if as_of is not None:
+            query = query.outerjoin(cotas, cotas.c.fundo_id == InfoFundo.id)
+
+        totais = {}
+        if cliente_ids is not None:
+            cliente_ids = set(cliente_ids)
+            if not cliente_ids:
+                return totais
+            query = query.filter(PosicaoFundo.cliente_id.in_(cliente_ids))
+            for cliente_id in cliente_ids:
+                totais[cliente_id] = dict.fromkeys(CLASSES, 0.0)
+
+        for cliente_id, nome_classe, soma in query.group_by(PosicaoFundo.cliente_id, classe):
+            if nome_classe is None:
+                continue
+            totais.setdefault(cliente_id, dict.fromkeys(CLASSES, 0.0))[nome_classe] = float(soma or 0.0)
+
+        return totais
+
+    @staticmethod
+    def atualizar_totais_clientes(cliente_ids: Iterable[int], session: Session) -> None:
+        """
+        Regrava em client_class_totals os totais dos clientes informados.
+        Não faz commit - fica na transação de quem chamou.
+
+        Args:
+            cliente_ids: Clientes cujas posições ou cotas mudaram
+            session: Sessão do banco
+        """
+        cliente_ids = {cid for cid in cliente_ids if cid is not None}
+        if not cliente_ids:
+            return
+
+        totais = PosicaoService.recalcular_totais(session, cliente_ids)
+        existentes = {
+            (linha.cliente_id, linha.classe): linha
+            for linha in session.query(ClienteClasseTotal).filter(
+                ClienteClasseTotal.cliente_id.in_(cliente_ids)
+            )
+        }
+
+        agora = datetime.now()
+        for cliente_id, por_classe in totais.items():
+            for nome_classe, valor in por_classe.items():
+                linha = existentes.get((cliente_id, nome_classe))
+                if linha is None:
+                    session.add(ClienteClasseTotal(
+                        cliente_id=cliente_id, classe=nome_classe, valor=valor, as_of=agora
+                    ))
+                else:
+                    linha.valor = valor
+                    linha.as_of = agora
+
+        session.flush()
+        limpar_cache_requisicao()
+
+    @staticmethod
+    def atualizar_totais_por_fundos(fundo_ids: Iterable[int], session: Session) -> int:
+        """
+        Atualiza os totais apenas dos clientes que têm posição nos fundos informados
+        (ex.: após atualização de cotas ou edição de risco do fundo).
+
+        Returns:
+            int - quantidade de clientes atualizados
+        """
+        fundo_ids = set(fundo_ids)
+        if not fundo_ids:
+            return 0
+
+        cliente_ids = {
+            cid for (cid,) in session.query(PosicaoFundo.cliente_id).filter(
+                PosicaoFundo.fundo_id.in_(fundo_ids)
+            ).distinct()
+        }
+        PosicaoService.atualizar_totais_clientes(cliente_ids, session)
+        return len(cliente_ids)
+
+    @staticmethod
+    def verificar_consistencia(session: Session, tolerancia: float = 0.01) -> List[Dict]:
+        """
+        Compara client_class_totals com um recálculo completo.
+
+        Returns:
+            Lista de divergências: {'cliente_id', 'classe', 'materializado', 'recalculado'}
+            (clientes ainda não materializados também aparecem, com materializado=None)
+        """
+        recalculado = PosicaoService.recalcular_totais(session)
+
+        materializado = {}
+        for linha in session.query(ClienteClasseTotal):
+            materializado.setdefault(linha.cliente_id, {})[linha.classe] = linha.valor
+
+        divergencias = []
+        for cliente_id in set(recalculado) | set(materializado):
+            esperado = recalculado.get(cliente_id, dict.fromkeys(CLASSES, 0.0))
+            atual = materializado.get(cliente_id)
+            for nome_classe in CLASSES:
+                valor_atual = atual.get(nome_classe) if atual is not None else None
+                if valor_atual is None or abs(valor_atual - esperado[nome_classe]) > tolerancia:
+                    divergencias.append({
+                        'cliente_id': cliente_id,
+                        'classe': nome_classe,
+                        'materializado': valor_atual,
+                        'recalculado': esperado[nome_classe],
+                    })
+
+        if divergencias:
+            print(f"[POSICAO] {len(divergencias)} divergências em client_class_totals")
+        return divergencias
+
+    @staticmethod
+    @memorizar_por_requisicao
+    def calcular_totais_por_classe(
+        cliente_id: int, session: Session, as_of: Optional[datetime] = None
+    ) -> Dict[str, float]:
         """
-        Calcula total investido por subclasse de risco usando SQL agregado.
+        Total investido por subclasse de risco, lido de client_class_totals.
+        Se o cliente ainda não foi materializado, recalcula a partir das posições.
+        Com as_of, recalcula com as cotas daquela data.
+        Uma leitura por requisição e por as_of (cache_requisicao).
 
         Retorna:
             {
@@ -31,56 +207,35 @@ class PosicaoService:
             }
         
         """
+        if as_of is not None:
+            return PosicaoService.recalcular_totais(session, [cliente_id], as_of)[cliente_id]
 
-        def _query_soma(filtros):
-            return float(
-                session.query(
-                    func.sum(PosicaoFundo.cotas * InfoFundo.valor_cota)
-                ).join(
-                    InfoFundo, PosicaoFundo.fundo_id == InfoFundo.id
-                ).filter(
-                    PosicaoFundo.cliente_id == cliente_id,
-                    *filtros
-                ).scalar() or 0.0
-            )
+        linhas = session.query(ClienteClasseTotal.classe, ClienteClasseTotal.valor).filter(
+            ClienteClasseTotal.cliente_id == cliente_id
+        ).all()
 
-        return {
-            'baixo_di': _query_soma([
-                InfoFundo.risco == RiscoEnum.baixo,
-                InfoFundo.subtipo_risco == SubtipoRiscoEnum.di
-            ]),
-            'baixo_rfx': _query_soma([
-                InfoFundo.risco == RiscoEnum.baixo,
-                (InfoFundo.subtipo_risco == SubtipoRiscoEnum.rfx) | (InfoFundo.subtipo_risco.is_(None))
-            ]),
-            'moderado': _query_soma([
-                InfoFundo.risco == RiscoEnum.moderado
-            ]),
-            'alto': _query_soma([
-                InfoFundo.risco == RiscoEnum.alto
-            ]),
-        }
+        if len(linhas) < len(CLASSES):
+            return PosicaoService.recalcular_totais(session, [cliente_id])[cliente_id]
+
+        totais = dict.fromkeys(CLASSES, 0.0)
+        for nome_classe, valor in linhas:
+            totais[nome_classe] = float(valor or 0.0)
+        return totais
 
     @staticmethod
-    def calcular_montante_total(cliente_id: int, session: Session) -> float:
+    def calcular_montante_total(cliente_id: int, session: Session, as_of: Optional[datetime] = None) -> float:
         """
         Calcula o valor total de todas as posições do cliente.
 
         Retorna:
             float - soma de (cotas * valor_cota) para todas as posições
         """
-        return float(
-            session.query(
-                func.sum(PosicaoFundo.cotas * InfoFundo.valor_cota)
-            ).join(
-                InfoFundo, PosicaoFundo.fundo_id == InfoFundo.id
-            ).filter(
-                PosicaoFundo.cliente_id == cliente_id
-            ).scalar() or 0.0
-        )
+        return sum(PosicaoService.calcular_totais_por_classe(cliente_id, session, as_of).values())
 
     @staticmethod
-    def calcular_totais_por_risco_simples(cliente_id: int, session: Session) -> Dict[str, float]:
+    def calcular_totais_por_risco_simples(
+        cliente_id: int, session: Session, as_of: Optional[datetime] = None
+    ) -> Dict[str, float]:
         """
         Versão simplificada sem separação de subtipo — agrupa apenas por risco principal.
         Usado por distribuicao_capital_service que não precisa da separação DI/RFx.
@@ -92,20 +247,9 @@ class PosicaoService:
                 'alto':     float
             }
         """
-        def _query_soma(risco_enum):
-            return float(
-                session.query(
-                    func.sum(PosicaoFundo.cotas * InfoFundo.valor_cota)
-                ).join(
-                    InfoFundo, PosicaoFundo.fundo_id == InfoFundo.id
-                ).filter(
-                    PosicaoFundo.cliente_id == cliente_id,
-                    InfoFundo.risco == risco_enum
-                ).scalar() or 0.0
-            )
-
+        totais = PosicaoService.calcular_totais_por_classe(cliente_id, session, as_of)
         return {
-            'baixo':    _query_soma(RiscoEnum.baixo),
-            'moderado': _query_soma(RiscoEnum.moderado),
-            'alto':     _query_soma(RiscoEnum.alto),
-        }
\ No newline at end of file
+            'baixo':    totais['baixo_di'] + totais['baixo_rfx'],
+            'moderado': totais['moderado'],
+            'alto':     totais['alto'],
+        }
@@ -0,0 +1,150 @@
+"""
+Verificação prévia de extratos (BTG, Advisor, XP)
+
+Antes do parsing completo, lê só a lista de abas e as primeiras linhas de cada
+aba (LeitorPlanilha em streaming) para identificar a corretora e conferir o
+layout. Arquivo de outra corretora, sem a aba "Posição" ou com as colunas fora
+do lugar é recusado em milissegundos, com uma mensagem que diz o que está errado;
+o leitor certo é escolhido pelo formato detectado.
+
+Usado por:
+- pipeline_ingestao_service.py (etapa de leitura dos uploads)
+- importacao_lote_service.py (escolhe o leitor de cada arquivo)
+"""
+
+import time
+from typing import Dict, List, Optional, TypedDict
+
+from app.services.extract_advisor_service import localizar_aba_posicao
+from app.services.extract_btg_service import ExtractBTGService
+from app.services.leitor_planilha_service import LeitorPlanilha, celula
+
+
+LINHAS_AMOSTRA = 30   # linhas lidas do início de cada aba
+
+ABAS_BTG = [nome_aba for _, nome_aba, _, _ in ExtractBTGService.ABAS]
+
+# Aba "Posição" do Advisor: colunas usadas para reconhecer uma linha de posição
+COLUNA_ATIVO_ADVISOR = 1
+COLUNA_QUANTIDADE_ADVISOR = 3
+
+# Texto que aparece no cabeçalho dos extratos XP
+MARCADORES_XP = ('xp investimentos',)
+
+ROTULOS = {
+    'BTG': 'BTG',
+    'ADVISOR': 'Advisor',
+    'XP': 'XP',
+}
+
+
+class DiagnosticoExtrato(TypedDict):
+    formato: Optional[str]           # 'BTG', 'ADVISOR', 'XP' ou None
+    abas: List[str]
+    amostras: Dict[str, List[tuple]]  # primeiras linhas de cada aba
+    erro: Optional[str]              # None = pode seguir para o leitor
+    tempo: float                     # segundos
+
+
+def verificar_extrato(origem) -> DiagnosticoExtrato:
+    """
+    Identifica a corretora e confere o layout lendo só o início de cada aba.
+    Objetos binários voltam para o início do arquivo.
+
+    Args:
+        origem: Caminho do arquivo, bytes ou objeto binário
+    """
+    inicio = time.perf_counter()
+    diagnostico = {'formato': None, 'abas': [], 'amostras': {}, 'erro': None, 'tempo': 0.0}
+
+    try:
+        with LeitorPlanilha(origem) as leitor:
+            diagnostico['abas'] = leitor.abas
+            diagnostico['amostras'] = {
+                aba: list(leitor.linhas(aba, limite=LINHAS_AMOSTRA)) for aba in leitor.abas
+            }
+        diagnostico['formato'], diagnostico['erro'] = _classificar(diagnostico['abas'], diagnostico['amostras'])
+    except Exception as e:
+        diagnostico['erro'] = f"Não foi possível ler a planilha: {str(e)}"
+    finally:
+        if hasattr(origem, 'seek'):
+            origem.seek(0)
+
+    diagnostico['tempo'] = time.perf_counter() - inicio
+    return diagnostico
+
+
+def rotulo_formato(formato: Optional[str]) -> str:
+    return ROTULOS.get(formato, 'desconhecido')
+
+
+def motivo_recusa(diagnostico: DiagnosticoExtrato, formato_esperado: str) -> Optional[str]:
+    """Mensagem para o usuário se o arquivo não serve para a importação do formato esperado; None se serve"""
+    if diagnostico['erro']:
+        return diagnostico['erro']
+    if diagnostico['formato'] != formato_esperado:
+        return (f"Este arquivo é um extrato {rotulo_formato(diagnostico['formato'])}, não "
+                f"{rotulo_formato(formato_esperado)}: use a importação {rotulo_formato(diagnostico['formato'])} do cliente.")
+    return None
+
+
+def _classificar(abas, amostras):
+    """(formato, erro) a partir das abas e das primeiras linhas"""
+    abas_btg = [aba for aba in ABAS_BTG if aba in abas]
+    if abas_btg:
+        if not any(_tem_conteudo(amostras[aba]) for aba in abas_btg):
+            return 'BTG', f"As abas do extrato BTG ({', '.join(abas_btg)}) estão vazias."
+        return 'BTG', None
+
+    aba_posicao = localizar_aba_posicao(abas)
+    if aba_posicao is not None:
+        return 'ADVISOR', _validar_posicao_advisor(aba_posicao, amostras[aba_posicao])
+
+    if any(_contem_marcador(linhas, MARCADORES_XP) for linhas in amostras.values()):
+        return 'XP', "Extrato XP reconhecido, mas a importação de extratos XP ainda não está disponível."
+
+    return None, (f"Formato de extrato não reconhecido: esperado BTG (abas {', '.join(ABAS_BTG)}) "
+                  f"ou Advisor (aba 'Posição'). Abas do arquivo: {', '.join(abas) or 'nenhuma'}.")
+
+
+def _validar_posicao_advisor(aba, linhas):
+    """Cabeçalho seguido de linhas com o nome do ativo (coluna B) e a quantidade (coluna D)"""
+    dados = [linha for linha in linhas[1:] if _tem_conteudo([linha])]
+    if not dados:
+        return f"A aba '{aba}' não tem posições."
+
+    for linha in dados:
+        ativo = celula(linha, COLUNA_ATIVO_ADVISOR)
+        quantidade = celula(linha, COLUNA_QUANTIDADE_ADVISOR)
+        if isinstance(ativo, str) and ativo.strip() and _eh_numero(quantidade):
+            return None
+
+    return (f"Layout da aba '{aba}' não reconhecido: esperado o nome do ativo na coluna B "
+            f"e a quantidade na coluna D (Classe, Ativo, DataUlt, Quantidade, Preco, ...).")
+
+
+def _tem_conteudo(linhas):
+    return any(valor is not None and str(valor).strip() for linha in linhas for valor in linha)
+
+
+def _contem_marcador(linhas, marcadores):
+    for linha in linhas:
+        for valor in linha:
+            if isinstance(valor, str) and any(marcador in valor.lower() for marcador in marcadores):
+                return True
+    return False
+
+
+def _eh_numero(valor):
+    """Número ou texto numérico no formato do Advisor (vírgula=milhar, ponto=decimal)"""
+    if isinstance(valor, bool):
+        return False
+    if isinstance(valor, (int, float)):
+        return True
+    if isinstance(valor, str):
+        try:
+            float(valor.replace(',', '').strip())
+            return True
+        except ValueError:
+            return False
+    return False
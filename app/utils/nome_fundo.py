@@ -0,0 +1,28 @@
+"""
+Chave de nome de fundo - função pura, sem banco nem serviços
+
+O Advisor não traz CNPJ: os fundos são casados pelo nome, que varia entre
+extratos ("FIC FIM" x "FIC DE FIM", acentos, pontuação). normalizar_nome_fundo
+gera a chave gravada em InfoFundo.nome_normalizado (indexada).
+
+Usado por:
+- geld_models.py - preenche nome_normalizado
+- nome_fundo_utils.py - índice de trigramas sobre a chave
+- catalogo_service.py, posicao_import_service.py
+"""
+
+import re
+import unicodedata
+
+
+# Conectivos que aparecem ou não conforme a fonte ("FIC DE FIM", "FI EM ACOES")
+PALAVRAS_IGNORADAS = {'DE', 'DO', 'DA', 'DOS', 'DAS', 'EM', 'E'}
+
+
+def normalizar_nome_fundo(nome):
+    """Maiúsculas, sem acentos, pontuação e conectivos, espaços simples."""
+    if not nome:
+        return ''
+    sem_acento = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    palavras = re.sub(r'[^A-Z0-9]+', ' ', sem_acento.upper()).split()
+    return ' '.join(p for p in palavras if p not in PALAVRAS_IGNORADAS)
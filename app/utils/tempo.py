@@ -0,0 +1,25 @@
+"""
+Instante de referência da requisição
+
+Prazos, VP ideal e datas de cálculo de uma mesma página saem todos do mesmo
+momento: dentro de uma requisição agora() devolve sempre o mesmo instante
+(guardado em flask.g). Fora de uma requisição é datetime.now().
+
+Usado por:
+- geld_models.py - Objetivo.duracao_meses
+- balance_service.py - data do cálculo
+- cache_requisicao.py - memorização por requisição
+"""
+
+from datetime import datetime
+
+from flask import g, has_request_context
+
+
+def agora() -> datetime:
+    """Instante de referência da requisição (o mesmo em todas as chamadas)"""
+    if not has_request_context():
+        return datetime.now()
+    if 'agora_requisicao' not in g:
+        g.agora_requisicao = datetime.now()
+    return g.agora_requisicao
@@ -0,0 +1,122 @@
+"""
+Benchmark do parser de extratos Advisor (AdvisorExtractService)
+
+Gera extratos sintéticos com N linhas na aba "Posição" (números e datas como
+texto e como célula numérica/data, classes variadas) e mede o tempo de
+processar_arquivo_advisor, separando a leitura da planilha da conversão das colunas.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_extract_advisor.py
+    python benchmarks/bench_extract_advisor.py --tamanhos 100 1000 10000 --repeticoes 5
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.services.extract_advisor_service as extract_advisor_service
+from app.services.extract_advisor_service import AdvisorExtractService
+from app.services.leitor_planilha_service import LeitorPlanilha
+
+
+CLASSES = ['Fundos de Renda Fixa', 'Ações', 'Multimercado', 'Fundos Cambiais', 'Previdência RF']
+
+
+def gerar_extrato(caminho, n):
+    """Grava um extrato Advisor sintético com n posições."""
+    wb = Workbook()
+    wb.active.title = 'Resumo'
+    ws = wb.create_sheet('Posição')
+    ws.append(['Classe', 'Ativo', 'DataUlt', 'Quantidade', 'Preco', 'SaldoAnterior', 'Movimento', 'SaldoBruto'])
+
+    for i in range(n):
+        quantidade = f"{1000 + i:,}.5" if i % 3 == 0 else 1000.5 + i
+        data = datetime(2026, 9, 30) if i % 2 else '30/09/2026'
+        ws.append([CLASSES[i % len(CLASSES)], f'FUNDO ADVISOR SINTETICO {i}', data, quantidade,
+                   1.2345, 10.0 * i, None, f"{11.0 * i:,.2f}"])
+
+    wb.save(caminho)
+
+
+class _LinhasEmMemoria:
+    """Substitui o LeitorPlanilha com linhas já lidas, para medir só a conversão."""
+
+    def __init__(self, abas, linhas):
+        self.abas = abas
+        self._linhas = linhas
+
+    def __call__(self, origem):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def linhas(self, aba):
+        return iter(self._linhas)
+
+
+def medir(caminho, repeticoes):
+    """Retorna (tempos totais, tempos só de conversão, número de posições)."""
+    service = AdvisorExtractService()
+    totais = []
+    conversao = []
+
+    for _ in range(repeticoes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            posicoes, log = service.processar_arquivo_advisor(caminho)
+            totais.append(time.perf_counter() - inicio)
+        if log['erros']:
+            raise RuntimeError(f"Erros no processamento: {log['erros']}")
+
+    with LeitorPlanilha(caminho) as leitor:
+        em_memoria = _LinhasEmMemoria(leitor.abas, list(leitor.linhas('Posição')))
+
+    original = extract_advisor_service.LeitorPlanilha
+    extract_advisor_service.LeitorPlanilha = em_memoria
+    try:
+        for _ in range(repeticoes):
+            with contextlib.redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                service.processar_arquivo_advisor(caminho)
+                conversao.append(time.perf_counter() - inicio)
+    finally:
+        extract_advisor_service.LeitorPlanilha = original
+
+    return totais, conversao, len(posicoes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[100, 1000, 5000],
+                        help='linhas na aba Posição (padrão: 100 1000 5000)')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        for n in args.tamanhos:
+            caminho = os.path.join(pasta, f'advisor_{n}.xlsx')
+            gerar_extrato(caminho, n)
+            tamanho_kb = os.path.getsize(caminho) / 1024
+
+            totais, conversao, num_posicoes = medir(caminho, args.repeticoes)
+            print(f"[BENCH] {n:>6} linhas | {tamanho_kb:>7.0f} KB | {num_posicoes:>6} posições | "
+                  f"total {min(totais) * 1000:8.1f} ms (mediana {statistics.median(totais) * 1000:8.1f} ms) | "
+                  f"conversão {min(conversao) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark do parser de extratos BTG (ExtractBTGService)
+
+Gera extratos sintéticos com N posições por seção (Fundos, Previdência
+Individual, Previdência Externa, Renda Fixa, Ações e FIIs) e mede o tempo de
+processar_arquivo_btg_completo, com o detalhamento por etapa do log.
+
+Uso (na raiz do projeto):
+    python benchmarks/bench_extract_btg.py
+    python benchmarks/bench_extract_btg.py --tamanhos 10 100 1000 --repeticoes 5
+    python benchmarks/bench_extract_btg.py --paralelo    # abas em processos separados
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.extract_btg_service import ExtractBTGService
+
+
+def gerar_cnpj(numero):
+    """CNPJ válido (com dígitos verificadores) a partir de um número de 8 dígitos."""
+    digitos = [int(c) for c in f"{numero:08d}"] + [0, 0, 0, 1]
+    for pesos in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        resto = sum(d * p for d, p in zip(digitos, pesos)) % 11
+        digitos.append(0 if resto < 2 else 11 - resto)
+    s = ''.join(map(str, digitos))
+    return f"{s[:2]}.{s[2:5]}.{s[5:8]}/{s[8:12]}-{s[12:]}"
+
+
+def gerar_extrato(caminho, n):
+    """Grava um extrato BTG sintético com n posições em cada seção."""
+    wb = Workbook()
+    wb.remove(wb.active)
+    data = datetime(2026, 9, 30)
+
+    ws = wb.create_sheet('Fundos')
+    ws.append([None, 'Posição > Portfólio de fundos'])
+    ws.append([None, 'Data', None, 'Quantidade de Cotas'])
+    for i in range(n):
+        ws.append([None, f'FUNDO SINTETICO {i} FIC FIM'])
+        ws.append([None, data, None, 100.0 + i])
+    ws.append([None, 'Rentabilidade'])
+    for i in range(n):
+        ws.append([None, f'Detalhamento > FUNDO SINTETICO {i} FIC FIM - {gerar_cnpj(10000000 + i)}'])
+
+    ws = wb.create_sheet('Previdência Individual')
+    ws.append([None, 'Posição > Previdência'])
+    ws.append([None, 'Fundo'])
+    for i in range(n):
+        ws.append([None, f'PREV FOF FI SINTETICO {i}', gerar_cnpj(20000000 + i), data, 50.0 + i, 0, 0])
+    ws.append([None, 'Total'])
+
+    ws = wb.create_sheet('Previdência Externa')
+    ws.append([None, 'Posição > Plano'])
+    ws.append([None, 'Fundo'])
+    for i in range(n):
+        ws.append([None, f'ICATU SUPERPREV SINTETICO {i}', data, 500.0 + i, 0, 0])
+    ws.append([None, 'Rentabilidade'])
+
+    ws = wb.create_sheet('Renda Fixa')
+    ws.append([None, 'Posição > CDB'])
+    ws.append([None, 'Emissor'])
+    for i in range(n):
+        ws.append([None, f'BANCO {i}', f'CDB{i:05d}', None, None, None, None, None, None, 10.0 + i, 1000.0])
+    ws.append([None, 'Total'])
+
+    ws = wb.create_sheet('Renda Variavel')
+    ws.append([None, 'Posição > Ações'])
+    ws.append([None, 'Código'])
+    for i in range(n):
+        ws.append([None, f'ACAO{i}', f'EMPRESA {i}', 10.0 + i, 25.5])
+    ws.append([None, 'Total'])
+    ws.append([None, 'Posição > Fundos imobiliários'])
+    ws.append([None, 'Código'])
+    for i in range(n):
+        ws.append([None, f'FII{i}11', f'FII {i}', 5.0 + i, 100.0])
+    ws.append([None, 'Total'])
+
+    wb.save(caminho)
+
+
+def medir(caminho, repeticoes, paralelo=False):
+    """Executa o parser `repeticoes` vezes; retorna (tempos totais, log da execução mais rápida)."""
+    service = ExtractBTGService()
+    totais = []
+    melhor_log = None
+
+    for _ in range(repeticoes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            posicoes, log = service.processar_arquivo_btg_completo(caminho, cliente_id=0, paralelo=paralelo)
+            total = time.perf_counter() - inicio
+
+        if log['erros']:
+            raise RuntimeError(f"Erros no processamento: {log['erros']}")
+        if melhor_log is None or total < min(totais):
+            melhor_log = log
+        totais.append(total)
+
+    return totais, melhor_log, len(posicoes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10, 100, 1000],
+                        help='posições por seção (padrão: 10 100 1000)')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--paralelo', action='store_true', help='processa as abas em processos separados')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        for n in args.tamanhos:
+            caminho = os.path.join(pasta, f'btg_{n}.xlsx')
+            gerar_extrato(caminho, n)
+            tamanho_kb = os.path.getsize(caminho) / 1024
+
+            totais, log, num_posicoes = medir(caminho, args.repeticoes, args.paralelo)
+            etapas = ', '.join(f"{k}={v * 1000:.1f}ms" for k, v in log['tempos'].items() if k != 'total')
+
+            print(f"[BENCH] {n:>5} por seção | {tamanho_kb:>7.0f} KB | {num_posicoes:>5} posições | "
+                  f"melhor {min(totais) * 1000:8.1f} ms | mediana {statistics.median(totais) * 1000:8.1f} ms")
+            print(f"        {etapas}")
+
+
+if __name__ == '__main__':
+    main()